@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+TeamRoll ASGI Application
+Serves the same pages and /api routes as server.py on FastAPI/uvicorn
+"""
+
+import argparse
+import html
+import os
+import time
+from contextlib import asynccontextmanager
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from modules.api_routes import api_router
+from modules.app_container import get_container
+from modules.assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+from modules.backup import DEFAULT_BACKUP_DIR, backups
+from modules.compression import (
+    MIN_COMPRESS_SIZE, StreamCompressor, compress, compression_stats, negotiate
+)
+from modules.database import close_pools, init_database
+from modules.json_stream import contains_stream, encode_json, iter_json, materialize, wants_pretty
+from modules.maintenance import maintenance, schedule_backups
+from modules.metrics import METRICS_PATH, request_metrics, reset_db_time, take_db_time
+from modules.pages import NO_STORE_HEADERS, is_known_page, is_public_page, resolve_page
+from modules.passwords import password_hasher
+from modules.query_log import DEFAULT_SLOW_QUERY_LOG, query_log
+from modules.router import ApiRequest
+
+container = get_container()
+
+# uvicorn imports the app afresh in every worker process, so settings reach
+# the lifespan through the environment; `python asgi.py` sets them from its flags
+MAINTENANCE_ENV = 'TEAMROLL_MAINTENANCE'
+BACKUP_DIR_ENV = 'TEAMROLL_BACKUP_DIR'
+BACKUP_INTERVAL_ENV = 'TEAMROLL_BACKUP_INTERVAL'
+
+
+@asynccontextmanager
+async def lifespan(app):
+    query_log.configure(log_path=DEFAULT_SLOW_QUERY_LOG)
+    maintenance.configure(enabled=os.environ.get(MAINTENANCE_ENV, '1') != '0')
+    backups.configure(os.environ.get(BACKUP_DIR_ENV) or None)
+    backup_interval = float(os.environ.get(BACKUP_INTERVAL_ENV) or 0)
+    if backup_interval > 0:
+        schedule_backups(backup_interval * 3600)
+    await run_in_threadpool(init_database)
+    await run_in_threadpool(container.warm_up)
+    # Every worker starts the scheduler; only one process at a time runs the jobs
+    maintenance.start()
+    yield
+    await run_in_threadpool(maintenance.stop)
+    # Pool workers outlive a parent that exits without shutting them down
+    await run_in_threadpool(password_hasher.shutdown)
+    await run_in_threadpool(close_pools)
+
+
+app = FastAPI(title='TeamRoll', docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
+
+
+@app.middleware('http')
+async def record_metrics(request: Request, call_next):
+    """Per-route request metrics, shared with the legacy server's /metrics.
+
+    Streamed bodies are still being sent when call_next returns, so their
+    latency is measured to the start of the response.
+    """
+    started = time.perf_counter()
+    request_metrics.request_started()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        request_metrics.request_finished(
+            request.method,
+            getattr(request.state, 'route', None),
+            status,
+            time.perf_counter() - started,
+            getattr(request.state, 'db_time', None)
+        )
+
+
+def error_response(status):
+    """Same HTML error page BaseHTTPRequestHandler.send_error produces"""
+    short_message, long_message = BaseHTTPRequestHandler.responses.get(status, ('???', '???'))
+    body = BaseHTTPRequestHandler.error_message_format % {
+        'code': status,
+        'message': html.escape(short_message, quote=False),
+        'explain': html.escape(long_message, quote=False)
+    }
+    return Response(
+        body.encode('UTF-8', 'replace'),
+        status_code=status,
+        media_type=BaseHTTPRequestHandler.error_content_type
+    )
+
+
+def _add_headers(response, headers):
+    # MutableHeaders.append keeps repeated headers such as Set-Cookie
+    for name, value in headers:
+        response.headers.append(name, value)
+    return response
+
+
+def _compressed_stream(chunks, compressor, stats):
+    for chunk in chunks:
+        stats['original'] += len(chunk)
+        chunk = compressor.compress(chunk) if compressor else chunk
+        stats['sent'] += len(chunk)
+        if chunk:
+            yield chunk
+    if compressor:
+        tail = compressor.flush()
+        stats['sent'] += len(tail)
+        if tail:
+            yield tail
+    compression_stats.record(stats['route'], stats['original'], stats['sent'], stats['coding'])
+
+
+def render_body(body, status, content_type, headers, request_headers, route):
+    """Send a non-JSON route payload, compressed like JSON responses"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    original_size = len(body)
+    coding = negotiate(request_headers.get('Accept-Encoding')) if original_size >= MIN_COMPRESS_SIZE else None
+    if coding:
+        body = compress(body, coding)
+
+    response = Response(body, status_code=status, media_type=content_type)
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    if original_size >= MIN_COMPRESS_SIZE:
+        response.headers['Vary'] = 'Accept-Encoding'
+    compression_stats.record(route, original_size, len(body), coding)
+    return _add_headers(response, headers)
+
+
+def _dispatch(api_request):
+    # DB time is charged per thread, so it is collected on the dispatching thread
+    reset_db_time()
+    result = api_router.dispatch(api_request)
+    return result, take_db_time()
+
+
+def render_json(data, status, headers, request_headers, query, route):
+    """Build the JSON response exactly as TeamRollHandler.send_json_response would.
+
+    Runs on a worker thread: encoding, compression and row fetching all
+    happen off the event loop.
+    """
+    pretty = wants_pretty(query)
+    accept_encoding = request_headers.get('Accept-Encoding')
+
+    if contains_stream(data) and not pretty:
+        coding = negotiate(accept_encoding)
+        compressor = StreamCompressor(coding) if coding else None
+        stats = {'route': route, 'coding': coding, 'original': 0, 'sent': 0}
+        # Starlette iterates a sync generator on its thread pool
+        response = StreamingResponse(
+            _compressed_stream(iter_json(data), compressor, stats),
+            status_code=status,
+            media_type='application/json'
+        )
+        if coding:
+            response.headers['Content-Encoding'] = coding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return _add_headers(response, headers)
+
+    body = encode_json(materialize(data), pretty)
+    original_size = len(body)
+    coding = negotiate(accept_encoding) if original_size >= MIN_COMPRESS_SIZE else None
+    if coding:
+        body = compress(body, coding)
+
+    response = Response(body, status_code=status, media_type='application/json')
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    if original_size >= MIN_COMPRESS_SIZE:
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    compression_stats.record(route, original_size, len(body), coding)
+    return _add_headers(response, headers)
+
+
+def render_asset(asset, headers, request_headers):
+    """Serve a cached asset with the same validators and encodings as the legacy server"""
+    coding = None
+    if asset.encodings:
+        coding = negotiate(request_headers.get('Accept-Encoding'), asset.encodings)
+        headers = headers + [('Vary', 'Accept-Encoding')]
+
+    if container.assets.is_not_modified(asset, request_headers):
+        response = Response(status_code=304)
+        response.headers['ETag'] = asset.etag_for(coding)
+        response.headers['Last-Modified'] = asset.last_modified
+        return _add_headers(response, headers)
+
+    if asset.content is None:
+        response = FileResponse(asset.path, media_type=asset.content_type)
+    else:
+        body = asset.encodings[coding] if coding else asset.content
+        response = Response(body, media_type=asset.content_type)
+        compression_stats.record('/' + asset.name, asset.size, len(body), coding)
+        if coding:
+            response.headers['Content-Encoding'] = coding
+
+    response.headers['ETag'] = asset.etag_for(coding)
+    response.headers['Last-Modified'] = asset.last_modified
+    return _add_headers(response, headers)
+
+
+@app.get(METRICS_PATH)
+@app.api_route('/api/{path:path}', methods=['GET', 'POST', 'PUT', 'DELETE'])
+async def handle_api(request: Request, path: str = ''):
+    body = await request.body()
+    query = parse_qs(request.url.query)
+    api_request = ApiRequest(
+        container,
+        request.method,
+        request.url.path,
+        query=query,
+        headers=request.headers,
+        body=body,
+        client_address=(request.client.host, request.client.port) if request.client else None
+    )
+
+    result, request.state.db_time = await run_in_threadpool(_dispatch, api_request)
+    if result is None:
+        return error_response(404)
+    request.state.route = api_request.route.template
+
+    if result.data is None:
+        return _add_headers(Response(status_code=result.status), result.headers)
+
+    if result.content_type is not None:
+        return await run_in_threadpool(
+            render_body,
+            result.data,
+            result.status,
+            result.content_type,
+            result.headers,
+            request.headers,
+            api_request.route.template
+        )
+
+    return await run_in_threadpool(
+        render_json,
+        result.data,
+        result.status,
+        result.headers,
+        request.headers,
+        query,
+        api_request.route.template
+    )
+
+
+@app.get('/static/{path:path}')
+async def serve_static_file(request: Request, path: str):
+    request.state.route = '/static/{path}'
+    asset, is_hashed_url = await run_in_threadpool(container.assets.get_static, request.url.path)
+    if asset is None:
+        return error_response(404)
+
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_hashed_url else REVALIDATE_CACHE_CONTROL
+    return render_asset(asset, [('Cache-Control', cache_control)], request.headers)
+
+
+def _load_page(path, headers):
+    user = None
+    if not is_public_page(path):
+        # Same cookie parsing and session lookup as the /api routes
+        user = ApiRequest(container, 'GET', path, headers=headers).user
+    status, template_path = resolve_page(path, user)
+    asset = container.assets.get(template_path) if status == 200 else None
+    return status, asset
+
+
+@app.get('/{path:path}')
+async def serve_template(request: Request, path: str):
+    page = request.url.path
+    if is_known_page(page):
+        request.state.route = page
+    status, asset = await run_in_threadpool(_load_page, page, request.headers)
+
+    if status == 302:
+        response = Response(status_code=302)
+        response.headers['Location'] = '/login'
+        return _add_headers(response, NO_STORE_HEADERS)
+    if status != 200 or asset is None:
+        return error_response(status if status != 200 else 404)
+
+    if is_public_page(page):
+        headers = [('Cache-Control', REVALIDATE_CACHE_CONTROL)]
+    else:
+        headers = list(NO_STORE_HEADERS)
+    return render_asset(asset, headers, request.headers)
+
+
+@app.api_route('/{path:path}', methods=['POST', 'PUT', 'DELETE'])
+async def not_found(request: Request, path: str):
+    return error_response(404)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='TeamRoll ASGI server')
+    parser.add_argument('--host', default='0.0.0.0', help='interface to bind (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on (default: 8000)')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes (default: 1)')
+    parser.add_argument('--backup-dir', default=DEFAULT_BACKUP_DIR,
+                        help='where database snapshots are written (default: %(default)s)')
+    parser.add_argument('--backup-interval', type=float, default=0,
+                        help='hours between scheduled snapshots (0, the default, takes none)')
+    parser.add_argument('--no-maintenance', action='store_true',
+                        help='do not run the background session cleanup, WAL checkpoint, ANALYZE and vacuum jobs')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    args = parse_args()
+    # Inherited by the worker processes uvicorn starts
+    os.environ[MAINTENANCE_ENV] = '0' if args.no_maintenance else '1'
+    os.environ[BACKUP_DIR_ENV] = args.backup_dir
+    os.environ[BACKUP_INTERVAL_ENV] = str(args.backup_interval)
+    uvicorn.run('asgi:app', host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,129 @@
+"""
+Payroll Report Benchmark
+Year and month report queries on a multi-year payroll table, filtering by date expressions against date ranges
+"""
+
+import argparse
+import time
+from datetime import date
+
+from bench.support import quietly, temp_database
+from modules import database
+from modules.accounting_service import year_window
+from modules.app_container import get_container
+from modules.payroll_service import month_window
+
+INSERT_HISTORY_QUERY = '''
+    INSERT INTO payroll
+    (employee_id, pay_period_start, pay_period_end, base_salary_cents, bonuses_cents, deductions_cents,
+     gross_pay_cents, tax_deductions_cents, net_pay_cents, created_at)
+    VALUES (?, ?, ?, ?, 0, 0, ?, ?, ?, ?)
+'''
+
+# (name, query as it was written before, query as the services write it now,
+#  and each one's parameters from (year, month, employee_id))
+REPORTS = [
+    (
+        'tax summary by month',
+        '''SELECT substr(pay_period_start, 6, 2) AS month, SUM(tax_deductions_cents), SUM(gross_pay_cents)
+           FROM payroll WHERE strftime('%Y', pay_period_start) = ? GROUP BY month ORDER BY month''',
+        '''SELECT substr(pay_period_start, 6, 2) AS month, SUM(tax_deductions_cents), SUM(gross_pay_cents)
+           FROM payroll WHERE pay_period_start >= ? AND pay_period_start < ? GROUP BY month ORDER BY month''',
+        lambda year, month, employee_id: (str(year),),
+        lambda year, month, employee_id: year_window(year),
+    ),
+    (
+        'annual totals',
+        '''SELECT SUM(tax_deductions_cents), SUM(gross_pay_cents), COUNT(DISTINCT employee_id)
+           FROM payroll WHERE strftime('%Y', pay_period_start) = ?''',
+        '''SELECT SUM(tax_deductions_cents), SUM(gross_pay_cents), COUNT(DISTINCT employee_id)
+           FROM payroll WHERE pay_period_start >= ? AND pay_period_start < ?''',
+        lambda year, month, employee_id: (str(year),),
+        lambda year, month, employee_id: year_window(year),
+    ),
+    (
+        'employee year to date',
+        '''SELECT SUM(gross_pay_cents), SUM(net_pay_cents), COUNT(*)
+           FROM payroll WHERE employee_id = ? AND strftime('%Y', pay_period_start) = ?''',
+        '''SELECT SUM(gross_pay_cents), SUM(net_pay_cents), COUNT(*)
+           FROM payroll WHERE employee_id = ? AND pay_period_start >= ? AND pay_period_start < ?''',
+        lambda year, month, employee_id: (employee_id, str(year)),
+        lambda year, month, employee_id: (employee_id,) + year_window(year),
+    ),
+    (
+        'processed in a month',
+        '''SELECT * FROM payroll
+           WHERE DATE(created_at) >= ? AND DATE(created_at) < ? ORDER BY created_at DESC''',
+        '''SELECT * FROM payroll
+           WHERE created_at >= ? AND created_at < ? ORDER BY created_at DESC''',
+        lambda year, month, employee_id: month_window(year, month),
+        lambda year, month, employee_id: month_window(year, month),
+    ),
+]
+
+
+def history(employee_ids, first_year, years):
+    """One monthly payslip per employee for every month of `years` years"""
+    for year in range(first_year, first_year + years):
+        for month in range(1, 13):
+            start, end = month_window(year, month)
+            processed = f'{end} 09:00:00'
+            for index, employee_id in enumerate(employee_ids):
+                gross = 400000 + index * 100
+                taxes = gross * 2765 // 10000
+                yield employee_id, start, end, gross, gross, taxes, gross - taxes, processed
+
+
+def timed(query, params, repeat):
+    """(best milliseconds of `repeat` runs, rows returned)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = database.report_query(query, params)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+def plan(query, params):
+    rows = database.execute_query(f'EXPLAIN QUERY PLAN {query}', params)
+    return '; '.join(row['detail'] for row in rows)
+
+
+def main(argv=None):
+    """python -m bench.payroll [--years N] [--employees N] [--repeat N]"""
+    parser = argparse.ArgumentParser(description='TeamRoll payroll report benchmark')
+    parser.add_argument('--years', type=int, default=5, help='years of monthly payroll (default: %(default)s)')
+    parser.add_argument('--employees', type=int, default=1000, help='employees paid each month (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query; the best is reported (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    with temp_database():
+        app = get_container()
+        employee_ids = quietly(app.hr_service.bulk_add_employees, [
+            {
+                'first_name': f'Bench{index}', 'last_name': 'Test', 'email': f'bench{index}@example.com',
+                'position': 'Engineer', 'hire_date': '2020-01-15', 'base_salary': 48000
+            }
+            for index in range(args.employees)
+        ])['employee_ids']
+        first_year = date.today().year - args.years + 1
+        started = time.perf_counter()
+        written = database.bulk_write(INSERT_HISTORY_QUERY, history(employee_ids, first_year, args.years))['written']
+        database.execute_query('ANALYZE')
+        print(f'{written} payroll rows over {args.years} years in {time.perf_counter() - started:.2f} s\n')
+
+        # A year and a month in the middle of the history
+        year = first_year + args.years // 2
+        sample = (year, 6, employee_ids[len(employee_ids) // 2])
+        for name, before, after, before_params, after_params in REPORTS:
+            before_ms, before_rows = timed(before, before_params(*sample), args.repeat)
+            after_ms, after_rows = timed(after, after_params(*sample), args.repeat)
+            assert before_rows == after_rows, name
+            print(f'{name}: {before_rows} rows')
+            print(f'  expression {before_ms:8.2f} ms  {plan(before, before_params(*sample))}')
+            print(f'  range      {after_ms:8.2f} ms  {plan(after, after_params(*sample))}')
+
+
+if __name__ == '__main__':
+    main()
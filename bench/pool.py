@@ -0,0 +1,66 @@
+"""
+Connection Pool Benchmark
+Queries per second over pooled and thread-bound connections against opening a connection per query
+"""
+
+import argparse
+import sqlite3
+
+from bench.support import per_second, temp_database
+from modules import database
+
+# The login and session lookups run on nearly every request
+QUERIES = [
+    ('SELECT * FROM users WHERE username = ?', ('admin',)),
+    ('SELECT * FROM sessions WHERE session_id = ?', ('missing',)),
+]
+
+
+def connect_per_query(query, params):
+    """What execute_query did before the pool: connect, configure, run, close"""
+    conn = sqlite3.connect(database.DATABASE_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA busy_timeout = 5000')
+    try:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def lookups(execute):
+    """One call runs each of QUERIES once through `execute(query, params)`"""
+    def run():
+        for query, params in QUERIES:
+            execute(query, params)
+    return run
+
+
+def main(argv=None):
+    """python -m bench.pool [--calls N] [--threads N]"""
+    parser = argparse.ArgumentParser(description='TeamRoll SQLite connection pool benchmark')
+    parser.add_argument('--calls', type=int, default=20000,
+                        help='lookup pairs per measurement (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads for the concurrent measurements (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    with temp_database():
+        paths = [
+            ('connect per query', lookups(connect_per_query), {}),
+            ('pooled', lookups(database.execute_query), {}),
+            ('thread-bound', lookups(database.execute_query),
+             {'setup': database.open_thread_connection, 'teardown': database.close_thread_connection}),
+        ]
+        print(f'{"path":<20}  {"1 thread q/s":>12}  {f"{args.threads} threads q/s":>14}')
+        for name, run, hooks in paths:
+            single = per_second(run, args.calls, **hooks) * len(QUERIES)
+            concurrent = per_second(run, args.calls, args.threads, **hooks) * len(QUERIES)
+            print(f'{name:<20}  {single:>12.0f}  {concurrent:>14.0f}')
+
+        stats = database.pool_stats()
+        print(f"\npool: {stats['created']} connections created for {stats['checkouts']} checkouts, "
+              f"{stats['waits']} waits, {stats['thread_connections_created']} thread-bound connections")
+
+
+if __name__ == '__main__':
+    main()
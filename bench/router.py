@@ -0,0 +1,87 @@
+"""
+Router Benchmark
+Cost of matching /api requests with the route table against a first-match scan of every route
+"""
+
+import argparse
+import time
+
+from modules.api_routes import api_router
+from modules.router import AUTH_NONE, Router
+
+# Static, parameterized, late-registered and unmatched paths
+SAMPLE_REQUESTS = [
+    ('GET', '/api/auth/me'),
+    ('GET', '/api/employees'),
+    ('GET', '/api/employees/EMP0042'),
+    ('PUT', '/api/employees/EMP0042'),
+    ('POST', '/api/payroll/approve/17'),
+    ('GET', '/api/attendance/status/EMP0042'),
+    ('GET', '/api/admin/pending-registrations'),
+    ('GET', '/api/does-not-exist'),
+]
+
+
+def scan_match(routes, method, path):
+    """What the old if/elif chain did: try every route in order until one fits"""
+    segments = path.strip('/').split('/')
+    for route in routes:
+        if route.method != method:
+            continue
+        template = route.template.strip('/').split('/')
+        if len(template) != len(segments):
+            continue
+        params = {}
+        for expected, actual in zip(template, segments):
+            if expected.startswith('{'):
+                params[expected[1:-1]] = actual
+            elif expected != actual:
+                break
+        else:
+            return route, params
+    return None
+
+
+def per_call(function, requests, rounds):
+    """Microseconds per call of function(method, path), over `rounds` passes of `requests`"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for method, path in requests:
+            function(method, path)
+    return (time.perf_counter() - started) / (rounds * len(requests)) * 1e6
+
+
+def padded_router(extra_routes):
+    """The real route table with `extra_routes` more endpoints registered in front of it"""
+    router = Router()
+    for index in range(extra_routes):
+        router.add('GET', f'/api/extra{index}/items', lambda request: None, AUTH_NONE)
+        router.add('GET', f'/api/extra{index}/items/{{item_id}}', lambda request: None, AUTH_NONE)
+    for route in api_router.routes:
+        router.add(route.method, route.template, route.handler, route.auth)
+    return router
+
+
+def main(argv=None):
+    """python -m bench.router [--rounds N]"""
+    parser = argparse.ArgumentParser(description='TeamRoll /api route matching benchmark')
+    parser.add_argument('--rounds', type=int, default=20000,
+                        help='passes over the sample requests per measurement (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    for method, path in SAMPLE_REQUESTS:
+        # Both must agree before their speed is worth comparing
+        table, scan = api_router.match(method, path), scan_match(api_router.routes, method, path)
+        assert (table and (table[0], table[1])) == (scan and (scan[0], scan[1])), (method, path)
+
+    print(f'{"routes":>8}  {"table us/match":>15}  {"scan us/match":>14}')
+    for extra in (0, 50, 200):
+        router = padded_router(extra)
+        table = per_call(router.match, SAMPLE_REQUESTS, args.rounds)
+        scan = per_call(lambda method, path: scan_match(router.routes, method, path),
+                        SAMPLE_REQUESTS, max(1, args.rounds // (1 + extra // 25)))
+        print(f'{len(router.routes):>8}  {table:>15.2f}  {scan:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark Support
+Temporary database and timing helpers shared by the benchmark scripts
+"""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import database
+from modules.maintenance import maintenance
+from modules.passwords import password_hasher
+
+
+def quietly(function, *args, **kwargs):
+    """Call `function` without its progress prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def temp_database():
+    """A fresh, migrated teamroll.db in a temporary directory, used by the services inside the block"""
+    directory = tempfile.mkdtemp(prefix='teamroll-bench-')
+    saved_path = database.DATABASE_PATH
+    database.DATABASE_PATH = os.path.join(directory, 'teamroll.db')
+    # Background jobs and hashing processes would skew the numbers
+    maintenance.configure(enabled=False)
+    password_hasher.configure(workers=0)
+    try:
+        quietly(database.init_database)
+        yield database.DATABASE_PATH
+    finally:
+        database.close_thread_connection()
+        database.close_pools()
+        database.DATABASE_PATH = saved_path
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def per_second(function, calls, threads=1, setup=None, teardown=None):
+    """Calls of `function()` per second, `calls` in total spread over `threads` threads.
+
+    `setup` and `teardown` run once on each thread around its share of the calls.
+    """
+    share = calls // threads
+
+    def run(_):
+        if setup is not None:
+            setup()
+        try:
+            for _ in range(share):
+                function()
+        finally:
+            if teardown is not None:
+                teardown()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(run, range(threads)))
+    return share * threads / (time.perf_counter() - started)
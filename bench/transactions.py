@@ -0,0 +1,92 @@
+"""
+Transaction Benchmark
+Commits and time for deleting employees statement by statement against one transaction per deletion
+"""
+
+import argparse
+import time
+
+from bench.support import quietly, temp_database
+from modules import database
+from modules.app_container import get_container
+
+# The statements HRService.delete_employee runs, in order
+DELETE_STATEMENTS = [
+    'DELETE FROM payroll WHERE employee_id = ?',
+    'DELETE FROM attendance WHERE employee_id = ?',
+    'SELECT id FROM users WHERE employee_id = ?',
+    'DELETE FROM users WHERE employee_id = ?',
+    'DELETE FROM pending_registrations WHERE employee_id = ?',
+    'DELETE FROM employees WHERE employee_id = ?',
+]
+
+
+def delete_statement_by_statement(employee_id):
+    """What delete_employee did before: every statement commits on its own"""
+    for query in DELETE_STATEMENTS:
+        database.execute_query(query, (employee_id,))
+
+
+def delete_in_transaction(employee_id):
+    """The same statements grouped as delete_employee now runs them"""
+    with database.transaction():
+        delete_statement_by_statement(employee_id)
+
+
+def add_employees(app, count):
+    """Employees with a payslip and a check-in each, so every DELETE has a row to remove"""
+    employee_ids = quietly(app.hr_service.bulk_add_employees, [
+        {
+            'first_name': f'Bench{index}', 'last_name': 'Test', 'email': f'bench{index}@example.com',
+            'position': 'Engineer', 'hire_date': '2024-01-15', 'base_salary': 50000
+        }
+        for index in range(count)
+    ])['employee_ids']
+    quietly(app.payroll_service.bulk_process_payroll, [
+        {'employee_id': employee_id, 'pay_period_start': '2024-02-01',
+         'pay_period_end': '2024-02-29', 'base_salary': 4000}
+        for employee_id in employee_ids
+    ])
+    for employee_id in employee_ids:
+        quietly(app.attendance_service.check_in, employee_id)
+    return employee_ids
+
+
+def measure(delete, employee_ids):
+    """(commits per deletion, milliseconds per deletion)"""
+    commits = database.pool_stats()['commits']
+    started = time.perf_counter()
+    for employee_id in employee_ids:
+        delete(employee_id)
+    elapsed = time.perf_counter() - started
+    return (database.pool_stats()['commits'] - commits) / len(employee_ids), elapsed / len(employee_ids) * 1000
+
+
+def main(argv=None):
+    """python -m bench.transactions [--employees N]"""
+    parser = argparse.ArgumentParser(description='TeamRoll transaction grouping benchmark')
+    parser.add_argument('--employees', type=int, default=500,
+                        help='employees deleted each way (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    with temp_database():
+        app = get_container()
+        employee_ids = add_employees(app, args.employees * 2)
+        separate, grouped = employee_ids[:args.employees], employee_ids[args.employees:]
+        # Both paths run the statements directly: the service also bumps the
+        # shared session cache counter, which is not part of the comparison
+
+        print(f'{"deleting an employee":<24}  {"commits":>7}  {"ms each":>8}')
+        for name, delete, ids in (
+            ('statement by statement', delete_statement_by_statement, separate),
+            ('one transaction', delete_in_transaction, grouped),
+        ):
+            commits, milliseconds = measure(delete, ids)
+            print(f'{name:<24}  {commits:>7.1f}  {milliseconds:>8.3f}')
+
+        remaining = database.execute_query('SELECT COUNT(*) AS count FROM employees')[0]['count']
+        print(f'\nemployees left: {remaining}')
+
+
+if __name__ == '__main__':
+    main()
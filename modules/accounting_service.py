@@ -3,11 +3,23 @@ Accounting Service Module
 Handles financial calculations, tax compliance, and reporting
 """
 
-from modules.database import execute_query
+from modules.database import report_query
+from modules.money import cents_to_amounts
 from datetime import datetime, timedelta
 import calendar
 
+def year_window(year):
+    """[January 1st, next January 1st) as YYYY-MM-DD strings.
+
+    Payroll dates are stored as YYYY-MM-DD text, so a range on the raw
+    column can use its index where strftime('%Y', ...) = ? cannot.
+    """
+    return f'{year:04d}-01-01', f'{year + 1:04d}-01-01'
+
+
 class AccountingService:
+    """Financial reports; every query here runs on the read-only reporting pool"""
+
     def __init__(self):
         pass
 
@@ -21,18 +33,18 @@ class AccountingService:
             query = '''
                 SELECT 
                     COUNT(*) as total_employees,
-                    SUM(gross_pay) as total_gross_pay,
-                    SUM(tax_deductions) as total_tax_deductions,
-                    SUM(deductions) as total_other_deductions,
-                    SUM(net_pay) as total_net_pay
+                    SUM(gross_pay_cents) as total_gross_pay_cents,
+                    SUM(tax_deductions_cents) as total_tax_deductions_cents,
+                    SUM(deductions_cents) as total_other_deductions_cents,
+                    SUM(net_pay_cents) as total_net_pay_cents
                 FROM payroll 
                 WHERE pay_period_start >= ? AND pay_period_end <= ?
             '''
             
-            results = execute_query(query, (first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d')))
+            results = report_query(query, (first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d')))
             
             if results:
-                report = results[0]
+                report = cents_to_amounts(results[0])
                 return {
                     'success': True,
                     'report': {
@@ -68,35 +80,35 @@ class AccountingService:
         try:
             query = '''
                 SELECT 
-                    SUM(tax_deductions) as total_taxes,
+                    SUM(tax_deductions_cents) as total_taxes_cents,
                     COUNT(DISTINCT employee_id) as total_employees,
-                    strftime('%m', pay_period_start) as month,
-                    SUM(gross_pay) as monthly_gross
+                    substr(pay_period_start, 6, 2) as month,
+                    SUM(gross_pay_cents) as monthly_gross_cents
                 FROM payroll 
-                WHERE strftime('%Y', pay_period_start) = ?
-                GROUP BY strftime('%m', pay_period_start)
+                WHERE pay_period_start >= ? AND pay_period_start < ?
+                GROUP BY month
                 ORDER BY month
             '''
             
-            monthly_data = execute_query(query, (str(year),))
+            monthly_data = [cents_to_amounts(row) for row in report_query(query, year_window(year))]
             
             # Calculate annual totals
             annual_query = '''
                 SELECT 
-                    SUM(tax_deductions) as annual_taxes,
-                    SUM(gross_pay) as annual_gross,
+                    SUM(tax_deductions_cents) as annual_taxes_cents,
+                    SUM(gross_pay_cents) as annual_gross_cents,
                     COUNT(DISTINCT employee_id) as unique_employees
                 FROM payroll 
-                WHERE strftime('%Y', pay_period_start) = ?
+                WHERE pay_period_start >= ? AND pay_period_start < ?
             '''
             
-            annual_data = execute_query(annual_query, (str(year),))
+            annual_data = report_query(annual_query, year_window(year))
             
             return {
                 'success': True,
                 'tax_summary': {
                     'year': year,
-                    'annual_totals': annual_data[0] if annual_data else {},
+                    'annual_totals': cents_to_amounts(annual_data[0]) if annual_data else {},
                     'monthly_breakdown': monthly_data
                 }
             }
@@ -112,21 +124,21 @@ class AccountingService:
         try:
             query = '''
                 SELECT 
-                    SUM(gross_pay) as ytd_gross,
-                    SUM(tax_deductions) as ytd_taxes,
-                    SUM(deductions) as ytd_deductions,
-                    SUM(net_pay) as ytd_net,
+                    SUM(gross_pay_cents) as ytd_gross_cents,
+                    SUM(tax_deductions_cents) as ytd_taxes_cents,
+                    SUM(deductions_cents) as ytd_deductions_cents,
+                    SUM(net_pay_cents) as ytd_net_cents,
                     COUNT(*) as pay_periods
                 FROM payroll 
-                WHERE employee_id = ? AND strftime('%Y', pay_period_start) = ?
+                WHERE employee_id = ? AND pay_period_start >= ? AND pay_period_start < ?
             '''
             
-            results = execute_query(query, (employee_id, str(year)))
+            results = report_query(query, (employee_id,) + year_window(year))
             
             if results:
                 return {
                     'success': True,
-                    'ytd_summary': results[0]
+                    'ytd_summary': cents_to_amounts(results[0])
                 }
             else:
                 return {
@@ -0,0 +1,402 @@
+"""
+API Routes Module
+Route table for the /api endpoints, independent of the serving front end
+"""
+
+import math
+
+from modules.attendance_service import DAILY_ATTENDANCE_LIST, EMPLOYEE_ATTENDANCE_LIST
+from modules.backup import BackupError, backups
+from modules.compression import compression_stats
+from modules.database import pool_stats
+from modules.hr_service import EMPLOYEE_LIST
+from modules.maintenance import maintenance
+from modules.metrics import METRICS_PATH, PROMETHEUS_CONTENT_TYPE, request_metrics
+from modules.pagination import PageError
+from modules.passwords import password_hasher
+from modules.payroll_service import PAYROLL_LIST
+from modules.prefork import read_worker_health
+from modules.query_log import query_log
+from modules.rate_limit import rate_limiter
+from modules.router import Router, ApiResponse, AUTH_NONE, AUTH_USER, AUTH_ADMIN
+from modules.session_cache import session_cache
+from modules.session_tokens import session_tokens
+
+api_router = Router()
+
+# Seconds a client is asked to wait when every password hashing slot is taken
+HASH_RETRY_AFTER = 1
+
+
+# List endpoints pass stream=True; the server streams the rows when the
+# client can take a chunked response and materializes them otherwise.
+# They also take ?fields=a,b to select columns and ?limit=N / ?cursor=...
+# to page through the rows; a paginated response has a 'next' cursor,
+# null on the last page.
+
+def _list_page(request, list_query):
+    """Page parameters of a list request; raises PageError for bad ones"""
+    return list_query.parse_page(
+        request.query_param('limit'),
+        request.query_param('cursor'),
+        request.query_param('fields')
+    )
+
+
+def _bad_page(error):
+    return ApiResponse({'success': False, 'message': str(error)}, 400)
+
+
+# Employees
+
+@api_router.route('GET', '/api/employees')
+def list_employees(request):
+    try:
+        page = _list_page(request, EMPLOYEE_LIST)
+    except PageError as e:
+        return _bad_page(e)
+    return request.app.hr_service.get_all_employees(stream=True, page=page)
+
+
+@api_router.route('GET', '/api/employees/{employee_id}')
+def get_employee(request):
+    return request.app.hr_service.get_employee(request.params['employee_id'])
+
+
+@api_router.route('POST', '/api/employees', auth=AUTH_ADMIN)
+def add_employee(request):
+    return request.app.hr_service.add_employee(request.data)
+
+
+@api_router.route('PUT', '/api/employees/{employee_id}', auth=AUTH_ADMIN)
+def update_employee(request):
+    return request.app.hr_service.update_employee(request.params['employee_id'], request.data)
+
+
+@api_router.route('DELETE', '/api/employees/{employee_id}', auth=AUTH_ADMIN)
+def delete_employee(request):
+    return request.app.hr_service.delete_employee(request.params['employee_id'])
+
+
+# Payroll
+
+@api_router.route('GET', '/api/payroll', auth=AUTH_USER)
+def get_payroll(request):
+    user = request.user
+    try:
+        page = _list_page(request, PAYROLL_LIST)
+    except PageError as e:
+        return _bad_page(e)
+
+    # Admins can see the org-wide payroll summary; employees can only see their own records.
+    if user['role'] == 'admin':
+        return request.app.payroll_service.get_payroll_summary(stream=True, page=page)
+
+    if not user.get('employee_id'):
+        return ApiResponse({'success': False, 'message': 'Employee profile not linked'}, 400)
+    return request.app.payroll_service.get_payroll_for_employee(user['employee_id'], stream=True, page=page)
+
+
+@api_router.route('POST', '/api/payroll/process', auth=AUTH_ADMIN)
+def process_payroll(request):
+    return request.app.payroll_service.process_payroll(request.data)
+
+
+@api_router.route('POST', '/api/payroll/approve/{payroll_id}', auth=AUTH_ADMIN)
+def approve_payroll(request):
+    return request.app.payroll_service.approve_payroll(
+        request.params['payroll_id'],
+        approved_by_user_id=request.user.get('id')
+    )
+
+
+# Attendance
+
+@api_router.route('GET', '/api/attendance')
+def get_attendance(request):
+    try:
+        page = _list_page(request, DAILY_ATTENDANCE_LIST)
+    except PageError as e:
+        return _bad_page(e)
+    return request.app.attendance_service.get_all_attendance(request.query_param('date'), stream=True, page=page)
+
+
+@api_router.route('GET', '/api/attendance/employee/{employee_id}')
+def get_employee_attendance(request):
+    try:
+        page = _list_page(request, EMPLOYEE_ATTENDANCE_LIST)
+    except PageError as e:
+        return _bad_page(e)
+    return request.app.attendance_service.get_attendance_by_employee(
+        request.params['employee_id'],
+        request.query_param('start_date'),
+        request.query_param('end_date'),
+        stream=True,
+        page=page
+    )
+
+
+@api_router.route('GET', '/api/attendance/status/{employee_id}')
+def get_attendance_status(request):
+    return request.app.attendance_service.get_today_status(request.params['employee_id'])
+
+
+@api_router.route('POST', '/api/attendance/checkin')
+def check_in(request):
+    return request.app.attendance_service.check_in(request.data['employee_id'])
+
+
+@api_router.route('POST', '/api/attendance/checkout')
+def check_out(request):
+    return request.app.attendance_service.check_out(request.data['employee_id'])
+
+
+@api_router.route('POST', '/api/attendance/leave')
+def mark_leave(request):
+    return request.app.attendance_service.mark_leave(request.data)
+
+
+# Authentication
+
+def _hashing_busy(result):
+    return ApiResponse(result, 503, headers=[('Retry-After', str(HASH_RETRY_AFTER))])
+
+
+def _throttle(request, route, username):
+    """429 response when the client address or username is over the route's limit, else None"""
+    if not isinstance(username, str):
+        username = None
+    wait = rate_limiter.check(
+        route,
+        ip=request.client_address[0] if request.client_address else None,
+        username=username.strip().lower() if username else None
+    )
+    if not wait:
+        return None
+    return ApiResponse(
+        {'success': False, 'message': 'Too many attempts. Please try again later.'},
+        429,
+        headers=[('Retry-After', str(math.ceil(wait)))]
+    )
+
+
+@api_router.route('POST', '/api/auth/register')
+def register(request):
+    throttled = _throttle(request, 'register', request.data.get('username'))
+    if throttled:
+        return throttled
+    result = request.app.auth_service.register_user(request.data)
+    if result.get('busy'):
+        return _hashing_busy(result)
+    return result
+
+
+@api_router.route('POST', '/api/auth/login')
+def login(request):
+    data = request.data
+    throttled = _throttle(request, 'login', data.get('username'))
+    if throttled:
+        return throttled
+    result = request.app.auth_service.login(data.get('username'), data.get('password'))
+    if result.get('busy'):
+        return _hashing_busy(result)
+    if not result['success']:
+        return ApiResponse(result, 401)
+    return ApiResponse(result, headers=[
+        ('Set-Cookie', f"session_id={result['session_id']}; Path=/; HttpOnly; Max-Age=86400")
+    ])
+
+
+@api_router.route('GET', '/api/auth/logout')
+def logout_redirect(request):
+    request.app.auth_service.logout(request.session_id)
+    return ApiResponse(status=302, headers=[
+        ('Set-Cookie', 'session_id=; Path=/; HttpOnly; Max-Age=0'),
+        ('Location', '/login?logout=true')
+    ])
+
+
+@api_router.route('POST', '/api/auth/logout')
+def logout(request):
+    result = request.app.auth_service.logout(request.session_id)
+    if not result['success']:
+        return ApiResponse(result, 400)
+    return ApiResponse(result, headers=[('Set-Cookie', 'session_id=; Path=/; HttpOnly; Max-Age=0')])
+
+
+@api_router.route('GET', '/api/auth/me', auth=AUTH_NONE)
+def current_user(request):
+    user = request.user
+    profile = request.app.auth_service.user_profile(user) if user else None
+    if not profile:
+        return ApiResponse({'success': False, 'message': 'Not authenticated'}, 401)
+    return {'success': True, 'user': profile}
+
+
+# Registration approval
+
+@api_router.route('GET', '/api/admin/pending-registrations', auth=AUTH_ADMIN)
+def pending_registrations(request):
+    pending = request.app.auth_service.get_pending_registrations()
+    return {'success': True, 'registrations': pending}
+
+
+@api_router.route('POST', '/api/admin/approve-registration', auth=AUTH_ADMIN)
+def approve_registration(request):
+    data = request.data
+    return request.app.auth_service.approve_registration(
+        data['registration_id'],
+        request.user['id'],
+        data.get('notes', '')
+    )
+
+
+@api_router.route('POST', '/api/admin/reject-registration', auth=AUTH_ADMIN)
+def reject_registration(request):
+    data = request.data
+    return request.app.auth_service.reject_registration(
+        data['registration_id'],
+        request.user['id'],
+        data.get('notes', '')
+    )
+
+
+# Bulk imports: the body is a JSON list of rows, or {"rows": [...]}
+
+def _bulk_import(request, import_rows):
+    data = request.data
+    rows = data.get('rows') if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        return ApiResponse({'success': False, 'message': 'Expected a JSON list of rows or {"rows": [...]}'}, 400)
+    return import_rows(rows)
+
+
+@api_router.route('POST', '/api/admin/bulk/employees', auth=AUTH_ADMIN)
+def bulk_add_employees(request):
+    return _bulk_import(request, request.app.hr_service.bulk_add_employees)
+
+
+@api_router.route('POST', '/api/admin/bulk/attendance', auth=AUTH_ADMIN)
+def bulk_record_attendance(request):
+    return _bulk_import(request, request.app.attendance_service.bulk_record_attendance)
+
+
+@api_router.route('POST', '/api/admin/bulk/payroll', auth=AUTH_ADMIN)
+def bulk_process_payroll(request):
+    return _bulk_import(request, request.app.payroll_service.bulk_process_payroll)
+
+
+# Diagnostics
+
+@api_router.route('GET', '/api/admin/compression-stats', auth=AUTH_ADMIN)
+def get_compression_stats(request):
+    return {'success': True, 'routes': compression_stats.snapshot()}
+
+
+@api_router.route('GET', '/api/admin/workers', auth=AUTH_ADMIN)
+def get_worker_health(request):
+    health = read_worker_health()
+    if health is None:
+        return {'success': True, 'mode': 'single-process', 'workers': []}
+    return dict(health, success=True, mode='prefork')
+
+
+@api_router.route('GET', '/api/admin/backups', auth=AUTH_ADMIN)
+def list_backups(request):
+    return {'success': True, 'status': backups.status(), 'snapshots': backups.list_snapshots()}
+
+
+@api_router.route('POST', '/api/admin/backups', auth=AUTH_ADMIN)
+def create_backup(request):
+    # Runs in the background; progress shows up in GET /api/admin/backups and /metrics
+    if not backups.start_snapshot():
+        return ApiResponse({'success': False, 'message': 'A backup is already running'}, 409)
+    return ApiResponse({'success': True, 'message': 'Backup started'}, 202)
+
+
+@api_router.route('POST', '/api/admin/backups/restore', auth=AUTH_ADMIN)
+def restore_backup(request):
+    data = request.data
+    name = data.get('name') if isinstance(data, dict) else None
+    if not name:
+        return ApiResponse({'success': False, 'message': 'Snapshot name is required'}, 400)
+    try:
+        result = backups.restore_snapshot(name)
+    except BackupError as e:
+        return ApiResponse({'success': False, 'message': str(e)}, 400)
+    return {'success': True, 'message': f'Restored {name}', **result}
+
+
+@api_router.route('GET', '/api/admin/session-keys', auth=AUTH_ADMIN)
+def get_session_keys(request):
+    return {
+        'success': True,
+        'tokens_enabled': session_tokens.enabled,
+        'keys': session_tokens.key_ids(),
+        'revocations': session_tokens.stats()
+    }
+
+
+@api_router.route('POST', '/api/admin/session-keys/rotate', auth=AUTH_ADMIN)
+def rotate_session_key(request):
+    # Tokens signed with earlier keys stay valid until they expire
+    key_id = session_tokens.rotate()
+    return {'success': True, 'message': f'New tokens are signed with key {key_id}', 'key_id': key_id}
+
+
+@api_router.route('GET', '/api/admin/maintenance', auth=AUTH_ADMIN)
+def get_maintenance(request):
+    return {'success': True, 'maintenance': maintenance.status()}
+
+
+@api_router.route('POST', '/api/admin/maintenance/{job}', auth=AUTH_ADMIN)
+def run_maintenance_job(request):
+    # Runs in this request; scheduled runs happen only in the leader process
+    try:
+        job = maintenance.run_now(request.params['job'])
+    except KeyError:
+        return ApiResponse({'success': False, 'message': 'Unknown maintenance job'}, 404)
+    if job is None:
+        return ApiResponse({'success': False, 'message': 'Job is already running'}, 409)
+    return {'success': job['last_error'] is None, 'job': job}
+
+
+@api_router.route('GET', '/api/admin/rate-limits', auth=AUTH_ADMIN)
+def get_rate_limits(request):
+    # Counts are for this process; each process keeps its own buckets
+    return {'success': True, 'rate_limits': rate_limiter.stats()}
+
+
+@api_router.route('GET', '/api/admin/db-pool', auth=AUTH_ADMIN)
+def get_db_pool_stats(request):
+    return {'success': True, 'pool': pool_stats()}
+
+
+@api_router.route('GET', '/api/admin/slow-queries', auth=AUTH_ADMIN)
+def get_slow_queries(request):
+    try:
+        limit = int(request.query_param('limit', 20))
+    except ValueError:
+        return ApiResponse({'success': False, 'message': 'limit must be an integer'}, 400)
+    order_by = request.query_param('order', 'total_ms')
+    if order_by not in ('total_ms', 'max_ms', 'calls', 'slow_calls'):
+        return ApiResponse({'success': False, 'message': 'order must be total_ms, max_ms, calls or slow_calls'}, 400)
+
+    return {
+        'success': True,
+        'threshold_ms': query_log.threshold_ms,
+        'statements': query_log.top(max(limit, 1), order_by)
+    }
+
+
+@api_router.route('GET', METRICS_PATH, auth=AUTH_ADMIN)
+def get_metrics(request):
+    body = (
+        request_metrics.render()
+        + session_cache.render_metrics()
+        + backups.render_metrics()
+        + maintenance.render_metrics()
+        + password_hasher.render_metrics()
+        + rate_limiter.render_metrics()
+    )
+    return ApiResponse(body, content_type=PROMETHEUS_CONTENT_TYPE)
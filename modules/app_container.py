@@ -0,0 +1,78 @@
+"""
+Application Container Module
+Builds the service objects once per process and shares them across request handlers
+"""
+
+import threading
+from modules.assets import AssetCache
+from modules.database import execute_query
+from modules.hr_service import HRService
+from modules.payroll_service import PayrollService
+from modules.accounting_service import AccountingService
+from modules.attendance_service import AttendanceService
+from modules.auth_service import AuthService
+
+
+class AppContainer:
+    """Process-wide service instances.
+
+    A single container is shared by every worker thread, so services must
+    not keep per-request state on ``self``. Any cache or table a service
+    adds later has to be guarded by its own lock.
+    """
+
+    def __init__(self):
+        self.hr_service = HRService()
+        self.payroll_service = PayrollService()
+        self.accounting_service = AccountingService()
+        self.attendance_service = AttendanceService()
+        self.auth_service = AuthService()
+        self.assets = AssetCache()
+        self._warm_lock = threading.Lock()
+        self.is_warm = False
+
+    def services(self):
+        """All services held by the container"""
+        return [
+            self.hr_service,
+            self.payroll_service,
+            self.accounting_service,
+            self.attendance_service,
+            self.auth_service
+        ]
+
+    def warm_up(self):
+        """Pre-warm expensive state before the first request is served.
+
+        Touches the database so a missing or unreadable file fails at startup
+        instead of on the first request, loads and hashes the static files and
+        templates, then calls ``warm_up()`` on every service that defines one.
+        Safe to call more than once.
+        """
+        with self._warm_lock:
+            if self.is_warm:
+                return
+
+            execute_query('SELECT name FROM sqlite_master WHERE type = ?', ('table',))
+            self.assets.load_all()
+
+            for service in self.services():
+                warm_up = getattr(service, 'warm_up', None)
+                if warm_up:
+                    warm_up()
+
+            self.is_warm = True
+
+
+_container = None
+_container_lock = threading.Lock()
+
+
+def get_container():
+    """Return the process-wide container, creating it on first use"""
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                _container = AppContainer()
+    return _container
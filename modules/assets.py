@@ -0,0 +1,241 @@
+"""
+Asset Cache Module
+Keeps static files and templates in memory with validators for conditional requests
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from modules.compression import MIN_COMPRESS_SIZE, is_compressible, precompress
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+_STATIC_REFERENCE = re.compile(r'(["\'])/static/([A-Za-z0-9_\-./]+)\1')
+_HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{10})(?P<ext>\.[A-Za-z0-9]+)$')
+
+
+class Asset:
+    """One file held by the cache.
+
+    Files larger than the sendfile threshold keep no bytes in memory; their
+    ``content`` is None and they are streamed from disk with sendfile.
+    In-memory text assets also hold precompressed ``encodings``.
+    """
+
+    __slots__ = ('name', 'path', 'content', 'size', 'disk_size', 'mtime', 'content_type',
+                 'digest', 'etag', 'last_modified', 'hashed_name', 'generation', 'checked_at',
+                 'dependencies', 'encodings')
+
+    def __init__(self, name, path, content, size, stat, content_type, digest, generation=0):
+        self.name = name
+        self.path = path
+        self.content = content
+        self.size = size
+        self.disk_size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.content_type = content_type
+        self.digest = digest
+        self.etag = f'"{digest}"'
+        self.last_modified = formatdate(int(stat.st_mtime), usegmt=True)
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f'{stem}.{digest[:10]}{ext}'
+        self.generation = generation
+        self.checked_at = time.monotonic()
+        self.dependencies = ()
+        self.encodings = {}
+
+    def etag_for(self, coding):
+        """Entity tag of one encoded representation"""
+        if coding is None:
+            return self.etag
+        return f'"{self.digest}-{coding}"'
+
+
+class AssetCache:
+    """In-memory cache of files under ``static/`` and ``templates/``.
+
+    Assets are loaded and hashed once, then re-read only when their mtime
+    changes (checked at most every ``check_interval`` seconds). Templates
+    have their ``/static/...`` references rewritten to content-hashed URLs
+    so browsers can cache static files as immutable; a template is
+    re-rendered whenever a static file changes.
+    """
+
+    def __init__(self, root='.', static_dir='static', template_dir='templates',
+                 sendfile_threshold=256 * 1024, check_interval=1.0):
+        self.root = root
+        self.static_dir = static_dir
+        self.template_dir = template_dir
+        self.sendfile_threshold = sendfile_threshold
+        self.check_interval = check_interval
+        self._assets = {}
+        self._static_generation = 0
+        self._lock = threading.RLock()
+
+    def load_all(self):
+        """Load and hash every static file, then every template"""
+        for directory in (self.static_dir, self.template_dir):
+            base = os.path.join(self.root, directory)
+            for dirpath, _, filenames in os.walk(base):
+                for filename in sorted(filenames):
+                    full_path = os.path.join(dirpath, filename)
+                    self.get(os.path.relpath(full_path, self.root).replace(os.sep, '/'))
+
+    def get(self, name):
+        """Return the asset for a path such as 'static/app.js', or None"""
+        asset = self._assets.get(name)
+        now = time.monotonic()
+        if asset is not None and now - asset.checked_at < self.check_interval and not self._is_stale(asset):
+            return asset
+
+        path = self._resolve(name)
+        if path is None:
+            return None
+
+        if asset is not None:
+            # Re-check the static files a template links to, so edits to them re-render it
+            for dependency in asset.dependencies:
+                self.get(dependency)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._forget(name)
+            return None
+
+        if asset is not None and asset.mtime == stat.st_mtime and asset.disk_size == stat.st_size \
+                and not self._is_stale(asset):
+            asset.checked_at = now
+            return asset
+
+        with self._lock:
+            return self._load(name, path, stat)
+
+    def get_static(self, url_path):
+        """Return (asset, is_hashed_url) for a /static/ URL; asset is None when missing"""
+        name = url_path.lstrip('/')
+        asset = self.get(name)
+        if asset is not None:
+            return asset, False
+
+        match = _HASHED_NAME.match(name)
+        if match is None:
+            return None, False
+
+        asset = self.get(f"{match.group('stem')}{match.group('ext')}")
+        if asset is None or asset.hashed_name != name:
+            return None, False
+        return asset, True
+
+    def url_for(self, name):
+        """Content-hashed URL for a static file, e.g. '/static/app.3f2a9c1b0d.js'"""
+        asset = self.get(f'{self.static_dir}/{name}')
+        if asset is None:
+            return f'/{self.static_dir}/{name}'
+        return f'/{asset.hashed_name}'
+
+    def is_not_modified(self, asset, headers):
+        """Evaluate If-None-Match / If-Modified-Since against an asset"""
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match:
+            current = {asset.etag}
+            current.update(asset.etag_for(coding) for coding in asset.encodings)
+            for tag in if_none_match.split(','):
+                tag = tag.strip()
+                if tag.startswith('W/'):
+                    tag = tag[2:]
+                if tag == '*' or tag in current:
+                    return True
+            return False
+
+        if_modified_since = headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return int(asset.mtime) <= since
+
+        return False
+
+    def _resolve(self, name):
+        """Map an asset name to a file path, refusing anything outside the asset dirs"""
+        normalized = os.path.normpath(name).replace(os.sep, '/')
+        if normalized != name or '/' not in normalized:
+            return None
+        if normalized.split('/', 1)[0] not in (self.static_dir, self.template_dir):
+            return None
+        return os.path.join(self.root, normalized)
+
+    def _is_template(self, name):
+        return name.startswith(self.template_dir + '/')
+
+    def _is_stale(self, asset):
+        return self._is_template(asset.name) and asset.generation != self._static_generation
+
+    def _load(self, name, path, stat):
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+
+        if self._is_template(name):
+            with open(path, 'rb') as f:
+                content, dependencies = self._rewrite_static_urls(f.read())
+            generation = self._static_generation
+        elif stat.st_size > self.sendfile_threshold:
+            generation = 0
+            dependencies = ()
+            content = None
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(block)
+        else:
+            generation = 0
+            dependencies = ()
+            with open(path, 'rb') as f:
+                content = f.read()
+
+        if content is not None:
+            size = len(content)
+            digest = hashlib.sha256(content)
+        else:
+            size = stat.st_size
+
+        asset = Asset(name, path, content, size, stat, content_type, digest.hexdigest()[:32], generation)
+        asset.dependencies = dependencies
+        if content is not None and size >= MIN_COMPRESS_SIZE and is_compressible(content_type):
+            asset.encodings = precompress(content)
+
+        previous = self._assets.get(name)
+        self._assets[name] = asset
+        if not self._is_template(name) and (previous is None or previous.digest != asset.digest):
+            self._static_generation += 1
+        return asset
+
+    def _forget(self, name):
+        if self._assets.pop(name, None) is not None and not self._is_template(name):
+            self._static_generation += 1
+
+    def _rewrite_static_urls(self, content):
+        """Point /static/ references at hashed URLs; returns (content, referenced names)"""
+        text = content.decode('utf-8')
+        dependencies = []
+
+        def replace(match):
+            quote, relative = match.group(1), match.group(2)
+            name = f'{self.static_dir}/{relative}'
+            static = self.get(name)
+            if static is None:
+                return match.group(0)
+            dependencies.append(name)
+            return f'{quote}/{static.hashed_name}{quote}'
+
+        text = _STATIC_REFERENCE.sub(replace, text)
+        return text.encode('utf-8'), tuple(dict.fromkeys(dependencies))
@@ -3,10 +3,49 @@ Attendance Service Module
 Handles employee attendance tracking, check-in/check-out, and leave management
 """
 
-from modules.database import execute_query
+import sqlite3
+from modules.database import bulk_write, execute_query, iter_query
+from modules.pagination import ListQuery, Page
 from datetime import datetime, timedelta, time
 import calendar
 
+# Imported rows replace whatever was recorded for that employee and day
+UPSERT_ATTENDANCE_QUERY = '''
+    INSERT INTO attendance
+    (employee_id, date, check_in, check_out, hours_worked, leave_type, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (employee_id, date) DO UPDATE
+    SET check_in = excluded.check_in,
+        check_out = excluded.check_out,
+        hours_worked = excluded.hours_worked,
+        leave_type = excluded.leave_type,
+        status = excluded.status
+'''
+
+ATTENDANCE_COLUMNS = {
+    name: f'a.{name}' for name in (
+        'id', 'employee_id', 'date', 'check_in', 'check_out', 'hours_worked',
+        'leave_type', 'status', 'created_at'
+    )
+}
+
+# One employee's days, newest first; (employee_id, date) is unique, so the
+# date alone is a total order and idx_attendance_employee_date serves it
+EMPLOYEE_ATTENDANCE_LIST = ListQuery(
+    dict(ATTENDANCE_COLUMNS, first_name='e.first_name', last_name='e.last_name', position='e.position'),
+    'FROM attendance a JOIN employees e ON a.employee_id = e.employee_id',
+    ('date',),
+    descending=True
+)
+
+# Everyone's records for one day, by name
+DAILY_ATTENDANCE_LIST = ListQuery(
+    dict(ATTENDANCE_COLUMNS, first_name='e.first_name', last_name='e.last_name',
+         position='e.position', department='e.department'),
+    'FROM attendance a JOIN employees e ON a.employee_id = e.employee_id',
+    ('last_name', 'first_name', 'id')
+)
+
 class AttendanceService:
     def __init__(self):
         self.standard_hours = 8  # Standard work hours per day
@@ -18,27 +57,25 @@ class AttendanceService:
             today = datetime.now().date()
             current_time = datetime.now().time()
 
-            # Check if already checked in today
+            # One row per employee per day: create it, or fill in the check-in
+            # of a row that only holds a leave entry. Nothing changes when
+            # today's row already has a check-in.
             query = '''
-                SELECT * FROM attendance
-                WHERE employee_id = ? AND date = ? AND check_in IS NOT NULL
+                INSERT INTO attendance (employee_id, date, check_in, status)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (employee_id, date) DO UPDATE
+                SET check_in = excluded.check_in, status = excluded.status
+                WHERE attendance.check_in IS NULL
             '''
-            existing = execute_query(query, (employee_id, today.strftime('%Y-%m-%d')))
+            inserted = execute_query(query, (employee_id, today.strftime('%Y-%m-%d'),
+                                            current_time.strftime('%H:%M:%S'), 'present'))
 
-            if existing:
+            if not inserted:
                 return {
                     'success': False,
                     'message': 'Already checked in today'
                 }
 
-            # Create new attendance record
-            query = '''
-                INSERT INTO attendance (employee_id, date, check_in, status)
-                VALUES (?, ?, ?, ?)
-            '''
-            execute_query(query, (employee_id, today.strftime('%Y-%m-%d'),
-                                 current_time.strftime('%H:%M:%S'), 'present'))
-
             return {
                 'success': True,
                 'message': 'Checked in successfully',
@@ -123,34 +160,81 @@ class AttendanceService:
                 'message': 'Leave marked successfully'
             }
 
+        except sqlite3.IntegrityError:
+            return {
+                'success': False,
+                'message': 'Attendance is already recorded for this date'
+            }
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Error marking leave: {str(e)}'
             }
 
-    def get_attendance_by_employee(self, employee_id, start_date=None, end_date=None):
-        """Get attendance records for specific employee"""
+    def attendance_params(self, record):
+        """UPSERT parameters for one imported attendance record"""
+        date = datetime.strptime(record['date'], '%Y-%m-%d').strftime('%Y-%m-%d')
+        check_in = record.get('check_in')
+        check_out = record.get('check_out')
+        leave_type = record.get('leave_type')
+
+        hours_worked = record.get('hours_worked')
+        if hours_worked is None:
+            hours_worked = 0
+            if check_in and check_out:
+                worked = (datetime.strptime(check_out, '%H:%M:%S') -
+                          datetime.strptime(check_in, '%H:%M:%S'))
+                hours_worked = worked.total_seconds() / 3600
+
+        status = record.get('status') or ('leave' if leave_type else 'present')
+        return (record['employee_id'], date, check_in, check_out, hours_worked, leave_type, status)
+
+    def bulk_record_attendance(self, records):
+        """Import many attendance records in one transaction.
+
+        `records` can be any iterable of dicts with employee_id, date and
+        optionally check_in, check_out, hours_worked, leave_type and status;
+        it is read in batches. Each record replaces the existing row for
+        that employee and day. Records that fail are reported by position
+        in 'errors' and skipped.
+        """
+        try:
+            result = bulk_write(UPSERT_ATTENDANCE_QUERY, records, self.attendance_params)
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Error importing attendance: {str(e)}'
+            }
+        return dict(result, success=True, message=f"Recorded {result['written']} attendance entries")
+
+    def get_attendance_by_employee(self, employee_id, start_date=None, end_date=None, stream=False, page=None):
+        """Get attendance records for specific employee
+
+        With stream=True 'records' is a row iterator instead of a list.
+        `page` (from EMPLOYEE_ATTENDANCE_LIST.parse_page) selects fields and,
+        when it has a limit, returns one page plus a 'next' cursor.
+        """
+        page = page or Page()
         try:
             if not start_date:
                 start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
             if not end_date:
                 end_date = datetime.now().strftime('%Y-%m-%d')
 
-            query = '''
-                SELECT a.*, e.first_name, e.last_name, e.position
-                FROM attendance a
-                JOIN employees e ON a.employee_id = e.employee_id
-                WHERE a.employee_id = ? AND a.date BETWEEN ? AND ?
-                ORDER BY a.date DESC
-            '''
-
-            records = execute_query(query, (employee_id, start_date, end_date))
+            records, next_cursor = EMPLOYEE_ATTENDANCE_LIST.fetch(
+                page,
+                'a.employee_id = ? AND a.date BETWEEN ? AND ?',
+                (employee_id, start_date, end_date),
+                stream_query=iter_query if stream else None
+            )
 
-            return {
+            result = {
                 'success': True,
                 'records': records
             }
+            if page.limit is not None:
+                result['next'] = next_cursor
+            return result
 
         except Exception as e:
             return {
@@ -158,33 +242,45 @@ class AttendanceService:
                 'message': f'Error fetching attendance: {str(e)}'
             }
 
-    def get_all_attendance(self, date=None):
-        """Get attendance records for all employees for a specific date"""
+    def get_all_attendance(self, date=None, stream=False, page=None):
+        """Get attendance records for all employees for a specific date
+
+        With stream=True 'present_records' and 'absent_employees' are row
+        iterators instead of lists.
+
+        `page` (from DAILY_ATTENDANCE_LIST.parse_page) applies to
+        'present_records'. A paginated response carries 'absent_count'
+        instead of the absent list, which is not repeated on every page.
+        """
+        page = page or Page()
+        run_query = iter_query if stream else execute_query
         try:
             if not date:
                 date = datetime.now().strftime('%Y-%m-%d')
 
-            query = '''
-                SELECT a.*, e.first_name, e.last_name, e.position, e.department
-                FROM attendance a
-                JOIN employees e ON a.employee_id = e.employee_id
-                WHERE a.date = ?
-                ORDER BY e.last_name, e.first_name
-            '''
-
-            records = execute_query(query, (date,))
+            records, next_cursor = DAILY_ATTENDANCE_LIST.fetch(
+                page, 'a.date = ?', (date,), stream_query=iter_query if stream else None
+            )
 
-            # Get all employees to show who hasn't checked in
-            all_employees_query = '''
-                SELECT employee_id, first_name, last_name, position, department
+            # Active employees without an attendance record for the date
+            absent_source = '''
                 FROM employees
                 WHERE status = 'active'
+                  AND employee_id NOT IN (SELECT employee_id FROM attendance WHERE date = ?)
             '''
-            all_employees = execute_query(all_employees_query)
 
-            # Find employees who haven't checked in
-            checked_in_ids = [r['employee_id'] for r in records]
-            absent_employees = [emp for emp in all_employees if emp['employee_id'] not in checked_in_ids]
+            if page.limit is not None:
+                absent_count = execute_query('SELECT COUNT(*) AS count ' + absent_source, (date,))[0]['count']
+                return {
+                    'success': True,
+                    'date': date,
+                    'present_records': records,
+                    'next': next_cursor,
+                    'absent_count': absent_count
+                }
+
+            absent_query = 'SELECT employee_id, first_name, last_name, position, department ' + absent_source
+            absent_employees = run_query(absent_query, (date,))
 
             return {
                 'success': True,
@@ -3,18 +3,21 @@ Authentication Service Module
 Handles user authentication, registration, and session management
 """
 
-import hashlib
 import secrets
+import time
 from datetime import datetime, timedelta
-from modules.database import execute_query
+from modules.database import execute_query, transaction
+from modules.passwords import PasswordHasherBusy, password_hasher
+from modules.session_cache import session_cache
+from modules.session_tokens import is_token, session_tokens
 
 class AuthService:
     def __init__(self):
         self.session_duration_hours = 24
 
     def hash_password(self, password):
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with scrypt on the hashing pool"""
+        return password_hasher.hash(password)
 
     def generate_session_id(self):
         """Generate a secure session ID"""
@@ -35,103 +38,108 @@ class AuthService:
                     'message': 'Invalid role. Must be admin or employee.'
                 }
 
-            existing_user = execute_query(
-                'SELECT * FROM users WHERE username = ?',
-                (username,)
-            )
-
-            if existing_user:
-                return {
-                    'success': False,
-                    'message': 'Username already exists'
-                }
-
-            pending_user = execute_query(
-                'SELECT * FROM pending_registrations WHERE username = ? AND status = "pending"',
-                (username,)
-            )
-
-            if pending_user:
-                return {
-                    'success': False,
-                    'message': 'Username already has a pending registration request'
-                }
-
-            existing_email = execute_query(
-                'SELECT * FROM users WHERE email = ?',
-                (email,)
-            )
-
-            if existing_email:
-                return {
-                    'success': False,
-                    'message': 'Email already registered'
-                }
-
-            pending_email = execute_query(
-                'SELECT * FROM pending_registrations WHERE email = ? AND status = "pending"',
-                (email,)
-            )
-
-            if pending_email:
-                return {
-                    'success': False,
-                    'message': 'Email already has a pending registration request'
-                }
-
+            # Hash before taking the write lock; the checks and the insert then
+            # run in one transaction so two identical requests cannot both pass
             password_hash = self.hash_password(password)
 
-            if role == 'admin':
-                query = '''
-                    INSERT INTO users (username, password_hash, role, email)
-                    VALUES (?, ?, 'admin', ?)
-                '''
-                execute_query(query, (username, password_hash, email))
+            with transaction():
+                existing_user = execute_query(
+                    'SELECT * FROM users WHERE username = ?',
+                    (username,)
+                )
 
-                return {
-                    'success': True,
-                    'message': 'Admin account created successfully'
-                }
+                if existing_user:
+                    return {
+                        'success': False,
+                        'message': 'Username already exists'
+                    }
 
-            if role == 'employee':
-                if not employee_id:
+                pending_user = execute_query(
+                    'SELECT * FROM pending_registrations WHERE username = ? AND status = "pending"',
+                    (username,)
+                )
+
+                if pending_user:
                     return {
                         'success': False,
-                        'message': 'Employee ID is required for employee registration'
+                        'message': 'Username already has a pending registration request'
                     }
 
-                employee = execute_query(
-                    'SELECT * FROM employees WHERE employee_id = ?',
-                    (employee_id,)
+                existing_email = execute_query(
+                    'SELECT * FROM users WHERE email = ?',
+                    (email,)
                 )
-                if not employee:
+
+                if existing_email:
                     return {
                         'success': False,
-                        'message': 'Invalid employee ID. Please contact your administrator.'
+                        'message': 'Email already registered'
                     }
 
-                existing_emp_user = execute_query(
-                    'SELECT * FROM users WHERE employee_id = ?',
-                    (employee_id,)
+                pending_email = execute_query(
+                    'SELECT * FROM pending_registrations WHERE email = ? AND status = "pending"',
+                    (email,)
                 )
-                if existing_emp_user:
+
+                if pending_email:
                     return {
                         'success': False,
-                        'message': 'This employee ID already has an account'
+                        'message': 'Email already has a pending registration request'
                     }
 
-                query = '''
-                    INSERT INTO pending_registrations (username, password_hash, email, employee_id, status)
-                    VALUES (?, ?, ?, ?, 'pending')
-                '''
-                execute_query(query, (username, password_hash, email, employee_id))
+                if role == 'admin':
+                    query = '''
+                        INSERT INTO users (username, password_hash, role, email)
+                        VALUES (?, ?, 'admin', ?)
+                    '''
+                    execute_query(query, (username, password_hash, email))
 
-                return {
-                    'success': True,
-                    'message': 'Registration request submitted. Please wait for admin approval.',
-                    'requires_approval': True
-                }
+                    return {
+                        'success': True,
+                        'message': 'Admin account created successfully'
+                    }
+
+                if role == 'employee':
+                    if not employee_id:
+                        return {
+                            'success': False,
+                            'message': 'Employee ID is required for employee registration'
+                        }
+
+                    employee = execute_query(
+                        'SELECT * FROM employees WHERE employee_id = ?',
+                        (employee_id,)
+                    )
+                    if not employee:
+                        return {
+                            'success': False,
+                            'message': 'Invalid employee ID. Please contact your administrator.'
+                        }
+
+                    existing_emp_user = execute_query(
+                        'SELECT * FROM users WHERE employee_id = ?',
+                        (employee_id,)
+                    )
+                    if existing_emp_user:
+                        return {
+                            'success': False,
+                            'message': 'This employee ID already has an account'
+                        }
+
+                    query = '''
+                        INSERT INTO pending_registrations (username, password_hash, email, employee_id, status)
+                        VALUES (?, ?, ?, ?, 'pending')
+                    '''
+                    execute_query(query, (username, password_hash, email, employee_id))
 
+                    return {
+                        'success': True,
+                        'message': 'Registration request submitted. Please wait for admin approval.',
+                        'requires_approval': True
+                    }
+
+        except PasswordHasherBusy as e:
+            return {'success': False, 'busy': True, 'message': str(e)}
         except Exception as e:
             return {
                 'success': False,
@@ -141,32 +149,45 @@ class AuthService:
     def login(self, username, password):
         """Authenticate user and create session"""
         try:
-            password_hash = self.hash_password(password)
+            if not username or not password:
+                return {
+                    'success': False,
+                    'message': 'Invalid username or password'
+                }
 
             query = '''
                 SELECT u.*, e.first_name, e.last_name
                 FROM users u
                 LEFT JOIN employees e ON u.employee_id = e.employee_id
-                WHERE u.username = ? AND u.password_hash = ? AND u.is_active = 1
+                WHERE u.username = ? AND u.is_active = 1
             '''
-            users = execute_query(query, (username, password_hash))
+            users = execute_query(query, (username,))
 
-            if not users:
+            if users:
+                user = users[0]
+                matches, needs_rehash = password_hasher.verify(password, user['password_hash'])
+            else:
+                matches = password_hasher.verify_unknown(password)
+
+            if not matches:
                 return {
                     'success': False,
                     'message': 'Invalid username or password'
                 }
+            if needs_rehash:
+                self._upgrade_password_hash(user, password)
 
-            user = users[0]
-
-            session_id = self.generate_session_id()
-            expires_at = datetime.now() + timedelta(hours=self.session_duration_hours)
+            if session_tokens.enabled:
+                session_id, _ = session_tokens.issue(user['id'], user['role'], user['employee_id'])
+            else:
+                session_id = self.generate_session_id()
+                expires_at = datetime.now() + timedelta(hours=self.session_duration_hours)
 
-            query = '''
-                INSERT INTO sessions (session_id, user_id, expires_at)
-                VALUES (?, ?, ?)
-            '''
-            execute_query(query, (session_id, user['id'], expires_at.strftime('%Y-%m-%d %H:%M:%S')))
+                query = '''
+                    INSERT INTO sessions (session_id, user_id, expires_at)
+                    VALUES (?, ?, ?)
+                '''
+                execute_query(query, (session_id, user['id'], expires_at.strftime('%Y-%m-%d %H:%M:%S')))
 
             return {
                 'success': True,
@@ -183,20 +204,44 @@ class AuthService:
                 }
             }
 
+        except PasswordHasherBusy as e:
+            return {'success': False, 'busy': True, 'message': str(e)}
         except Exception as e:
             return {
                 'success': False,
                 'message': f'Error during login: {str(e)}'
             }
 
+    def _upgrade_password_hash(self, user, password):
+        """Replace a legacy or outdated hash after a successful login"""
+        try:
+            # Only if the hash is unchanged, so a password change made
+            # meanwhile is never overwritten
+            execute_query(
+                'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                (self.hash_password(password), user['id'], user['password_hash'])
+            )
+        except Exception as e:
+            # The old hash still works; the next login tries again
+            print(f"Could not upgrade password hash for user {user['id']}: {e}")
+
     def verify_session(self, session_id):
         """Verify if session is valid"""
         try:
             if not session_id:
                 return None
+            if is_token(session_id):
+                return self._verify_token(session_id)
+
+            found, user = session_cache.get(session_id)
+            if found:
+                return user
 
+            generation = session_cache.generation()
+            # `id` is the user's id, as it is for token sessions
             query = '''
-                SELECT s.*, u.username, u.role, u.employee_id, u.email,
+                SELECT s.session_id, s.user_id, s.created_at, s.expires_at,
+                       u.id, u.username, u.role, u.employee_id, u.email,
                        e.first_name, e.last_name
                 FROM sessions s
                 JOIN users u ON s.user_id = u.id
@@ -205,14 +250,49 @@ class AuthService:
             '''
             sessions = execute_query(query, (session_id,))
 
-            if sessions:
-                return sessions[0]
-            return None
+            user = sessions[0] if sessions else None
+            session_cache.put(session_id, user, generation)
+            return user
 
         except Exception as e:
             print(f"Error verifying session: {e}")
             return None
 
+    def _verify_token(self, token):
+        """User for a signed session token, `expires_at` in epoch seconds; names and email are left to user_profile"""
+        claims = session_tokens.verify(token)
+        if claims is None:
+            return None
+        return {
+            'session_id': token,
+            'id': claims['uid'],
+            'user_id': claims['uid'],
+            'role': claims['role'],
+            'employee_id': claims['eid'],
+            'expires_at': claims['exp']
+        }
+
+    def user_profile(self, user):
+        """Public fields of a verified user, loading what a token does not carry"""
+        if 'username' not in user:
+            rows = execute_query('''
+                SELECT u.username, u.email, e.first_name, e.last_name
+                FROM users u
+                LEFT JOIN employees e ON u.employee_id = e.employee_id
+                WHERE u.id = ?
+            ''', (user['id'],))
+            if not rows:
+                return None
+            user = dict(user, **rows[0])
+        return {
+            'username': user['username'],
+            'role': user['role'],
+            'employee_id': user['employee_id'],
+            'email': user['email'],
+            'first_name': user.get('first_name'),
+            'last_name': user.get('last_name')
+        }
+
     def logout(self, session_id):
         """Delete session (logout)"""
         try:
@@ -223,8 +303,14 @@ class AuthService:
                     'message': 'no active session'
                 }
             print(f"logout: Attempting to logout session ID {session_id}")
-            query='DELETE FROM sessions WHERE session_id = ?'
-            execute_query(query, (session_id,))
+            if is_token(session_id):
+                claims = session_tokens.verify(session_id)
+                if claims is not None:
+                    session_tokens.revoke(claims)
+            else:
+                query='DELETE FROM sessions WHERE session_id = ?'
+                execute_query(query, (session_id,))
+                session_cache.invalidate(session_id)
             print(f"logout: Successfully logged out session ID ")
 
             return {
@@ -257,36 +343,37 @@ class AuthService:
     def approve_registration(self, registration_id, admin_user_id, notes=''):
         """Approve a pending registration"""
         try:
-            pending = execute_query(
-                'SELECT * FROM pending_registrations WHERE id = ? AND status = "pending"',
-                (registration_id,)
-            )
+            with transaction():
+                pending = execute_query(
+                    'SELECT * FROM pending_registrations WHERE id = ? AND status = "pending"',
+                    (registration_id,)
+                )
 
-            if not pending:
-                return {
-                    'success': False,
-                    'message': 'Registration request not found or already processed'
-                }
+                if not pending:
+                    return {
+                        'success': False,
+                        'message': 'Registration request not found or already processed'
+                    }
 
-            reg = pending[0]
+                reg = pending[0]
 
-            query = '''
-                INSERT INTO users (username, password_hash, role, employee_id, email)
-                VALUES (?, ?, 'employee', ?, ?)
-            '''
-            execute_query(query, (reg['username'], reg['password_hash'], reg['employee_id'], reg['email']))
+                query = '''
+                    INSERT INTO users (username, password_hash, role, employee_id, email)
+                    VALUES (?, ?, 'employee', ?, ?)
+                '''
+                execute_query(query, (reg['username'], reg['password_hash'], reg['employee_id'], reg['email']))
 
-            update_query = '''
-                UPDATE pending_registrations
-                SET status = 'approved', reviewed_at = datetime('now'), reviewed_by = ?, admin_notes = ?
-                WHERE id = ?
-            '''
-            execute_query(update_query, (admin_user_id, notes, registration_id))
+                update_query = '''
+                    UPDATE pending_registrations
+                    SET status = 'approved', reviewed_at = datetime('now'), reviewed_by = ?, admin_notes = ?
+                    WHERE id = ?
+                '''
+                execute_query(update_query, (admin_user_id, notes, registration_id))
 
-            return {
-                'success': True,
-                'message': 'Registration approved successfully'
-            }
+                return {
+                    'success': True,
+                    'message': 'Registration approved successfully'
+                }
 
         except Exception as e:
             return {
@@ -297,28 +384,29 @@ class AuthService:
     def reject_registration(self, registration_id, admin_user_id, notes=''):
         """Reject a pending registration"""
         try:
-            pending = execute_query(
-                'SELECT * FROM pending_registrations WHERE id = ? AND status = "pending"',
-                (registration_id,)
-            )
+            with transaction():
+                pending = execute_query(
+                    'SELECT * FROM pending_registrations WHERE id = ? AND status = "pending"',
+                    (registration_id,)
+                )
 
-            if not pending:
-                return {
-                    'success': False,
-                    'message': 'Registration request not found or already processed'
-                }
+                if not pending:
+                    return {
+                        'success': False,
+                        'message': 'Registration request not found or already processed'
+                    }
 
-            update_query = '''
-                UPDATE pending_registrations
-                SET status = 'rejected', reviewed_at = datetime('now'), reviewed_by = ?, admin_notes = ?
-                WHERE id = ?
-            '''
-            execute_query(update_query, (admin_user_id, notes, registration_id))
+                update_query = '''
+                    UPDATE pending_registrations
+                    SET status = 'rejected', reviewed_at = datetime('now'), reviewed_by = ?, admin_notes = ?
+                    WHERE id = ?
+                '''
+                execute_query(update_query, (admin_user_id, notes, registration_id))
 
-            return {
-                'success': True,
-                'message': 'Registration rejected'
-            }
+                return {
+                    'success': True,
+                    'message': 'Registration rejected'
+                }
 
         except Exception as e:
             return {
@@ -326,13 +414,35 @@ class AuthService:
                 'message': f'Error rejecting registration: {str(e)}'
             }
 
-    def cleanup_expired_sessions(self):
-        """Remove expired sessions from database"""
-        try:
-            query = "DELETE FROM sessions WHERE expires_at < datetime('now')"
-            execute_query(query)
-        except Exception as e:
-            print(f"Error cleaning up sessions: {e}")
+    def cleanup_expired_sessions(self, batch_size=500, max_batches=None, pause=0):
+        """Remove expired sessions in batches; returns how many were deleted.
+
+        Each batch is its own short write transaction, found through
+        idx_sessions_expires, so logins are never held up by one big DELETE.
+        Expired token revocations are removed as well.
+        """
+        query = '''
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions WHERE expires_at < datetime('now') LIMIT ?
+            )
+        '''
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            removed = execute_query(query, (batch_size,))
+            deleted += removed
+            batches += 1
+            if removed < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        session_tokens.cleanup()
+        return deleted
+
+    def count_expired_sessions(self):
+        """Expired sessions still waiting to be deleted"""
+        rows = execute_query("SELECT COUNT(*) AS count FROM sessions WHERE expires_at < datetime('now')")
+        return rows[0]['count']
     
     def check_active_sessions(self, user_id=None):
         """Check active sessions for debugging"""
@@ -0,0 +1,401 @@
+"""
+Backup Module
+Online snapshots of the live database, compressed retention, read-only audit access and restore
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from modules import database
+from modules.migrations import migrate
+from modules.session_cache import read_shared_counter, session_cache, write_shared_counter
+from modules.session_tokens import preserve_revocations, reapply_revocations, session_tokens
+
+DEFAULT_BACKUP_DIR = 'backups'
+
+# Pages copied per backup step, and the pause between steps that lets
+# other connections in; 256 pages is 1 MiB at the default page size
+DEFAULT_BACKUP_STEP_PAGES = 256
+DEFAULT_BACKUP_STEP_SLEEP = 0.005
+
+# Snapshots kept: the newest few, then the newest of each day and each week
+DEFAULT_KEEP_LAST = 7
+DEFAULT_KEEP_DAILY = 14
+DEFAULT_KEEP_WEEKLY = 8
+
+_SNAPSHOT_NAME = re.compile(r'^teamroll-(\d{8}T\d{6})(\d{3})Z\.db\.gz$')
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+def snapshot_name(moment):
+    """File name for a snapshot taken at `moment` (UTC), sortable by time"""
+    return f"teamroll-{moment.strftime('%Y%m%dT%H%M%S')}{moment.microsecond // 1000:03d}Z.db.gz"
+
+
+def snapshot_time(name):
+    """UTC time encoded in a snapshot's file name, or None for any other file"""
+    match = _SNAPSHOT_NAME.match(name)
+    if match is None:
+        return None
+    moment = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S')
+    return moment.replace(microsecond=int(match.group(2)) * 1000, tzinfo=timezone.utc)
+
+
+def retained(times, keep_last, keep_daily, keep_weekly):
+    """Which of the snapshot times a keep-last/daily/weekly schedule keeps"""
+    newest_first = sorted(times, reverse=True)
+    keep = set(newest_first[:keep_last])
+    days, weeks = [], []
+    for moment in newest_first:
+        day = moment.date()
+        week = moment.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.append(day)
+            keep.add(moment)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.append(week)
+            keep.add(moment)
+    return keep
+
+
+class BackupManager:
+    """Takes gzip-compressed snapshots of the live database into `directory`.
+
+    Pages are copied with Connection.backup in steps of `step_pages`,
+    pausing `step_sleep` seconds between steps. The source connection
+    holds one read transaction for the whole copy: in WAL mode writers
+    carry on meanwhile, and the copy is a consistent point-in-time image
+    instead of restarting every time another connection commits. Only one
+    snapshot runs at a time per process.
+    """
+
+    def __init__(self, directory=DEFAULT_BACKUP_DIR, step_pages=DEFAULT_BACKUP_STEP_PAGES,
+                 step_sleep=DEFAULT_BACKUP_STEP_SLEEP, keep_last=DEFAULT_KEEP_LAST,
+                 keep_daily=DEFAULT_KEEP_DAILY, keep_weekly=DEFAULT_KEEP_WEEKLY, source_path=None):
+        self.directory = directory
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        # None follows database.DATABASE_PATH, which may change after import
+        self.source_path = source_path
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+        self._status = {
+            'in_progress': False,
+            'pages_total': 0,
+            'pages_remaining': 0,
+            'started_at': None,
+            'last_success_at': None,
+            'last_duration_seconds': None,
+            'last_size_bytes': None,
+            'last_snapshot': None,
+            'last_error': None,
+            'succeeded': 0,
+            'failed': 0
+        }
+
+    def configure(self, directory=None, keep_last=None, keep_daily=None, keep_weekly=None):
+        if directory is not None:
+            self.directory = directory
+        if keep_last is not None:
+            self.keep_last = keep_last
+        if keep_daily is not None:
+            self.keep_daily = keep_daily
+        if keep_weekly is not None:
+            self.keep_weekly = keep_weekly
+
+    def _source(self):
+        return self.source_path or database.DATABASE_PATH
+
+    def _update(self, **values):
+        with self._lock:
+            self._status.update(values)
+
+    def status(self):
+        with self._lock:
+            return dict(self._status, directory=self.directory)
+
+    def create_snapshot(self):
+        """Take a snapshot now, then apply retention; returns the snapshot's details"""
+        if not self._running.acquire(blocking=False):
+            raise BackupError('A backup is already running')
+        try:
+            return self._create_snapshot()
+        finally:
+            self._running.release()
+
+    def start_snapshot(self):
+        """Take a snapshot on a background thread; False when one is already running"""
+        if not self._running.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._create_snapshot()
+            except Exception as e:
+                print(f"Backup failed: {e}")
+            finally:
+                self._running.release()
+
+        threading.Thread(target=run, name='backup', daemon=True).start()
+        return True
+
+    def _create_snapshot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        moment = datetime.now(timezone.utc)
+        name = snapshot_name(moment)
+        # Names are unique per process; the pid keeps concurrent workers apart
+        copy_path = os.path.join(self.directory, f'.{name}.{os.getpid()}.db')
+        compressed_path = os.path.join(self.directory, f'.{name}.{os.getpid()}.tmp')
+
+        started = time.perf_counter()
+        self._update(in_progress=True, pages_total=0, pages_remaining=0, started_at=time.time(), last_error=None)
+        try:
+            pages = self._copy(copy_path)
+            with open(copy_path, 'rb') as source, gzip.open(compressed_path, 'wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            os.replace(compressed_path, os.path.join(self.directory, name))
+        except Exception as e:
+            self._update(in_progress=False, last_error=str(e))
+            with self._lock:
+                self._status['failed'] += 1
+            raise
+        finally:
+            for path in (copy_path, compressed_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        duration = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(self.directory, name))
+        self._update(
+            in_progress=False,
+            pages_remaining=0,
+            last_success_at=time.time(),
+            last_duration_seconds=round(duration, 3),
+            last_size_bytes=size,
+            last_snapshot=name
+        )
+        with self._lock:
+            self._status['succeeded'] += 1
+
+        removed = self.prune()
+        return {'name': name, 'pages': pages, 'size_bytes': size, 'duration_seconds': round(duration, 3), 'pruned': removed}
+
+    def _copy(self, copy_path):
+        source = sqlite3.connect(self._source(), timeout=30)
+        target = sqlite3.connect(copy_path)
+        try:
+            # Pin one read snapshot for the whole copy; see the class docstring
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+            def progress(status, remaining, total):
+                self._update(pages_total=total, pages_remaining=remaining)
+
+            source.backup(target, pages=self.step_pages, progress=progress, sleep=self.step_sleep)
+            source.rollback()
+
+            check = target.execute('PRAGMA quick_check').fetchone()[0]
+            if check != 'ok':
+                raise BackupError(f'Snapshot failed its integrity check: {check}')
+            return target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            source.close()
+            target.close()
+
+    def list_snapshots(self):
+        """Snapshots in the backup directory, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        snapshots = []
+        for name in names:
+            moment = snapshot_time(name)
+            if moment is None:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            snapshots.append({'name': name, 'created_at': moment.isoformat(), 'size_bytes': size})
+        snapshots.sort(key=lambda snapshot: snapshot['name'], reverse=True)
+        return snapshots
+
+    def prune(self):
+        """Delete snapshots the retention schedule no longer keeps; returns their names"""
+        by_time = {snapshot_time(snapshot['name']): snapshot['name'] for snapshot in self.list_snapshots()}
+        keep = retained(by_time, self.keep_last, self.keep_daily, self.keep_weekly)
+        removed = []
+        for moment, name in sorted(by_time.items()):
+            if moment in keep:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+                removed.append(name)
+            except FileNotFoundError:
+                # Another worker process pruned it first
+                pass
+        return removed
+
+    def _snapshot_path(self, name):
+        if snapshot_time(name) is None:
+            raise BackupError(f'Not a snapshot name: {name}')
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            raise BackupError(f'Snapshot not found: {name}')
+        return path
+
+    @contextmanager
+    def _expanded(self, name):
+        # Decompressed copy in a private temp directory, removed afterwards
+        path = self._snapshot_path(name)
+        with tempfile.TemporaryDirectory(prefix='teamroll-snapshot-') as directory:
+            expanded = os.path.join(directory, 'snapshot.db')
+            with gzip.open(path, 'rb') as source, open(expanded, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            yield expanded
+
+    @contextmanager
+    def open_snapshot(self, name):
+        """Read-only connection to a snapshot, for audits; the live database is not touched"""
+        with self._expanded(name) as path:
+            conn = sqlite3.connect(f'file:{quote(os.path.abspath(path))}?mode=ro&immutable=1', uri=True)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA query_only = ON')
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def restore_snapshot(self, name, snapshot_current=True):
+        """Replace the live database's contents with a snapshot.
+
+        The copy is one backup step, so other connections see either the
+        old or the restored database, never a mix. By default the current
+        state is snapshotted first so a restore can itself be undone.
+        Migrations newer than the snapshot are applied afterwards.
+
+        Unexpired token revocations are carried over, so a token revoked
+        after the snapshot stays revoked. The session cache counter is
+        moved past its old value, so every process empties its session
+        cache within a second.
+        """
+        self._snapshot_path(name)
+        if not self._running.acquire(blocking=False):
+            raise BackupError('A backup is already running')
+        try:
+            before = self._create_snapshot()['name'] if snapshot_current else None
+            with self._expanded(name) as path:
+                source = sqlite3.connect(path)
+                target = sqlite3.connect(self._source(), timeout=30)
+                try:
+                    check = source.execute('PRAGMA quick_check').fetchone()[0]
+                    if check != 'ok':
+                        raise BackupError(f'Snapshot failed its integrity check: {check}')
+                    revocations = preserve_revocations(target)
+                    cache_counter = read_shared_counter(target)
+                    source.backup(target)
+                    migrate(target)
+                    reapply_revocations(target, revocations)
+                    write_shared_counter(target, max(cache_counter, read_shared_counter(target)) + 1)
+                    target.commit()
+                finally:
+                    source.close()
+                    target.close()
+            # Sessions and accounts are whatever the snapshot had
+            session_cache.clear()
+            session_tokens.reset_revocations()
+        finally:
+            self._running.release()
+        return {'restored': name, 'previous_state': before}
+
+    def render_metrics(self):
+        """Backup gauges and counters in the Prometheus text format"""
+        status = self.status()
+        lines = [
+            '# HELP teamroll_backup_in_progress Whether a snapshot is being taken.',
+            '# TYPE teamroll_backup_in_progress gauge',
+            f"teamroll_backup_in_progress {int(status['in_progress'])}",
+            '# HELP teamroll_backup_pages_total Pages in the database being copied by the running or last snapshot.',
+            '# TYPE teamroll_backup_pages_total gauge',
+            f"teamroll_backup_pages_total {status['pages_total']}",
+            '# HELP teamroll_backup_pages_remaining Pages left to copy by the running snapshot.',
+            '# TYPE teamroll_backup_pages_remaining gauge',
+            f"teamroll_backup_pages_remaining {status['pages_remaining']}",
+            '# HELP teamroll_backups_total Snapshots attempted by this process.',
+            '# TYPE teamroll_backups_total counter',
+            f"teamroll_backups_total{{result=\"success\"}} {status['succeeded']}",
+            f"teamroll_backups_total{{result=\"failure\"}} {status['failed']}"
+        ]
+        if status['last_success_at'] is not None:
+            lines += [
+                '# HELP teamroll_backup_last_success_timestamp_seconds When the last snapshot finished.',
+                '# TYPE teamroll_backup_last_success_timestamp_seconds gauge',
+                f"teamroll_backup_last_success_timestamp_seconds {status['last_success_at']:.3f}",
+                '# HELP teamroll_backup_last_duration_seconds Time taken by the last snapshot, compression included.',
+                '# TYPE teamroll_backup_last_duration_seconds gauge',
+                f"teamroll_backup_last_duration_seconds {status['last_duration_seconds']}",
+                '# HELP teamroll_backup_last_size_bytes Compressed size of the last snapshot.',
+                '# TYPE teamroll_backup_last_size_bytes gauge',
+                f"teamroll_backup_last_size_bytes {status['last_size_bytes']}"
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+backups = BackupManager()
+
+
+def main(argv=None):
+    """python -m modules.backup [--dir DIR] {list,create,restore NAME,query NAME SQL}"""
+    parser = argparse.ArgumentParser(description='TeamRoll database snapshots')
+    parser.add_argument('--dir', default=DEFAULT_BACKUP_DIR, help='snapshot directory (default: %(default)s)')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='live database (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list snapshots, newest first')
+    commands.add_parser('create', help='take a snapshot now')
+    restore = commands.add_parser('restore', help='replace the live database with a snapshot')
+    restore.add_argument('name')
+    query = commands.add_parser('query', help='run a read-only query against a snapshot')
+    query.add_argument('name')
+    query.add_argument('sql')
+    args = parser.parse_args(argv)
+
+    manager = BackupManager(args.dir, source_path=args.db)
+    if args.command == 'list':
+        for snapshot in manager.list_snapshots():
+            print(f"{snapshot['name']}  {snapshot['size_bytes']:>12} bytes")
+    elif args.command == 'create':
+        print(json.dumps(manager.create_snapshot()))
+    elif args.command == 'restore':
+        print(json.dumps(manager.restore_snapshot(args.name)))
+    elif args.command == 'query':
+        with manager.open_snapshot(args.name) as conn:
+            for row in conn.execute(args.sql):
+                print(json.dumps(dict(row), default=str))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except (BackupError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,154 @@
+"""
+Compression Module
+Accept-Encoding negotiation, gzip/brotli encoding and per-route savings stats
+"""
+
+import gzip
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# Responses smaller than this are sent as-is; the framing overhead outweighs the savings
+MIN_COMPRESS_SIZE = 1024
+
+_COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first"""
+    if brotli is not None:
+        return (BROTLI, GZIP)
+    return (GZIP,)
+
+
+def is_compressible(content_type):
+    return content_type is not None and content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into {coding: qvalue}"""
+    codings = {}
+    if not header:
+        return codings
+
+    for part in header.split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        codings[coding] = qvalue
+    return codings
+
+
+def negotiate(accept_encoding, offered=None):
+    """Pick the best encoding the client accepts from `offered`, or None for identity"""
+    codings = parse_accept_encoding(accept_encoding)
+    if not codings:
+        return None
+
+    wildcard = codings.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in offered if offered is not None else available_encodings():
+        qvalue = codings.get(coding, wildcard)
+        if qvalue > best_q:
+            best, best_q = coding, qvalue
+    return best
+
+
+def compress(data, coding, level=None):
+    """Encode bytes with gzip or brotli"""
+    if coding == GZIP:
+        return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+    if coding == BROTLI and brotli is not None:
+        return brotli.compress(data, quality=5 if level is None else level)
+    raise ValueError(f'Unsupported content coding: {coding}')
+
+
+class StreamCompressor:
+    """Incremental encoder for responses written chunk by chunk"""
+
+    def __init__(self, coding, level=None):
+        self.coding = coding
+        if coding == GZIP:
+            self._compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+        elif coding == BROTLI and brotli is not None:
+            self._compressor = brotli.Compressor(quality=5 if level is None else level)
+        else:
+            raise ValueError(f'Unsupported content coding: {coding}')
+
+    def compress(self, data):
+        if self.coding == GZIP:
+            return self._compressor.compress(data)
+        return self._compressor.process(data)
+
+    def flush(self):
+        if self.coding == GZIP:
+            return self._compressor.flush()
+        return self._compressor.finish()
+
+
+def precompress(data):
+    """All worthwhile encodings of static content at maximum effort: {coding: bytes}"""
+    variants = {}
+    for coding in available_encodings():
+        level = 11 if coding == BROTLI else 9
+        encoded = compress(data, coding, level)
+        if len(encoded) < len(data):
+            variants[coding] = encoded
+    return variants
+
+
+class CompressionStats:
+    """Bytes in and out per route so the savings of compression can be measured"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, original_size, sent_size, coding=None):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'responses': 0,
+                    'compressed_responses': 0,
+                    'bytes_original': 0,
+                    'bytes_sent': 0
+                }
+            stats['responses'] += 1
+            if coding:
+                stats['compressed_responses'] += 1
+            stats['bytes_original'] += original_size
+            stats['bytes_sent'] += sent_size
+
+    def snapshot(self):
+        """Per-route totals including bytes saved, largest savings first"""
+        with self._lock:
+            routes = [dict(stats, route=route) for route, stats in self._routes.items()]
+
+        for stats in routes:
+            stats['bytes_saved'] = stats['bytes_original'] - stats['bytes_sent']
+        routes.sort(key=lambda stats: stats['bytes_saved'], reverse=True)
+        return routes
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+compression_stats = CompressionStats()
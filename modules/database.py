@@ -4,8 +4,22 @@ Handles SQLite database initialization and connections
 """
 
 import sqlite3
-import hashlib
+import itertools
 import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import quote
+
+from modules.db_pool import ConnectionPool, is_connection_error
+from modules.metrics import add_db_time
+from modules.migrations import migrate
+from modules.passwords import hash_password
+from modules.query_log import query_log
+from modules.write_queue import WriteQueue
 
 DATABASE_PATH = 'teamroll.db'
 
@@ -13,18 +27,269 @@ DEFAULT_ADMIN_USERNAME = 'admin'
 DEFAULT_ADMIN_PASSWORD = 'admin123'
 DEFAULT_ADMIN_EMAIL = 'admin@teamroll.local'
 
+# Prepared statements kept per connection; the services use well under this many
+STATEMENT_CACHE_SIZE = 256
+DEFAULT_POOL_SIZE = 16
+
+# Reports run on their own read-only connections so long scans never hold up
+# the connections serving check-ins and logins
+DEFAULT_REPORT_POOL_SIZE = 4
+DEFAULT_REPORT_TIMEOUT = 10
+# SQLite VM steps between deadline checks while a report query runs
+REPORT_PROGRESS_STEPS = 10000
+
+# Extra attempts at BEGIN IMMEDIATE after busy_timeout has already expired
+TRANSACTION_BUSY_RETRIES = 3
+
+# Rows per executemany call in bulk_write, and per-row errors reported at most
+BULK_BATCH_SIZE = 500
+BULK_MAX_ERRORS = 1000
+
+# Statements group-committed together by the writer thread, when enabled
+DEFAULT_WRITE_BATCH_SIZE = 256
+
+# Worker threads of the pooled server keep one connection each for their lifetime
+_thread_state = threading.local()
+
+# Connections inherited across fork are parked here and never used or closed:
+# closing a copy of a parent's SQLite handle can disturb the parent's WAL state
+_inherited_connections = []
+
+def _after_fork_in_child():
+    conn = getattr(_thread_state, 'conn', None)
+    if conn is not None:
+        _inherited_connections.append(conn)
+        _thread_state.conn = None
+    _thread_state.tx_conn = None
+    _inherited_connections.extend(_pool.abandon())
+    _inherited_connections.extend(_report_pool.abandon())
+    if _writer is not None:
+        writer_conn = _writer.abandon()
+        if writer_conn is not None:
+            _inherited_connections.append(writer_conn)
+    global _stats_lock, _thread_connections, _connection_stats
+    _stats_lock = threading.Lock()
+    _thread_connections = 0
+    _connection_stats = _empty_connection_stats()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
 def get_db_connection():
     """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+    # check_same_thread is off because pooled connections move between
+    # threads; the pool guarantees only one thread uses a connection at a time
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row  # Enable dict-like access to rows
     conn.execute('PRAGMA busy_timeout = 5000')
     return conn
 
+def get_readonly_connection():
+    """Get a connection that cannot write, for reporting queries"""
+    uri = f'file:{quote(os.path.abspath(DATABASE_PATH))}?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+# Shared by every thread without a connection of its own
+_pool = ConnectionPool(get_db_connection, max_size=DEFAULT_POOL_SIZE)
+
+# Read-only connections for report_query and iter_report_query
+_report_pool = ConnectionPool(get_readonly_connection, max_size=DEFAULT_REPORT_POOL_SIZE, timeout=10)
+_report_timeout = DEFAULT_REPORT_TIMEOUT
+
+# Optional single writer for execute_query's INSERT/UPDATE/DELETE statements;
+# None means every thread writes on its own connection
+_writer = None
+
+class QueryTimeout(RuntimeError):
+    pass
+
+def _empty_connection_stats():
+    return {
+        'thread_connections_created': 0,
+        'thread_connections_recycled': 0,
+        'commits': 0,
+        'transactions': 0,
+        'rollbacks': 0,
+        'busy_retries': 0,
+        'report_timeouts': 0
+    }
+
+_stats_lock = threading.Lock()
+_thread_connections = 0
+_connection_stats = _empty_connection_stats()
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _connection_stats[name] += amount
+
+def configure_pool(max_size=None, timeout=None):
+    """Resize the shared pool or change how long a checkout may wait"""
+    if max_size is not None:
+        _pool.max_size = max_size
+    if timeout is not None:
+        _pool.timeout = timeout
+
+def configure_report_pool(max_size=None, query_timeout=None):
+    """Resize the reporting pool or change how long a report query may run"""
+    global _report_timeout
+    if max_size is not None:
+        _report_pool.max_size = max_size
+    if query_timeout is not None:
+        _report_timeout = query_timeout
+
+def configure_write_queue(enabled=True, max_batch=DEFAULT_WRITE_BATCH_SIZE):
+    """Send execute_query's single-statement writes through one group-committing writer thread.
+
+    Reads keep using pooled and thread-bound connections, and transaction()
+    blocks and bulk_write still run on their own connection, taking the
+    write lock between the writer's batches.
+    """
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    if enabled:
+        _writer = WriteQueue(
+            get_db_connection,
+            lambda conn: _begin_immediate(conn, TRANSACTION_BUSY_RETRIES),
+            query_log.record,
+            max_batch=max_batch
+        )
+
+def close_pools():
+    """Stop the write queue and close the idle pooled connections, e.g. at shutdown"""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+    _pool.close_all()
+    _report_pool.close_all()
+
+def pool_stats():
+    """Pool checkouts and waits, thread-bound connections, and commit/transaction counts"""
+    stats = _pool.stats()
+    with _stats_lock:
+        stats['thread_connections'] = _thread_connections
+        stats.update(_connection_stats)
+    stats['reporting'] = dict(_report_pool.stats(), query_timeout=_report_timeout)
+    stats['writer'] = _writer.stats() if _writer is not None else None
+    return stats
+
+def open_thread_connection():
+    """Bind a long-lived connection to the calling thread.
+
+    execute_query reuses it instead of checking one out of the pool.
+    Connections are never shared between threads.
+    """
+    global _thread_connections
+    conn = getattr(_thread_state, 'conn', None)
+    if conn is None:
+        conn = get_db_connection()
+        _thread_state.conn = conn
+        with _stats_lock:
+            _thread_connections += 1
+            _connection_stats['thread_connections_created'] += 1
+    return conn
+
+def close_thread_connection():
+    """Close the connection bound to the calling thread, if any"""
+    global _thread_connections
+    conn = getattr(_thread_state, 'conn', None)
+    if conn is not None:
+        _thread_state.conn = None
+        conn.close()
+        with _stats_lock:
+            _thread_connections -= 1
+
+def _recycle_thread_connection(conn):
+    """Replace a thread-bound connection that failed with a fresh one"""
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+    _thread_state.conn = get_db_connection()
+    with _stats_lock:
+        _connection_stats['thread_connections_created'] += 1
+        _connection_stats['thread_connections_recycled'] += 1
+
+def _is_busy(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'busy' in message
+
+def _begin_immediate(conn, retries):
+    # Nothing has run yet, so retrying BEGIN can never repeat a write
+    for attempt in range(retries + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as exc:
+            if not _is_busy(exc) or attempt == retries:
+                if _is_busy(exc):
+                    raise RuntimeError('Database is busy. Please retry in a moment.') from exc
+                raise
+            _count('busy_retries')
+            time.sleep(0.05 * (2 ** attempt) * (0.5 + random.random()))
+
+@contextmanager
+def transaction(busy_retries=TRANSACTION_BUSY_RETRIES):
+    """Group statements into one BEGIN IMMEDIATE ... COMMIT on one connection.
+
+    execute_query calls made inside the block run on the transaction's
+    connection and are committed together when the block exits, or rolled
+    back if it raises. The write lock is taken up front, so statements in
+    the block do not hit busy errors part way through; only BEGIN is
+    retried. A nested transaction() joins the outer one. iter_query still
+    reads on its own connection and does not see uncommitted changes.
+    """
+    active = getattr(_thread_state, 'tx_conn', None)
+    if active is not None:
+        yield active
+        return
+
+    conn = getattr(_thread_state, 'conn', None)
+    pooled = conn is None
+    if pooled:
+        conn = _pool.acquire()
+
+    error = None
+    try:
+        _begin_immediate(conn, busy_retries)
+        _thread_state.tx_conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            _count('rollbacks')
+            raise
+        finally:
+            _thread_state.tx_conn = None
+        with _stats_lock:
+            _connection_stats['transactions'] += 1
+            _connection_stats['commits'] += 1
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        if pooled:
+            _pool.release(conn, error)
+        elif error is not None and is_connection_error(error):
+            _recycle_thread_connection(conn)
+
 def init_database():
     """Initialize database with required tables"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # Only takes effect on a new, empty database; existing files keep their
+    # mode until `python -m modules.maintenance enable-incremental-vacuum`
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
     cursor.execute('PRAGMA journal_mode = WAL')
     cursor.execute('PRAGMA synchronous = NORMAL')
     
@@ -129,7 +394,7 @@ def init_database():
     # Create default admin account if it doesn't exist
     cursor.execute('SELECT * FROM users WHERE username = ?', (DEFAULT_ADMIN_USERNAME,))
     if not cursor.fetchone():
-        password_hash = hashlib.sha256(DEFAULT_ADMIN_PASSWORD.encode()).hexdigest()
+        password_hash = hash_password(DEFAULT_ADMIN_PASSWORD)
         cursor.execute('''
             INSERT INTO users (username, password_hash, role, email)
             VALUES (?, ?, 'admin', ?)
@@ -145,13 +410,74 @@ def init_database():
         print(f"{'='*60}\n")
 
     conn.commit()
+    migrate(conn)
     conn.close()
     print("Database initialized successfully!")
 
+_LEADING_COMMENTS = re.compile(r'^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*', re.DOTALL)
+_FIRST_KEYWORD = re.compile(r'[A-Za-z]*')
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+# Literals, quoted identifiers and comments, none of which can hold the main keyword
+_NOT_KEYWORDS = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`(?:[^`]|``)*`|\[[^\]]*\]|--[^\n]*|/\*.*?(?:\*/|$)",
+    re.DOTALL
+)
+_TOKENS = re.compile(r'[()]|[A-Za-z_][A-Za-z_0-9$]*')
+_STATEMENT_KEYWORDS = ('SELECT', 'VALUES', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def _main_statement(sql):
+    """Keyword of the statement a WITH clause's common table expressions lead into.
+
+    It is the first statement keyword outside every parenthesis: the CTE
+    bodies are all parenthesized, so a replace() call or a SELECT inside
+    them is never taken for the main statement.
+    """
+    depth = 0
+    for token in _TOKENS.findall(_NOT_KEYWORDS.sub(' ', sql)):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0 and token.upper() in _STATEMENT_KEYWORDS:
+            return token.upper()
+    return None
+
+@lru_cache(maxsize=1024)
+def is_read_query(query):
+    """Whether a statement only returns rows, so execute_query fetches them.
+
+    That is SELECT, VALUES, EXPLAIN, a WITH clause leading into a SELECT
+    or VALUES, and a PRAGMA that does not set a value. Anything else
+    returns its rowcount and, with the write queue on, runs on the writer
+    thread.
+    """
+    sql = _LEADING_COMMENTS.sub('', query)
+    keyword = _FIRST_KEYWORD.match(sql).group().upper()
+    if keyword in ('SELECT', 'VALUES', 'EXPLAIN'):
+        return True
+    if keyword == 'WITH':
+        return _main_statement(sql[len(keyword):]) in ('SELECT', 'VALUES')
+    if keyword == 'PRAGMA':
+        return '=' not in _STRING_LITERALS.sub("''", sql)
+    return False
+
 def execute_query(query, params=None):
     """Execute a query and return results"""
-    conn = get_db_connection()
+    tx_conn = getattr(_thread_state, 'tx_conn', None)
+    if tx_conn is not None:
+        return _execute_in_transaction(tx_conn, query, params)
+
+    is_select = is_read_query(query)
+    if _writer is not None and not is_select:
+        return _execute_queued(query, params)
 
+    conn = getattr(_thread_state, 'conn', None)
+    pooled = conn is None
+    if pooled:
+        conn = _pool.acquire()
+
+    error = None
+    started = time.perf_counter()
     try:
         cursor = conn.cursor()
 
@@ -160,19 +486,257 @@ def execute_query(query, params=None):
         else:
             cursor.execute(query)
 
-        if query.strip().upper().startswith('SELECT'):
+        if is_select:
             results = cursor.fetchall()
+            query_log.record(conn, query, params, time.perf_counter() - started, len(results))
             return [dict(row) for row in results]
 
         conn.commit()
+        _count('commits')
+        query_log.record(conn, query, params, time.perf_counter() - started, cursor.rowcount)
         return cursor.rowcount
     except sqlite3.OperationalError as exc:
+        error = exc
         conn.rollback()
         if 'database is locked' in str(exc).lower():
             raise RuntimeError('Database is busy. Please retry in a moment.') from exc
         raise
-    except Exception:
+    except Exception as exc:
+        error = exc
         conn.rollback()
         raise
     finally:
-        conn.close()
+        add_db_time(time.perf_counter() - started)
+        if pooled:
+            _pool.release(conn, error)
+        elif error is not None and is_connection_error(error):
+            _recycle_thread_connection(conn)
+
+def _execute_queued(query, params):
+    # The caller waits for the writer's commit; that wait is its DB time.
+    # Statement errors are raised here unchanged, e.g. IntegrityError.
+    started = time.perf_counter()
+    try:
+        return _writer.execute(query, params)
+    finally:
+        add_db_time(time.perf_counter() - started)
+
+def _execute_in_transaction(conn, query, params):
+    # No commit or rollback here: transaction() owns both
+    started = time.perf_counter()
+    try:
+        cursor = conn.execute(query, params) if params else conn.execute(query)
+        if is_read_query(query):
+            results = cursor.fetchall()
+            query_log.record(conn, query, params, time.perf_counter() - started, len(results))
+            return [dict(row) for row in results]
+        query_log.record(conn, query, params, time.perf_counter() - started, cursor.rowcount)
+        return cursor.rowcount
+    except sqlite3.OperationalError as exc:
+        if 'database is locked' in str(exc).lower():
+            raise RuntimeError('Database is busy. Please retry in a moment.') from exc
+        raise
+    finally:
+        add_db_time(time.perf_counter() - started)
+
+def bulk_write(query, rows, prepare=None, batch_size=BULK_BATCH_SIZE, max_errors=BULK_MAX_ERRORS):
+    """Run one INSERT/UPSERT statement for every row of an iterable in a single transaction.
+
+    `rows` is consumed lazily, `batch_size` rows at a time, so generators
+    of any length can be passed. `prepare(row)` turns a row into the
+    statement's parameters; when it is omitted rows are used as-is. A row
+    that fails to prepare or violates a constraint is reported in 'errors'
+    by its position in the input and skipped; the rest are still written.
+
+    Returns {'processed', 'written', 'failed', 'errors', 'errors_truncated'}.
+    """
+    result = {'processed': 0, 'written': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+
+    def record_error(index, exc):
+        result['failed'] += 1
+        if len(result['errors']) < max_errors:
+            message = f'Missing field: {exc.args[0]}' if isinstance(exc, KeyError) else str(exc)
+            result['errors'].append({'index': index, 'message': message})
+        else:
+            result['errors_truncated'] = True
+
+    with transaction() as conn:
+        iterator = iter(enumerate(rows))
+        while True:
+            chunk = list(itertools.islice(iterator, batch_size))
+            if not chunk:
+                break
+            result['processed'] += len(chunk)
+
+            batch = []
+            for index, row in chunk:
+                try:
+                    batch.append((index, prepare(row) if prepare else row))
+                except Exception as exc:
+                    record_error(index, exc)
+            if batch:
+                result['written'] += _write_batch(conn, query, batch, record_error)
+
+    return result
+
+def _write_batch(conn, query, batch, record_error):
+    # executemany stops at the first bad row, so a failed batch is undone
+    # with a savepoint and replayed row by row to find and skip the culprits
+    started = time.perf_counter()
+    conn.execute('SAVEPOINT bulk_batch')
+    try:
+        written = conn.executemany(query, [params for _, params in batch]).rowcount
+        conn.execute('RELEASE bulk_batch')
+    except sqlite3.DatabaseError:
+        conn.execute('ROLLBACK TO bulk_batch')
+        written = 0
+        for index, params in batch:
+            try:
+                written += conn.execute(query, params).rowcount
+            except sqlite3.DatabaseError as exc:
+                if isinstance(exc, sqlite3.OperationalError) and _is_busy(exc):
+                    raise
+                record_error(index, exc)
+        conn.execute('RELEASE bulk_batch')
+    finally:
+        elapsed = time.perf_counter() - started
+        add_db_time(elapsed)
+    query_log.record(conn, query, batch[0][1], elapsed, written)
+    return written
+
+def _set_deadline(conn, timeout):
+    deadline = time.monotonic() + timeout
+    # A non-zero return makes SQLite abort the running statement
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, REPORT_PROGRESS_STEPS)
+
+def _report_error(exc, timeout):
+    if isinstance(exc, sqlite3.OperationalError) and 'interrupted' in str(exc).lower():
+        _count('report_timeouts')
+        return QueryTimeout(f'Report query exceeded {timeout:g}s and was stopped')
+    return None
+
+def report_query(query, params=None, timeout=None):
+    """Run a reporting SELECT on the read-only pool and return its rows as dicts.
+
+    The statement is aborted with QueryTimeout once it has run for
+    `timeout` seconds (the configured report timeout by default).
+    """
+    timeout = _report_timeout if timeout is None else timeout
+    conn = _report_pool.acquire()
+    error = None
+    started = time.perf_counter()
+    try:
+        _set_deadline(conn, timeout)
+        results = conn.execute(query, params or ()).fetchall()
+        query_log.record(conn, query, params, time.perf_counter() - started, len(results))
+        return [dict(row) for row in results]
+    except sqlite3.Error as exc:
+        timed_out = _report_error(exc, timeout)
+        if timed_out:
+            raise timed_out from exc
+        error = exc
+        raise
+    finally:
+        add_db_time(time.perf_counter() - started)
+        conn.set_progress_handler(None, 0)
+        _report_pool.release(conn, error)
+
+def iter_report_query(query, params=None, batch_size=500, timeout=None):
+    """Streaming form of report_query; see iter_query.
+
+    The timeout covers the whole iteration, consumer time included, so a
+    slow client cannot pin a read snapshot open indefinitely.
+    """
+    timeout = _report_timeout if timeout is None else timeout
+    conn = _report_pool.acquire()
+    started = time.perf_counter()
+    try:
+        _set_deadline(conn, timeout)
+        cursor = conn.execute(query, params or ())
+    except Exception as exc:
+        conn.set_progress_handler(None, 0)
+        timed_out = _report_error(exc, timeout)
+        _report_pool.release(conn, None if timed_out else exc)
+        if timed_out:
+            raise timed_out from exc
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        add_db_time(elapsed)
+    return _started(_iter_rows(conn, cursor, batch_size, query, params, elapsed, _report_pool, timeout))
+
+def iter_query(query, params=None, batch_size=500):
+    """Execute a SELECT and return an iterator over its rows as dicts.
+
+    The statement runs immediately, so SQL errors surface to the caller;
+    rows are then fetched `batch_size` at a time as the iterator is consumed.
+    The iterator holds a pooled connection of its own, returned when it is
+    exhausted or closed.
+    """
+    conn = _pool.acquire()
+    started = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+    except Exception as exc:
+        _pool.release(conn, exc)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        add_db_time(elapsed)
+    return _started(_iter_rows(conn, cursor, batch_size, query, params, elapsed))
+
+def map_rows(function, rows):
+    """Apply `function` to each row of a row iterator; closing the result closes `rows`"""
+    return _started(_map_rows(function, rows))
+
+def _map_rows(function, rows):
+    try:
+        yield None
+        for row in rows:
+            yield function(row)
+    finally:
+        close = getattr(rows, 'close', None)
+        if close:
+            close()
+
+def _started(rows):
+    # Run a row generator up to its first yield, inside its try block, so
+    # close() and garbage collection release the connection even when no
+    # row is ever read; an unstarted generator skips its finally block
+    next(rows)
+    return rows
+
+def _iter_rows(conn, cursor, batch_size, query, params, elapsed, pool=None, timeout=None):
+    pool = pool or _pool
+    row_count = 0
+    error = None
+    try:
+        yield None
+        while True:
+            started = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            fetch_time = time.perf_counter() - started
+            add_db_time(fetch_time)
+            elapsed += fetch_time
+            if not rows:
+                break
+            row_count += len(rows)
+            for row in rows:
+                yield dict(row)
+        # Time spent by the consumer between batches is not counted
+        query_log.record(conn, query, params, elapsed, row_count)
+    except Exception as exc:
+        timed_out = _report_error(exc, timeout) if timeout is not None else None
+        if timed_out:
+            raise timed_out from exc
+        error = exc
+        raise
+    finally:
+        cursor.close()
+        if timeout is not None:
+            conn.set_progress_handler(None, 0)
+        pool.release(conn, error)
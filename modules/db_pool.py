@@ -0,0 +1,223 @@
+"""
+DB Pool Module
+Checkout/return pool of long-lived, pre-configured SQLite connections
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def is_connection_error(exc):
+    """Whether an exception means the connection itself should not be reused.
+
+    Constraint violations and busy/locked errors say nothing about the
+    connection's health; anything else from SQLite gets it recycled.
+    """
+    if isinstance(exc, sqlite3.IntegrityError):
+        return False
+    if isinstance(exc, sqlite3.OperationalError):
+        message = str(exc).lower()
+        if 'locked' in message or 'busy' in message:
+            return False
+    return isinstance(exc, sqlite3.Error)
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class _Waiter:
+    __slots__ = ('event', 'conn', 'returned_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn = None
+        self.returned_at = None
+
+
+class ConnectionPool:
+    """A bounded set of connections created by `factory` and handed out one at a time.
+
+    Idle connections are reused most-recently-returned first so a small hot
+    set stays warm, along with each connection's prepared statement cache.
+    When every connection is in use, callers queue and released connections
+    are handed to the longest waiter directly, so a busy thread cannot keep
+    grabbing a connection ahead of the queue. A connection idle for longer
+    than `health_check_interval` is pinged before being handed out, and
+    connections returned after a connection error are closed, not reused.
+    """
+
+    def __init__(self, factory, max_size=16, timeout=30, health_check_interval=60):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._waiters = deque()
+        self._size = 0
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'closed': 0,
+            'recycled': 0,
+            'health_check_failures': 0
+        }
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds when all are in use"""
+        waiter = None
+        with self._lock:
+            self._stats['checkouts'] += 1
+            if self._idle and not self._waiters:
+                conn, returned_at = self._idle.pop()
+            elif self._size < self.max_size and not self._waiters:
+                conn, returned_at = None, None
+                self._size += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                self._stats['waits'] += 1
+
+        if waiter is not None:
+            conn, returned_at = self._wait(waiter)
+
+        if conn is not None and time.monotonic() - returned_at > self.health_check_interval:
+            if not self._ping(conn):
+                self._close(conn)
+                with self._lock:
+                    self._stats['closed'] += 1
+                    self._stats['health_check_failures'] += 1
+                conn = None
+
+        if conn is None:
+            # A slot is reserved for us; fill it with a new connection
+            try:
+                conn = self.factory()
+            except Exception:
+                self._free_slot()
+                raise
+            with self._lock:
+                self._stats['created'] += 1
+        return conn
+
+    def _wait(self, waiter):
+        started = time.perf_counter()
+        handed_off = waiter.event.wait(self.timeout)
+        with self._lock:
+            self._stats['wait_seconds'] += time.perf_counter() - started
+            if not handed_off and waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._stats['timeouts'] += 1
+                raise PoolTimeout('Database is busy. Please retry in a moment.')
+        # Either a connection or, with conn None, a free slot was handed to us
+        return waiter.conn, waiter.returned_at
+
+    def release(self, conn, error=None):
+        """Return a connection; it is closed instead when `error` broke it"""
+        if error is not None and is_connection_error(error):
+            self._discard(conn)
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.returned_at = time.monotonic()
+                waiter.event.set()
+            else:
+                self._idle.append((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Context manager form of acquire/release"""
+        conn = self.acquire()
+        error = None
+        try:
+            yield conn
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(conn, error)
+
+    def _ping(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            self._stats['closed'] += 1
+            self._stats['recycled'] += 1
+        self._free_slot()
+
+    def _free_slot(self):
+        # Pass the slot to the next waiter, who will open a connection in it
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.event.set()
+            else:
+                self._size -= 1
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones are unaffected"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    def abandon(self):
+        """Forget every connection without closing it; used in a freshly forked child.
+
+        The lock is replaced rather than taken, since a parent thread may
+        have held it at the moment of the fork.
+        """
+        abandoned = [conn for conn, _ in self._idle]
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._waiters = deque()
+        self._size = 0
+        self._stats = self._empty_stats()
+        return abandoned
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['waiting'] = len(self._waiters)
+            stats['max_size'] = self.max_size
+        stats['wait_seconds'] = round(stats['wait_seconds'], 6)
+        return stats
@@ -3,40 +3,69 @@ HR Service Module
 Handles employee management, profiles, and HR-related operations
 """
 
-from modules.database import execute_query
+from modules.database import bulk_write, execute_query, iter_query, transaction
+from modules.pagination import ListQuery, Page
+from modules.session_cache import session_cache
+from modules.session_tokens import session_tokens
 from datetime import datetime
 import uuid
 
+INSERT_EMPLOYEE_QUERY = '''
+    INSERT INTO employees 
+    (employee_id, first_name, last_name, email, phone, position, 
+     department, hire_date, base_salary)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+EMPLOYEE_COLUMNS = {
+    name: name for name in (
+        'id', 'employee_id', 'first_name', 'last_name', 'email', 'phone', 'position',
+        'department', 'hire_date', 'base_salary', 'status', 'created_at'
+    )
+}
+
+# Active employees by name, served from idx_employees_status_name
+EMPLOYEE_LIST = ListQuery(
+    EMPLOYEE_COLUMNS,
+    'FROM employees',
+    ('last_name', 'first_name', 'id')
+)
+
+# Active employees first, then the rest, each by name
+ALL_EMPLOYEES_LIST = ListQuery(
+    EMPLOYEE_COLUMNS,
+    'FROM employees',
+    ('inactive', 'last_name', 'first_name', 'id'),
+    sort_columns={'inactive': "CASE WHEN status = 'active' THEN 0 ELSE 1 END"}
+)
+
 class HRService:
     def __init__(self):
         pass
 
+    def generate_employee_id(self):
+        """Generate a unique employee ID"""
+        return f"EMP{str(uuid.uuid4())[:8].upper()}"
+
+    def employee_params(self, employee_id, employee_data):
+        """INSERT parameters for one employee"""
+        return (
+            employee_id,
+            employee_data['first_name'],
+            employee_data['last_name'],
+            employee_data['email'],
+            employee_data.get('phone', ''),
+            employee_data['position'],
+            employee_data.get('department', ''),
+            employee_data['hire_date'],
+            employee_data['base_salary']
+        )
+
     def add_employee(self, employee_data):
         """Add a new employee to the system"""
         try:
-            # Generate unique employee ID
-            employee_id = f"EMP{str(uuid.uuid4())[:8].upper()}"
-            
-            query = '''
-                INSERT INTO employees 
-                (employee_id, first_name, last_name, email, phone, position, 
-                 department, hire_date, base_salary)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            
-            params = (
-                employee_id,
-                employee_data['first_name'],
-                employee_data['last_name'],
-                employee_data['email'],
-                employee_data.get('phone', ''),
-                employee_data['position'],
-                employee_data.get('department', ''),
-                employee_data['hire_date'],
-                employee_data['base_salary']
-            )
-            
-            execute_query(query, params)
+            employee_id = self.generate_employee_id()
+            execute_query(INSERT_EMPLOYEE_QUERY, self.employee_params(employee_id, employee_data))
             
             return {
                 'success': True,
@@ -50,7 +79,35 @@ class HRService:
                 'message': f'Error adding employee: {str(e)}'
             }
 
-    def get_all_employees(self, include_inactive: bool = False):
+    def bulk_add_employees(self, employees):
+        """Add many employees in one transaction.
+
+        `employees` can be any iterable of add_employee dicts and is read in
+        batches. Rows that fail are reported by position in 'errors' and
+        skipped; 'employee_ids' lines up with the input, None for failures.
+        """
+        employee_ids = []
+
+        def prepare(employee_data):
+            employee_id = self.generate_employee_id()
+            employee_ids.append(employee_id)
+            return self.employee_params(employee_id, employee_data)
+
+        try:
+            result = bulk_write(INSERT_EMPLOYEE_QUERY, employees, prepare)
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Error adding employees: {str(e)}'
+            }
+
+        if not result['errors_truncated']:
+            for error in result['errors']:
+                employee_ids[error['index']] = None
+            result['employee_ids'] = employee_ids
+        return dict(result, success=True, message=f"Added {result['written']} employees")
+
+    def get_all_employees(self, include_inactive: bool = False, stream: bool = False, page: Page = None):
         """Get employees.
 
         Default behavior is to return only active employees so deactivated
@@ -58,29 +115,31 @@ class HRService:
 
         Set include_inactive=True when you explicitly want both active and
         inactive employees.
+
+        Set stream=True to get 'employees' as a row iterator that the server
+        can stream instead of a list.
+
+        `page` (from EMPLOYEE_LIST.parse_page) selects fields and, when it
+        has a limit, returns one page as a list plus a 'next' cursor.
         """
+        page = page or Page()
         try:
             if include_inactive:
-                query = '''
-                    SELECT * FROM employees
-                    ORDER BY
-                        CASE WHEN status = 'active' THEN 0 ELSE 1 END,
-                        last_name,
-                        first_name
-                '''
-                employees = execute_query(query)
+                employees, next_cursor = ALL_EMPLOYEES_LIST.fetch(
+                    page, stream_query=iter_query if stream else None
+                )
             else:
-                query = '''
-                    SELECT * FROM employees
-                    WHERE status = 'active'
-                    ORDER BY last_name, first_name
-                '''
-                employees = execute_query(query)
-            
-            return {
+                employees, next_cursor = EMPLOYEE_LIST.fetch(
+                    page, "status = 'active'", stream_query=iter_query if stream else None
+                )
+
+            result = {
                 'success': True,
                 'employees': employees
             }
+            if page.limit is not None:
+                result['next'] = next_cursor
+            return result
             
         except Exception as e:
             return {
@@ -135,6 +194,7 @@ class HRService:
             rows_affected = execute_query(query, params)
             
             if rows_affected > 0:
+                session_cache.invalidate_employee(employee_id)
                 return {
                     'success': True,
                     'message': 'Employee updated successfully'
@@ -158,6 +218,7 @@ class HRService:
             rows_affected = execute_query(query, ('inactive', employee_id))
             
             if rows_affected > 0:
+                session_cache.invalidate_employee(employee_id)
                 return {
                     'success': True,
                     'message': 'Employee deactivated successfully'
@@ -182,16 +243,23 @@ class HRService:
         the employee_id to avoid orphaned data.
         """
         try:
-            # Delete dependent records first
-            execute_query('DELETE FROM payroll WHERE employee_id = ?', (employee_id,))
-            execute_query('DELETE FROM attendance WHERE employee_id = ?', (employee_id,))
-            execute_query('DELETE FROM users WHERE employee_id = ?', (employee_id,))
-            execute_query('DELETE FROM pending_registrations WHERE employee_id = ?', (employee_id,))
+            # One transaction, so a failure part way leaves nothing half-deleted
+            with transaction():
+                # Delete dependent records first
+                execute_query('DELETE FROM payroll WHERE employee_id = ?', (employee_id,))
+                execute_query('DELETE FROM attendance WHERE employee_id = ?', (employee_id,))
+                accounts = execute_query('SELECT id FROM users WHERE employee_id = ?', (employee_id,))
+                execute_query('DELETE FROM users WHERE employee_id = ?', (employee_id,))
+                execute_query('DELETE FROM pending_registrations WHERE employee_id = ?', (employee_id,))
 
-            # Delete the employee record
-            rows_affected = execute_query('DELETE FROM employees WHERE employee_id = ?', (employee_id,))
+                # Delete the employee record
+                rows_affected = execute_query('DELETE FROM employees WHERE employee_id = ?', (employee_id,))
 
             if rows_affected > 0:
+                session_cache.invalidate_employee(employee_id)
+                # Signed session tokens of the deleted accounts would otherwise stay valid
+                for account in accounts:
+                    session_tokens.revoke_user(account['id'])
                 return {
                     'success': True,
                     'message': 'Employee deleted permanently'
@@ -0,0 +1,114 @@
+"""
+HTTP Server Module
+Bounded worker-pool HTTP server used for concurrent request handling
+"""
+
+import queue
+import threading
+from http.server import HTTPServer
+from modules.database import open_thread_connection, close_thread_connection
+
+_STOP = object()
+
+_BUSY_BODY = b'{"success": false, "message": "Server is busy. Please retry shortly."}'
+_BUSY_RESPONSE = (
+    b'HTTP/1.0 503 Service Unavailable\r\n'
+    b'Content-Type: application/json\r\n'
+    b'Content-Length: ' + str(len(_BUSY_BODY)).encode() + b'\r\n'
+    b'Retry-After: 1\r\n'
+    b'Connection: close\r\n'
+    b'\r\n' + _BUSY_BODY
+)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands accepted connections to a fixed pool of worker threads.
+
+    Accepted connections wait in a queue of at most ``queue_size`` entries.
+    When the queue is full the connection is answered with 503 straight away
+    instead of piling up behind slow requests. Each worker owns one SQLite
+    connection for its whole lifetime.
+    """
+
+    def __init__(self, server_address, handler_class, workers=8, queue_size=128,
+                 bind_and_activate=True):
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        if queue_size < 1:
+            raise ValueError('queue_size must be at least 1')
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self.request_queue_size = max(queue_size, 5)
+        self.rejected_requests = 0
+        self.handled_connections = 0
+        self._count_lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._closed = False
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self._start_workers()
+
+    def _start_workers(self):
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f'teamroll-worker-{index}',
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker_loop(self):
+        open_thread_connection()
+        try:
+            while True:
+                item = self._pending.get()
+                if item is _STOP:
+                    break
+
+                request, client_address = item
+                with self._count_lock:
+                    self.handled_connections += 1
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+        finally:
+            close_thread_connection()
+
+    def process_request(self, request, client_address):
+        """Queue the connection for a worker, or reject it when the queue is full"""
+        try:
+            self._pending.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected_requests += 1
+            self.reject_request(request)
+            self.shutdown_request(request)
+
+    def reject_request(self, request):
+        """Answer an over-capacity connection with 503"""
+        try:
+            request.sendall(_BUSY_RESPONSE)
+        except OSError:
+            pass
+
+    def queued_requests(self):
+        """Number of accepted connections waiting for a worker"""
+        return self._pending.qsize()
+
+    def server_close(self, timeout=10):
+        """Stop accepting, let queued requests finish, then stop the workers"""
+        if self._closed:
+            return
+        self._closed = True
+
+        super().server_close()
+
+        for _ in self._threads:
+            self._pending.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -0,0 +1,103 @@
+"""
+JSON Stream Module
+Compact JSON encoding and chunk-by-chunk encoding of responses that contain row iterators
+"""
+
+import json
+from collections.abc import Iterator
+
+# Streamed output is flushed to the socket in pieces of roughly this many bytes
+STREAM_CHUNK_SIZE = 16 * 1024
+
+_compact_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def encode_json(data, pretty=False):
+    """Encode a fully materialized value; compact unless pretty output is requested"""
+    if pretty:
+        return json.dumps(data, indent=2).encode('utf-8')
+    return _compact_encoder.encode(data).encode('utf-8')
+
+
+def wants_pretty(query):
+    """Whether the parsed query string asks for indented JSON with ?pretty=1"""
+    return query.get('pretty', [''])[0].lower() in ('1', 'true', 'yes')
+
+
+def contains_stream(data):
+    """Whether a response envelope holds row iterators that can be streamed.
+
+    Iterators are only looked for as dict values, which is where the
+    services place them; list contents are not walked.
+    """
+    if isinstance(data, Iterator):
+        return True
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, (dict, Iterator)) and contains_stream(value):
+                return True
+    return False
+
+
+def materialize(data):
+    """Replace row iterators with lists so the value can be encoded in one go"""
+    if isinstance(data, Iterator):
+        return list(data)
+    if isinstance(data, dict):
+        return {key: materialize(value) for key, value in data.items()}
+    return data
+
+
+def close_streams(data):
+    """Close any row iterators left unconsumed so their connections are released"""
+    if isinstance(data, Iterator):
+        close = getattr(data, 'close', None)
+        if close:
+            close()
+    elif isinstance(data, dict):
+        for value in data.values():
+            close_streams(value)
+
+
+def iter_json(data, chunk_size=STREAM_CHUNK_SIZE):
+    """Encode `data` to compact JSON as a sequence of byte chunks.
+
+    Row iterators are consumed one row at a time, so memory use stays
+    bounded by the chunk size rather than the number of rows.
+    """
+    buffer = []
+    size = 0
+    for piece in _iter_pieces(data):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _iter_pieces(data):
+    if isinstance(data, Iterator):
+        yield '['
+        first = True
+        for item in data:
+            if not first:
+                yield ','
+            first = False
+            yield _compact_encoder.encode(item)
+        yield ']'
+    elif isinstance(data, dict) and contains_stream(data):
+        yield '{'
+        first = True
+        for key, value in data.items():
+            if not first:
+                yield ','
+            first = False
+            yield _compact_encoder.encode(str(key))
+            yield ':'
+            yield from _iter_pieces(value)
+        yield '}'
+    else:
+        yield _compact_encoder.encode(data)
@@ -0,0 +1,383 @@
+"""
+Maintenance Module
+Background scheduler for session cleanup, WAL checkpoints, ANALYZE, incremental vacuum and backups
+"""
+
+import argparse
+import fcntl
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import closing
+
+from modules import database
+
+# Expired sessions are deleted this many rows per statement, so each
+# write transaction stays short and logins wait at most one batch
+SESSION_CLEANUP_BATCH = 500
+SESSION_CLEANUP_MAX_BATCHES = 20
+SESSION_CLEANUP_PAUSE = 0.05
+
+# A WAL larger than this is checkpointed with TRUNCATE, which waits for
+# readers and resets the file; smaller ones get a PASSIVE checkpoint
+CHECKPOINT_TRUNCATE_BYTES = 64 * 1024 * 1024
+# Maintenance connections give up on a lock sooner than request connections
+MAINTENANCE_BUSY_TIMEOUT_MS = 1000
+
+# Rows ANALYZE samples per index; keeps a run cheap on large tables
+ANALYSIS_LIMIT = 1000
+
+# Free pages returned to the file system per incremental_vacuum statement
+VACUUM_STEP_PAGES = 512
+VACUUM_MAX_STEPS = 8
+VACUUM_MIN_FREE_PAGES = 256
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class Job:
+    """One periodic task and the outcome of its latest run"""
+
+    def __init__(self, name, function, interval, jitter=0.1, initial_delay=None):
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = interval if initial_delay is None else initial_delay
+        self.lock = threading.Lock()
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    def schedule(self, delay):
+        # Jitter keeps jobs with equal intervals from always running together
+        spread = delay * self.jitter
+        self.next_run = time.monotonic() + max(0.0, delay + random.uniform(-spread, spread))
+
+
+class MaintenanceScheduler:
+    """Runs registered jobs on one background thread, one job at a time.
+
+    Every process of a deployment starts a scheduler, but only the one
+    holding an exclusive lock on `lock_path` runs jobs; the others retry
+    the lock every `leader_retry` seconds and take over when the leader
+    exits. A job that is still running, e.g. started by hand from the admin
+    API, is skipped rather than run twice. Each job returns a dict; a
+    numeric 'backlog' in it is exported as a gauge.
+    """
+
+    def __init__(self, lock_path=None, leader_retry=30.0):
+        self.lock_path = lock_path
+        self.leader_retry = leader_retry
+        self.enabled = False
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock_fd = None
+
+    def configure(self, enabled=True, lock_path=None):
+        self.enabled = enabled
+        self.lock_path = lock_path
+
+    def add(self, name, function, interval, jitter=0.1, initial_delay=None):
+        """Register a job run every `interval` seconds (0 or less disables it)"""
+        with self._lock:
+            if interval and interval > 0:
+                self._jobs[name] = Job(name, function, interval, jitter, initial_delay)
+            else:
+                self._jobs.pop(name, None)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def start(self):
+        """Start the scheduler thread in this process, if enabled and not running"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # A forked child shares the parent's lock file description;
+                # closing the copy leaves the parent's lock in place
+                if self._lock_fd is not None:
+                    os.close(self._lock_fd)
+                self._lock_fd = None
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._thread = None
+        self._wake.set()
+        thread.join(timeout)
+
+    @property
+    def is_leader(self):
+        return self._lock_fd is not None and self._pid == os.getpid()
+
+    def _try_lead(self):
+        lock_path = self.lock_path or f'{database.DATABASE_PATH}.maintenance.lock'
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _run(self):
+        wake = self._wake
+        while self._thread is threading.current_thread():
+            if not self.is_leader and not self._try_lead():
+                wake.wait(self.leader_retry)
+                continue
+
+            now = time.monotonic()
+            next_due = now + self.leader_retry
+            for job in self.jobs():
+                if job.next_run is None:
+                    job.schedule(job.initial_delay)
+                if job.next_run <= now:
+                    self._execute(job)
+                    job.schedule(job.interval)
+                next_due = min(next_due, job.next_run)
+            wake.wait(max(0.0, next_due - time.monotonic()))
+
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _execute(self, job):
+        if not job.lock.acquire(blocking=False):
+            return False
+        try:
+            job.last_started_at = time.time()
+            started = time.perf_counter()
+            try:
+                job.last_result = job.function()
+                job.last_error = None
+            except Exception as e:
+                job.failures += 1
+                job.last_error = str(e)
+                print(f"Maintenance job {job.name} failed: {e}")
+            job.runs += 1
+            job.last_duration = time.perf_counter() - started
+            return True
+        finally:
+            job.lock.release()
+
+    def run_now(self, name):
+        """Run a job in the calling thread; returns its status, or None when it is already running"""
+        job = self._jobs.get(name)
+        if job is None:
+            raise KeyError(name)
+        if not self._execute(job):
+            return None
+        return self._job_status(job)
+
+    @staticmethod
+    def _job_status(job):
+        next_in = None if job.next_run is None else max(0.0, round(job.next_run - time.monotonic(), 1))
+        return {
+            'name': job.name,
+            'interval_seconds': job.interval,
+            'running': job.lock.locked(),
+            'runs': job.runs,
+            'failures': job.failures,
+            'last_started_at': job.last_started_at,
+            'last_duration_seconds': None if job.last_duration is None else round(job.last_duration, 6),
+            'last_result': job.last_result,
+            'last_error': job.last_error,
+            'next_run_in_seconds': next_in
+        }
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'leader': self.is_leader,
+            'jobs': [self._job_status(job) for job in self.jobs()]
+        }
+
+    def render_metrics(self):
+        """Job counters and gauges in the Prometheus text format"""
+        jobs = self.jobs()
+        lines = [
+            '# HELP teamroll_maintenance_leader Whether this process runs the maintenance jobs.',
+            '# TYPE teamroll_maintenance_leader gauge',
+            f'teamroll_maintenance_leader {int(self.is_leader)}',
+            '# HELP teamroll_maintenance_runs_total Maintenance job runs by result.',
+            '# TYPE teamroll_maintenance_runs_total counter'
+        ]
+        for job in jobs:
+            lines.append(f'teamroll_maintenance_runs_total{{job="{job.name}",result="success"}} {job.runs - job.failures}')
+            lines.append(f'teamroll_maintenance_runs_total{{job="{job.name}",result="failure"}} {job.failures}')
+        lines += [
+            '# HELP teamroll_maintenance_last_duration_seconds Time taken by the latest run of each job.',
+            '# TYPE teamroll_maintenance_last_duration_seconds gauge'
+        ]
+        lines += [
+            f'teamroll_maintenance_last_duration_seconds{{job="{job.name}"}} {job.last_duration:.6f}'
+            for job in jobs if job.last_duration is not None
+        ]
+        lines += [
+            '# HELP teamroll_maintenance_backlog Work left after the latest run: expired sessions, '
+            'WAL bytes or free pages, depending on the job.',
+            '# TYPE teamroll_maintenance_backlog gauge'
+        ]
+        lines += [
+            f'teamroll_maintenance_backlog{{job="{job.name}"}} {job.last_result["backlog"]}'
+            for job in jobs if isinstance(job.last_result, dict) and 'backlog' in job.last_result
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+# Jobs
+
+def _connection():
+    conn = database.get_db_connection()
+    conn.execute(f'PRAGMA busy_timeout = {MAINTENANCE_BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def _wal_size():
+    try:
+        return os.path.getsize(f'{database.DATABASE_PATH}-wal')
+    except FileNotFoundError:
+        return 0
+
+
+def cleanup_sessions():
+    """Delete expired sessions and token revocations in short batches"""
+    from modules.app_container import get_container
+
+    auth_service = get_container().auth_service
+    deleted = auth_service.cleanup_expired_sessions(
+        batch_size=SESSION_CLEANUP_BATCH,
+        max_batches=SESSION_CLEANUP_MAX_BATCHES,
+        pause=SESSION_CLEANUP_PAUSE
+    )
+    return {'deleted': deleted, 'backlog': auth_service.count_expired_sessions()}
+
+
+def checkpoint_wal(truncate_bytes=CHECKPOINT_TRUNCATE_BYTES):
+    """Copy WAL frames back into the database; TRUNCATE once the WAL has grown large"""
+    size = _wal_size()
+    mode = 'TRUNCATE' if size >= truncate_bytes else 'PASSIVE'
+    with closing(_connection()) as conn:
+        busy, wal_frames, checkpointed = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+    return {
+        'mode': mode,
+        'busy': bool(busy),
+        'wal_bytes_before': size,
+        'frames_not_checkpointed': max(0, wal_frames - checkpointed),
+        'backlog': _wal_size()
+    }
+
+
+def analyze():
+    """Refresh the query planner's statistics with a bounded sample per index"""
+    with closing(_connection()) as conn:
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        conn.commit()
+        stats = conn.execute('SELECT COUNT(*) FROM sqlite_stat1').fetchone()[0]
+    return {'indexes_analyzed': stats}
+
+
+def incremental_vacuum():
+    """Return free pages to the file system, a few hundred pages per statement"""
+    with closing(_connection()) as conn:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        free = before
+        if mode == 2 and free >= VACUUM_MIN_FREE_PAGES:
+            for _ in range(VACUUM_MAX_STEPS):
+                # execute() steps this pragma only once, freeing a single
+                # page; executescript runs it to completion
+                conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})')
+                free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if free < VACUUM_STEP_PAGES:
+                    break
+    return {'auto_vacuum': AUTO_VACUUM_MODES.get(mode, mode), 'freed_pages': before - free, 'backlog': free}
+
+
+def take_backup():
+    """Scheduled snapshot through the backup manager"""
+    from modules.backup import backups
+
+    snapshot = backups.create_snapshot()
+    return {'name': snapshot['name'], 'size_bytes': snapshot['size_bytes']}
+
+
+def schedule_backups(interval):
+    """Snapshot every `interval` seconds, counting from the newest snapshot on disk.
+
+    A restart then does not postpone the next backup by a whole interval,
+    nor take an extra one.
+    """
+    from modules.backup import backups, snapshot_time
+
+    delay = 60
+    snapshots = backups.list_snapshots()
+    if snapshots:
+        age = time.time() - snapshot_time(snapshots[0]['name']).timestamp()
+        delay = max(delay, interval - age)
+    maintenance.add('backup', take_backup, interval, jitter=0.02, initial_delay=delay)
+
+
+def enable_incremental_vacuum():
+    """Switch an existing database to auto_vacuum=INCREMENTAL; rewrites the whole file.
+
+    New databases are created in this mode. For an existing one this runs
+    a full VACUUM, which blocks writers until it finishes, so run it while
+    the server is stopped.
+    """
+    with closing(database.get_db_connection()) as conn:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return AUTO_VACUUM_MODES[conn.execute('PRAGMA auto_vacuum').fetchone()[0]]
+
+
+maintenance = MaintenanceScheduler()
+maintenance.add('expired_sessions', cleanup_sessions, 60)
+maintenance.add('wal_checkpoint', checkpoint_wal, 30)
+maintenance.add('analyze', analyze, 6 * 3600, initial_delay=60)
+maintenance.add('incremental_vacuum', incremental_vacuum, 3600, initial_delay=300)
+
+
+def main(argv=None):
+    """python -m modules.maintenance [--db FILE] {run JOB,enable-incremental-vacuum}"""
+    parser = argparse.ArgumentParser(description='TeamRoll database maintenance')
+    parser.add_argument('--db', default=database.DATABASE_PATH, help='database file (default: %(default)s)')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    run = subcommands.add_parser('run', help='run one job now')
+    run.add_argument('job', choices=[job.name for job in maintenance.jobs()])
+    subcommands.add_parser('enable-incremental-vacuum', help='rewrite the database with incremental auto-vacuum')
+    args = parser.parse_args(argv)
+
+    database.DATABASE_PATH = args.db
+    if args.command == 'run':
+        print(maintenance.run_now(args.job))
+    else:
+        print(f'auto_vacuum is now {enable_incremental_vacuum()}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Metrics Module
+Per-route request counts, latency and DB time histograms in Prometheus text format
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds; an implicit +Inf bucket catches everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Label used for requests that matched no route, so unknown paths cannot
+# create unbounded numbers of series
+UNMATCHED_ROUTE = 'unmatched'
+
+METRICS_PATH = '/metrics'
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# DB time spent by the request running on the current thread
+_request_state = threading.local()
+
+
+def reset_db_time():
+    """Start accumulating DB time for a new request on this thread"""
+    _request_state.db_seconds = 0.0
+    _request_state.db_queries = 0
+
+
+def add_db_time(seconds):
+    """Charge time spent inside SQLite to the request on this thread"""
+    try:
+        _request_state.db_seconds += seconds
+        _request_state.db_queries += 1
+    except AttributeError:
+        # Queries outside a request (warm-up, maintenance) are not attributed
+        pass
+
+
+def take_db_time():
+    """(seconds, queries) accumulated since reset_db_time, or None outside a request"""
+    seconds = getattr(_request_state, 'db_seconds', None)
+    if seconds is None:
+        return None
+    queries = _request_state.db_queries
+    del _request_state.db_seconds
+    del _request_state.db_queries
+    return seconds, queries
+
+
+class Histogram:
+    """Cumulative-bucket histogram; callers hold the registry lock"""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """Request counters and histograms keyed by route template, not raw path"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.in_flight = 0
+        self._requests = {}
+        self._latency = {}
+        self._db_time = {}
+        self._db_queries = {}
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method, route, status, duration, db_time=None):
+        """Record one completed request; `db_time` is (seconds, queries) or None"""
+        key = (method or 'UNKNOWN', route or UNMATCHED_ROUTE)
+        with self._lock:
+            self.in_flight -= 1
+
+            status_key = key + (str(status),)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = Histogram(LATENCY_BUCKETS)
+            latency.observe(duration)
+
+            if db_time is not None:
+                seconds, queries = db_time
+                histogram = self._db_time.get(key)
+                if histogram is None:
+                    histogram = self._db_time[key] = Histogram(DB_TIME_BUCKETS)
+                histogram.observe(seconds)
+                self._db_queries[key] = self._db_queries.get(key, 0) + queries
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._latency.clear()
+            self._db_time.clear()
+            self._db_queries.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            in_flight = self.in_flight
+            requests = sorted(self._requests.items())
+            latency = [(key, _copy(histogram)) for key, histogram in sorted(self._latency.items())]
+            db_time = [(key, _copy(histogram)) for key, histogram in sorted(self._db_time.items())]
+            db_queries = sorted(self._db_queries.items())
+
+        lines = [
+            '# HELP teamroll_http_requests_in_flight Requests currently being served by this process.',
+            '# TYPE teamroll_http_requests_in_flight gauge',
+            f'teamroll_http_requests_in_flight {in_flight}',
+            '# HELP teamroll_process_start_time_seconds Start time of this process since the Unix epoch.',
+            '# TYPE teamroll_process_start_time_seconds gauge',
+            f'teamroll_process_start_time_seconds {self.started_at:.3f}',
+            '# HELP teamroll_http_requests_total Completed requests by route template and status code.',
+            '# TYPE teamroll_http_requests_total counter'
+        ]
+        for (method, route, status), count in requests:
+            lines.append(f'teamroll_http_requests_total{{{_labels(method, route)},status="{status}"}} {count}')
+
+        lines.append('# HELP teamroll_http_request_duration_seconds Time from request line to last byte sent.')
+        lines.append('# TYPE teamroll_http_request_duration_seconds histogram')
+        for (method, route), histogram in latency:
+            _render_histogram(lines, 'teamroll_http_request_duration_seconds', _labels(method, route), histogram)
+
+        lines.append('# HELP teamroll_http_request_db_seconds Time spent in SQLite per request.')
+        lines.append('# TYPE teamroll_http_request_db_seconds histogram')
+        for (method, route), histogram in db_time:
+            _render_histogram(lines, 'teamroll_http_request_db_seconds', _labels(method, route), histogram)
+
+        lines.append('# HELP teamroll_db_queries_total SQLite statements and fetches run by requests.')
+        lines.append('# TYPE teamroll_db_queries_total counter')
+        for (method, route), count in db_queries:
+            lines.append(f'teamroll_db_queries_total{{{_labels(method, route)}}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.bounds)
+    copy.counts = list(histogram.counts)
+    copy.total = histogram.total
+    copy.count = histogram.count
+    return copy
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(method, route):
+    return f'method="{_escape(method)}",route="{_escape(route)}"'
+
+
+def _render_histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+
+request_metrics = RequestMetrics()
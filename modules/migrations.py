@@ -0,0 +1,200 @@
+"""
+Migrations Module
+Ordered, versioned schema changes applied on top of the base tables from init_database
+"""
+
+import time
+
+
+class Migration:
+    """One schema version: SQL strings or callables taking the connection.
+
+    Steps must be idempotent (IF NOT EXISTS and the like) so a step that
+    was applied by hand, or by a process that died before recording the
+    version, can safely run again.
+    """
+
+    __slots__ = ('version', 'description', 'steps')
+
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+def _dedupe_attendance(conn):
+    # Keep the most complete row per employee and day: checked out beats
+    # checked in beats a bare leave entry, then the oldest row wins
+    removed = conn.execute('''
+        DELETE FROM attendance WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY employee_id, date
+                    ORDER BY check_out IS NULL, check_in IS NULL, id
+                ) AS position
+                FROM attendance
+            )
+            WHERE position > 1
+        )
+    ''').rowcount
+    if removed:
+        print(f"Removed {removed} duplicate attendance rows before adding the unique index")
+
+
+PAYROLL_MONEY_COLUMNS = ('base_salary', 'bonuses', 'deductions', 'gross_pay', 'tax_deductions', 'net_pay')
+
+
+def _payroll_to_cents(conn):
+    # Rebuild payroll with INTEGER cent columns; REAL affinity would turn
+    # integers written into the old columns straight back into floats
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(payroll)')}
+    if 'gross_pay_cents' in columns:
+        return
+
+    conn.execute('''
+        CREATE TABLE payroll_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id TEXT NOT NULL,
+            pay_period_start DATE NOT NULL,
+            pay_period_end DATE NOT NULL,
+            base_salary_cents INTEGER NOT NULL,
+            bonuses_cents INTEGER NOT NULL DEFAULT 0,
+            deductions_cents INTEGER NOT NULL DEFAULT 0,
+            gross_pay_cents INTEGER NOT NULL,
+            tax_deductions_cents INTEGER NOT NULL,
+            net_pay_cents INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (employee_id) REFERENCES employees (employee_id)
+        )
+    ''')
+    cents = ', '.join(f'CAST(ROUND(COALESCE({column}, 0) * 100) AS INTEGER)' for column in PAYROLL_MONEY_COLUMNS)
+    # Dates are normalized to YYYY-MM-DD so range predicates compare correctly;
+    # values DATE() cannot parse are kept as they are
+    copied = conn.execute(f'''
+        INSERT INTO payroll_new
+        SELECT id, employee_id,
+               COALESCE(DATE(pay_period_start), pay_period_start),
+               COALESCE(DATE(pay_period_end), pay_period_end),
+               {cents}, status, created_at
+        FROM payroll
+    ''').rowcount
+
+    # Keep ids of deleted payslips from being handed out again
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'payroll'").fetchone()
+    conn.execute('DROP TABLE payroll')
+    conn.execute('ALTER TABLE payroll_new RENAME TO payroll')
+    if sequence:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'payroll'", (sequence[0],))
+    if copied:
+        print(f"Converted {copied} payroll rows to integer cents")
+
+
+MIGRATIONS = [
+    Migration(1, 'Indexes for hot lookups and sorts', [
+        'CREATE INDEX IF NOT EXISTS idx_employees_status_name ON employees (status, last_name, first_name)',
+        'CREATE INDEX IF NOT EXISTS idx_payroll_employee_created ON payroll (employee_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_payroll_created_date ON payroll (DATE(created_at))',
+        'CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)',
+        'CREATE INDEX IF NOT EXISTS idx_users_employee ON users (employee_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)',
+        'CREATE INDEX IF NOT EXISTS idx_pending_registrations_employee ON pending_registrations (employee_id)',
+        'CREATE INDEX IF NOT EXISTS idx_pending_registrations_status ON pending_registrations (status, created_at)'
+    ]),
+    Migration(2, 'One attendance row per employee per day', [
+        _dedupe_attendance,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_employee_date ON attendance (employee_id, date)'
+    ]),
+    Migration(3, 'Payroll money in integer cents, range-searchable dates', [
+        _payroll_to_cents,
+        # The rebuild dropped the old payroll indexes, including the
+        # DATE(created_at) expression index that range predicates replace
+        'DROP INDEX IF EXISTS idx_payroll_created_date',
+        'CREATE INDEX IF NOT EXISTS idx_payroll_employee_created ON payroll (employee_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_payroll_created ON payroll (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_payroll_period_start ON payroll (pay_period_start)'
+    ]),
+    Migration(4, 'Revocation list for signed session tokens', [
+        # AUTOINCREMENT ids never go backwards, so processes can fetch new
+        # revocations with id > last seen even after old rows are deleted
+        '''
+        CREATE TABLE IF NOT EXISTS token_revocations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jti TEXT,
+            user_id INTEGER NOT NULL,
+            issued_before INTEGER,
+            expires_at INTEGER NOT NULL,
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_token_revocations_expires ON token_revocations (expires_at)'
+    ]),
+    Migration(5, 'Shared counters for cross-process cache invalidation', [
+        'CREATE TABLE IF NOT EXISTS shared_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)',
+        "INSERT OR IGNORE INTO shared_counters (name, value) VALUES ('session_cache', 0)"
+    ])
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(conn):
+    """Highest applied migration version, 0 for a database without any"""
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, migrations=None):
+    """Apply every migration newer than the database's version.
+
+    Costs a single query when the schema is current. Each migration runs
+    in its own BEGIN IMMEDIATE transaction and re-reads the version inside
+    it, so processes starting together apply each step exactly once.
+    Returns the versions applied.
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    _ensure_version_table(conn)
+    conn.commit()
+
+    latest = migrations[-1].version if migrations else 0
+    if current_version(conn) >= latest:
+        return []
+
+    applied = []
+    for migration in migrations:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= migration.version:
+                conn.rollback()
+                continue
+
+            started = time.perf_counter()
+            for step in migration.steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (migration.version, migration.description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied.append(migration.version)
+        print(f"Applied migration {migration.version}: {migration.description} "
+              f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+    return applied
@@ -0,0 +1,43 @@
+"""
+Money Module
+Whole-cent integer amounts for storage and SQL sums, converted to decimal amounts at the API boundary
+"""
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+CENTS_SUFFIX = '_cents'
+
+
+def to_cents(amount):
+    """Whole cents for an amount given as a number or numeric string, rounding half up"""
+    try:
+        value = Decimal(str(amount).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {amount!r}')
+    if not value.is_finite():
+        raise ValueError(f'Invalid amount: {amount!r}')
+    return int(value.scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Decimal amount for JSON responses; None stays None (e.g. SUM over no rows)"""
+    if cents is None:
+        return None
+    return cents / 100
+
+
+def percent_of(cents, rate):
+    """`rate` (e.g. 0.062) of an amount in cents, rounded half up to whole cents"""
+    return int((Decimal(cents) * Decimal(str(rate))).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def cents_to_amounts(row):
+    """Copy of a row with every `<name>_cents` column replaced by a `<name>` amount"""
+    converted = {}
+    for key, value in row.items():
+        if key.endswith(CENTS_SUFFIX):
+            converted[key[:-len(CENTS_SUFFIX)]] = from_cents(value)
+        else:
+            converted[key] = value
+    return converted
+
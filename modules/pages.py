@@ -0,0 +1,57 @@
+"""
+Pages Module
+Maps page URLs to templates and decides access, shared by every server front end
+"""
+
+PUBLIC_PAGES = {
+    '/': 'templates/index.html',
+    '/index.html': 'templates/index.html',
+    '/login': 'templates/login.html',
+    '/register': 'templates/register.html'
+}
+
+# URL -> (template for admins, template for employees); None means forbidden for that role
+PRIVATE_PAGES = {
+    '/dashboard': ('templates/admin_dashboard.html', 'templates/employee_dashboard.html'),
+    '/employees': ('templates/employees.html', None),
+    '/payroll': ('templates/payroll.html', 'templates/employee_payroll.html'),
+    '/attendance': ('templates/attendance.html', 'templates/attendance.html'),
+    '/admin/registrations': ('templates/admin_registrations.html', None)
+}
+
+NO_STORE_HEADERS = [
+    ('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0'),
+    ('Pragma', 'no-cache'),
+    ('Expires', '0')
+]
+
+
+def is_public_page(path):
+    return path in PUBLIC_PAGES
+
+
+def is_known_page(path):
+    return path in PUBLIC_PAGES or path in PRIVATE_PAGES
+
+
+def resolve_page(path, user):
+    """Return (status, template_path) for a page request.
+
+    Status is 200 with a template, 302 when a private page is requested
+    without a session, 403 when the user's role may not see the page and
+    404 for unknown pages.
+    """
+    if path in PUBLIC_PAGES:
+        return 200, PUBLIC_PAGES[path]
+
+    if not user:
+        return 302, None
+
+    templates = PRIVATE_PAGES.get(path)
+    if templates is None:
+        return 404, None
+
+    template_path = templates[0] if user['role'] == 'admin' else templates[1]
+    if template_path is None:
+        return 403, None
+    return 200, template_path
@@ -0,0 +1,157 @@
+"""
+Pagination Module
+Keyset pagination with opaque cursors and column projection for list queries
+"""
+
+import base64
+import binascii
+import json
+
+from modules.database import execute_query, map_rows
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PageError(ValueError):
+    """A bad limit, cursor or fields parameter; the client gets a 400"""
+
+
+class Page:
+    """What one list request asked for.
+
+    `limit` is None for an unpaginated request, which returns every row.
+    `after` holds the sort key values of the last row already seen and
+    `fields` the projected columns, or None for all of them.
+    """
+
+    __slots__ = ('limit', 'after', 'fields')
+
+    def __init__(self, limit=None, after=None, fields=None):
+        self.limit = limit
+        self.after = after
+        self.fields = fields
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise PageError('Invalid cursor')
+    if not isinstance(values, list) or not all(
+        isinstance(value, (str, int, float)) for value in values
+    ):
+        raise PageError('Invalid cursor')
+    return values
+
+
+class ListQuery:
+    """A list SELECT whose columns, keyset condition and LIMIT are chosen per request.
+
+    `columns` maps response field names to SQL expressions, in response
+    order, and `source` is the FROM clause with any joins. `sort_key` names
+    the NOT NULL fields that order the rows, ending in a unique one so the
+    order is total; `sort_columns` adds sort-only expressions that are
+    never returned. The key is compared as one row value, so every part
+    sorts in the same direction, and a page starts with an index search
+    instead of skipping OFFSET rows. `convert` is applied to each row.
+    """
+
+    def __init__(self, columns, source, sort_key, descending=False, sort_columns=None, convert=None):
+        self.columns = columns
+        self.source = source
+        self.sort_key = sort_key
+        self.descending = descending
+        self.convert = convert
+        self._expressions = dict(columns, **(sort_columns or {}))
+
+    def parse_page(self, limit=None, cursor=None, fields=None):
+        """Page from raw query string values; raises PageError for bad ones"""
+        if limit is None and not cursor:
+            page_size = None
+        else:
+            try:
+                page_size = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+            except ValueError:
+                raise PageError('limit must be a whole number')
+            if page_size < 1:
+                raise PageError('limit must be at least 1')
+            page_size = min(page_size, MAX_PAGE_SIZE)
+
+        after = None
+        if cursor:
+            after = decode_cursor(cursor)
+            if len(after) != len(self.sort_key):
+                raise PageError('Invalid cursor')
+
+        selected = None
+        if fields:
+            selected = list(dict.fromkeys(name.strip() for name in fields.split(',') if name.strip()))
+            for name in selected:
+                if name not in self.columns:
+                    raise PageError(f'Unknown field: {name}')
+        return Page(page_size, after, selected or None)
+
+    def sql(self, page, where=None, params=()):
+        """(statement, parameters) for a page of rows matching `where`"""
+        selected = list(page.fields or self.columns)
+        if page.limit is not None:
+            # The next cursor is read from the last row, so the key is always selected
+            selected += [name for name in self.sort_key if name not in selected]
+
+        params = list(params)
+        conditions = [f'({where})'] if where else []
+        keys = [self._expressions[name] for name in self.sort_key]
+        if page.after is not None:
+            operator = '<' if self.descending else '>'
+            placeholders = ', '.join('?' for _ in keys)
+            conditions.append(f"({', '.join(keys)}) {operator} ({placeholders})")
+            params.extend(page.after)
+
+        statement = 'SELECT ' + ', '.join(f'{self._expressions[name]} AS {name}' for name in selected)
+        statement += ' ' + self.source
+        if conditions:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        direction = ' DESC' if self.descending else ''
+        statement += ' ORDER BY ' + ', '.join(key + direction for key in keys)
+        if page.limit is not None:
+            # One extra row tells whether there is a next page
+            statement += ' LIMIT ?'
+            params.append(page.limit + 1)
+        return statement, tuple(params)
+
+    def fetch(self, page, where=None, params=(), run_query=execute_query, stream_query=None):
+        """(rows, next cursor) for one page; the cursor is None on the last page.
+
+        An unpaginated request returns every row, as an iterator from
+        `stream_query` when one is given; a page is always a list.
+        """
+        statement, params = self.sql(page, where, params)
+
+        if page.limit is None:
+            if stream_query is not None:
+                rows = stream_query(statement, params)
+                return (map_rows(self.convert, rows) if self.convert else rows), None
+            rows = run_query(statement, params)
+            return [self.convert(row) for row in rows] if self.convert else rows, None
+
+        rows = run_query(statement, params)
+        next_cursor = None
+        if len(rows) > page.limit:
+            rows = rows[:page.limit]
+            next_cursor = encode_cursor([rows[-1][name] for name in self.sort_key])
+
+        # Sort key parts selected only for the cursor, e.g. sort-only
+        # expressions, are left out so a page has the same fields as a full list
+        returned = page.fields or self.columns
+        if any(name not in returned for name in self.sort_key):
+            rows = [{name: row[name] for name in returned} for row in rows]
+        if self.convert:
+            rows = [self.convert(row) for row in rows]
+        return rows, next_cursor
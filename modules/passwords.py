@@ -0,0 +1,233 @@
+"""
+Passwords Module
+Versioned scrypt password hashes computed on a process pool, with upgrade of legacy SHA-256 hashes
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+HASH_VERSION = 1
+DEFAULT_SCRYPT_N = 2 ** 14
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+DEFAULT_HASH_WORKERS = min(4, os.cpu_count() or 1)
+# Hashes allowed in flight per process, queued ones included; a login
+# that cannot get a slot within DEFAULT_HASH_WAIT seconds is turned away
+DEFAULT_MAX_CONCURRENT_HASHES = 4 * DEFAULT_HASH_WORKERS
+DEFAULT_HASH_WAIT = 5.0
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Every hashing slot is taken; the client should retry shortly"""
+
+
+def _scrypt(password, salt, n, r, p):
+    # Module level so the process pool can pickle it
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_BYTES)
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def encode_hash(salt, key, n, r, p):
+    """`$scrypt$v=1$n=..,r=..,p=..$<salt>$<key>`, in the PHC string style"""
+    return f'$scrypt$v={HASH_VERSION}$n={n},r={r},p={p}${_b64encode(salt)}${_b64encode(key)}'
+
+
+def decode_hash(stored):
+    """(salt, key, n, r, p) of an encoded hash, or None for anything else"""
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[1] != 'scrypt' or parts[2] != f'v={HASH_VERSION}':
+        return None
+    try:
+        params = dict(item.split('=', 1) for item in parts[3].split(','))
+        return _b64decode(parts[4]), _b64decode(parts[5]), int(params['n']), int(params['r']), int(params['p'])
+    except (KeyError, ValueError, binascii.Error):
+        return None
+
+
+def is_legacy_hash(stored):
+    """Unsalted SHA-256 hex digest from before versioned hashes"""
+    return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+
+def hash_password(password, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P):
+    """Encoded scrypt hash computed in the calling thread, e.g. for the default admin account"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    return encode_hash(salt, _scrypt(password, salt, n, r, p), n, r, p)
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a pool of `workers` processes.
+
+    scrypt is meant to cost tens of milliseconds of CPU and 16 MB of
+    memory per hash; on worker processes that cost never competes with
+    request threads for the interpreter. At most `max_concurrent` hashes
+    per process are in flight or queued, and a caller that cannot get a
+    slot within `wait` seconds gets PasswordHasherBusy instead of adding
+    to the backlog. With `workers` of 0 hashes run in the calling thread.
+    Pool workers start from a fork server and import the main module, so
+    a script that logs users in needs an `if __name__ == '__main__'` guard,
+    as server.py has.
+
+    `verify` also reports when a stored hash should be replaced: legacy
+    SHA-256 digests, and scrypt hashes made with other parameters.
+    """
+
+    def __init__(self, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P,
+                 workers=DEFAULT_HASH_WORKERS, max_concurrent=DEFAULT_MAX_CONCURRENT_HASHES,
+                 wait=DEFAULT_HASH_WAIT):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._stats = self._empty_stats()
+        self._apply(n, r, p, workers, max_concurrent, wait)
+
+    @staticmethod
+    def _empty_stats():
+        return {'hashes': 0, 'rejected': 0, 'in_flight': 0, 'hash_seconds': 0.0}
+
+    def configure(self, n=DEFAULT_SCRYPT_N, r=DEFAULT_SCRYPT_R, p=DEFAULT_SCRYPT_P,
+                  workers=DEFAULT_HASH_WORKERS, max_concurrent=DEFAULT_MAX_CONCURRENT_HASHES,
+                  wait=DEFAULT_HASH_WAIT):
+        # Bad parameters fail here, at startup, rather than on the first login
+        _scrypt('', b'', n, r, p)
+        self._apply(n, r, p, workers, max_concurrent, wait)
+
+    def _apply(self, n, r, p, workers, max_concurrent, wait):
+        with self._lock:
+            self.n, self.r, self.p = n, r, p
+            self.workers = workers
+            self.max_concurrent = max(1, max_concurrent)
+            self.wait = wait
+            self._slots = threading.BoundedSemaphore(self.max_concurrent)
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _pool(self):
+        # Created on first use, and again in a forked child, where the
+        # parent's worker processes are not ours
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # forkserver: forking this multi-threaded process directly
+                # could copy a lock held by another thread
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def shutdown(self):
+        """Stop this process's pool workers, e.g. when its server closes.
+
+        Pool workers do not notice their parent exiting, so a process that
+        ends without this leaves them and the fork server behind.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            owned = self._pid == os.getpid()
+        if executor is not None and owned:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _compute(self, password, salt, n, r, p):
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PasswordHasherBusy('Too many sign-ins in progress. Please retry in a moment.')
+
+        started = time.perf_counter()
+        with self._lock:
+            self._stats['in_flight'] += 1
+        try:
+            if self.workers <= 0:
+                return _scrypt(password, salt, n, r, p)
+            try:
+                return self._pool().submit(_scrypt, password, salt, n, r, p).result()
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool next time
+                with self._lock:
+                    self._executor = None
+                return _scrypt(password, salt, n, r, p)
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats['hashes'] += 1
+                self._stats['hash_seconds'] += time.perf_counter() - started
+            self._slots.release()
+
+    def hash(self, password):
+        """Encoded hash of a new password with the current parameters"""
+        salt = secrets.token_bytes(SALT_BYTES)
+        n, r, p = self.n, self.r, self.p
+        return encode_hash(salt, self._compute(password, salt, n, r, p), n, r, p)
+
+    def verify(self, password, stored):
+        """(matches, needs_rehash) for a password against a stored hash"""
+        if is_legacy_hash(stored):
+            digest = hashlib.sha256(password.encode('utf-8')).hexdigest()
+            return hmac.compare_digest(digest, stored), True
+
+        decoded = decode_hash(stored)
+        if decoded is None:
+            return False, False
+        salt, key, n, r, p = decoded
+        matches = hmac.compare_digest(self._compute(password, salt, n, r, p), key)
+        return matches, matches and (n, r, p) != (self.n, self.r, self.p)
+
+    def verify_unknown(self, password):
+        """Same work as a real check, for usernames that do not exist.
+
+        Failed logins then take as long whether or not the account exists.
+        """
+        self._compute(password, b'\0' * SALT_BYTES, self.n, self.r, self.p)
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['max_concurrent'] = self.max_concurrent
+        stats['params'] = {'n': self.n, 'r': self.r, 'p': self.p}
+        stats['average_ms'] = round(stats['hash_seconds'] / stats['hashes'] * 1000, 2) if stats['hashes'] else 0
+        stats['hash_seconds'] = round(stats['hash_seconds'], 6)
+        return stats
+
+    def render_metrics(self):
+        """Hashing counters in the Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            '# HELP teamroll_password_hashes_total Password hashes computed or turned away for lack of a slot.',
+            '# TYPE teamroll_password_hashes_total counter',
+            f"teamroll_password_hashes_total{{result=\"computed\"}} {stats['hashes']}",
+            f"teamroll_password_hashes_total{{result=\"rejected\"}} {stats['rejected']}",
+            '# HELP teamroll_password_hash_seconds_total Time spent waiting for password hashes.',
+            '# TYPE teamroll_password_hash_seconds_total counter',
+            f"teamroll_password_hash_seconds_total {stats['hash_seconds']}",
+            '# HELP teamroll_password_hashes_in_flight Password hashes being computed or queued.',
+            '# TYPE teamroll_password_hashes_in_flight gauge',
+            f"teamroll_password_hashes_in_flight {stats['in_flight']}"
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+password_hasher = PasswordHasher()
@@ -3,9 +3,57 @@ Payroll Service Module
 Handles payroll processing, calculations, and payslip generation
 """
 
-from modules.database import execute_query
-from datetime import datetime, timedelta
-import calendar
+from modules.database import bulk_write, execute_query, iter_query, iter_report_query, report_query
+from modules.money import cents_to_amounts, from_cents, percent_of, to_cents
+from modules.pagination import ListQuery, Page
+from datetime import date, datetime, timedelta
+
+INSERT_PAYROLL_QUERY = '''
+    INSERT INTO payroll 
+    (employee_id, pay_period_start, pay_period_end, base_salary_cents, 
+     bonuses_cents, deductions_cents, gross_pay_cents, tax_deductions_cents, net_pay_cents)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+PAYROLL_MONEY_FIELDS = ('base_salary', 'bonuses', 'deductions', 'gross_pay', 'tax_deductions', 'net_pay')
+
+def payroll_amounts(row):
+    """Payroll list row with its money fields converted from cents"""
+    return {
+        name: from_cents(value) if name in PAYROLL_MONEY_FIELDS else value
+        for name, value in row.items()
+    }
+
+# Payroll with the employee's name, newest first. Money fields are selected
+# from their cent columns under the response names and converted per row.
+PAYROLL_LIST = ListQuery(
+    dict(
+        {name: f'p.{name}' for name in ('id', 'employee_id', 'pay_period_start', 'pay_period_end')},
+        **{name: f'p.{name}_cents' for name in PAYROLL_MONEY_FIELDS},
+        status='p.status',
+        created_at='p.created_at',
+        first_name="COALESCE(e.first_name, 'Deleted')",
+        last_name="COALESCE(e.last_name, 'Employee')",
+        position='e.position'
+    ),
+    'FROM payroll p LEFT JOIN employees e ON p.employee_id = e.employee_id',
+    ('created_at', 'id'),
+    descending=True,
+    convert=payroll_amounts
+)
+
+def parse_date(value, field):
+    """YYYY-MM-DD form of a date field, so stored dates compare correctly as ranges"""
+    try:
+        return date.fromisoformat(str(value).strip()[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f'{field} must be a date in YYYY-MM-DD format')
+
+def month_window(year, month):
+    """[first day, first day of next month) as YYYY-MM-DD strings"""
+    if month == 12:
+        return f'{year:04d}-12-01', f'{year + 1:04d}-01-01'
+    return f'{year:04d}-{month:02d}-01', f'{year:04d}-{month + 1:02d}-01'
 
 class PayrollService:
     def __init__(self):
@@ -18,10 +66,10 @@ class PayrollService:
         return base_salary + bonuses
 
     def calculate_tax_deductions(self, gross_pay):
-        """Calculate tax deductions"""
-        federal_tax = gross_pay * self.tax_rate
-        social_security = gross_pay * self.social_security_rate
-        medicare = gross_pay * self.medicare_rate
+        """Calculate tax deductions; amounts are in cents, each tax rounded to a whole cent"""
+        federal_tax = percent_of(gross_pay, self.tax_rate)
+        social_security = percent_of(gross_pay, self.social_security_rate)
+        medicare = percent_of(gross_pay, self.medicare_rate)
         
         return {
             'federal_tax': federal_tax,
@@ -34,46 +82,46 @@ class PayrollService:
         """Calculate net pay after all deductions"""
         return gross_pay - tax_deductions - other_deductions
 
+    def calculate_payroll(self, payroll_data):
+        """Compute one payroll entry: (INSERT parameters, payroll details).
+
+        Amounts are converted to cents here and all arithmetic is done on
+        integers; the details are converted back for the response.
+        """
+        employee_id = payroll_data['employee_id']
+        pay_period_start = parse_date(payroll_data['pay_period_start'], 'pay_period_start')
+        pay_period_end = parse_date(payroll_data['pay_period_end'], 'pay_period_end')
+        base_salary = to_cents(payroll_data['base_salary'])
+        bonuses = to_cents(payroll_data.get('bonuses') or 0)
+        other_deductions = to_cents(payroll_data.get('deductions') or 0)
+
+        gross_pay = self.calculate_gross_pay(base_salary, bonuses)
+        tax_breakdown = self.calculate_tax_deductions(gross_pay)
+        net_pay = self.calculate_net_pay(gross_pay, tax_breakdown['total'], other_deductions)
+
+        params = (
+            employee_id, pay_period_start, pay_period_end, base_salary,
+            bonuses, other_deductions, gross_pay, tax_breakdown['total'], net_pay
+        )
+        details = {
+            'employee_id': employee_id,
+            'gross_pay': from_cents(gross_pay),
+            'tax_breakdown': {name: from_cents(cents) for name, cents in tax_breakdown.items()},
+            'other_deductions': from_cents(other_deductions),
+            'net_pay': from_cents(net_pay)
+        }
+        return params, details
+
     def process_payroll(self, payroll_data):
         """Process payroll for employees"""
         try:
-            employee_id = payroll_data['employee_id']
-            pay_period_start = payroll_data['pay_period_start']
-            pay_period_end = payroll_data['pay_period_end']
-            base_salary = float(payroll_data['base_salary'])
-            bonuses = float(payroll_data.get('bonuses', 0))
-            other_deductions = float(payroll_data.get('deductions', 0))
-            
-            # Calculate payroll
-            gross_pay = self.calculate_gross_pay(base_salary, bonuses)
-            tax_breakdown = self.calculate_tax_deductions(gross_pay)
-            net_pay = self.calculate_net_pay(gross_pay, tax_breakdown['total'], other_deductions)
-            
-            # Save to database
-            query = '''
-                INSERT INTO payroll 
-                (employee_id, pay_period_start, pay_period_end, base_salary, 
-                 bonuses, deductions, gross_pay, tax_deductions, net_pay)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            
-            params = (
-                employee_id, pay_period_start, pay_period_end, base_salary,
-                bonuses, other_deductions, gross_pay, tax_breakdown['total'], net_pay
-            )
-            
-            execute_query(query, params)
+            params, details = self.calculate_payroll(payroll_data)
+            execute_query(INSERT_PAYROLL_QUERY, params)
             
             return {
                 'success': True,
                 'message': 'Payroll processed successfully',
-                'payroll_details': {
-                    'employee_id': employee_id,
-                    'gross_pay': gross_pay,
-                    'tax_breakdown': tax_breakdown,
-                    'other_deductions': other_deductions,
-                    'net_pay': net_pay
-                }
+                'payroll_details': details
             }
             
         except Exception as e:
@@ -82,6 +130,26 @@ class PayrollService:
                 'message': f'Error processing payroll: {str(e)}'
             }
 
+    def bulk_process_payroll(self, entries):
+        """Process many payroll entries in one transaction.
+
+        `entries` can be any iterable of process_payroll dicts and is read
+        in batches. Entries that fail are reported by position in 'errors'
+        and skipped; the rest are still written.
+        """
+        try:
+            result = bulk_write(
+                INSERT_PAYROLL_QUERY,
+                entries,
+                lambda payroll_data: self.calculate_payroll(payroll_data)[0]
+            )
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Error processing payroll: {str(e)}'
+            }
+        return dict(result, success=True, message=f"Processed {result['written']} payroll entries")
+
     def approve_payroll(self, payroll_id, approved_by_user_id=None):
         """Approve a pending payroll record.
 
@@ -104,40 +172,52 @@ class PayrollService:
         except Exception as e:
             return {'success': False, 'message': f'Error approving payroll: {str(e)}'}
 
-    def get_payroll_for_employee(self, employee_id):
-        """Get payroll records for a single employee (all history)."""
-        try:
-            query = '''
-                SELECT
-                    p.*,
-                    COALESCE(e.first_name, 'Deleted') AS first_name,
-                    COALESCE(e.last_name, 'Employee') AS last_name,
-                    e.position
-                FROM payroll p
-                LEFT JOIN employees e ON p.employee_id = e.employee_id
-                WHERE p.employee_id = ?
-                ORDER BY p.created_at DESC
-            '''
-            records = execute_query(query, (employee_id,))
+    def get_payroll_for_employee(self, employee_id, stream=False, page=None):
+        """Get payroll records for a single employee (all history).
 
-            total_gross = sum(record['gross_pay'] for record in records)
-            total_net = sum(record['net_pay'] for record in records)
-            total_taxes = sum(record['tax_deductions'] for record in records)
+        The totals are computed in SQL over every record. With stream=True
+        'records' is a row iterator instead of a list; `page` (from
+        PAYROLL_LIST.parse_page) selects fields and, when it has a limit,
+        returns one page plus a 'next' cursor.
+        """
+        page = page or Page()
+        try:
+            totals = self._payroll_totals('WHERE employee_id = ?', (employee_id,))
+            records, next_cursor = PAYROLL_LIST.fetch(
+                page, 'p.employee_id = ?', (employee_id,),
+                stream_query=iter_query if stream else None
+            )
 
-            return {
+            result = {
                 'success': True,
                 'summary': {
-                    'total_payslips': len(records),
-                    'total_gross_pay': total_gross,
-                    'total_net_pay': total_net,
-                    'total_tax_deductions': total_taxes
+                    'total_payslips': totals['count'],
+                    'total_gross_pay': totals['gross'],
+                    'total_net_pay': totals['net'],
+                    'total_tax_deductions': totals['taxes']
                 },
                 'records': records
             }
+            if page.limit is not None:
+                result['next'] = next_cursor
+            return result
         except Exception as e:
             return {'success': False, 'message': f'Error fetching employee payroll: {str(e)}'}
 
-    def get_payroll_summary(self):
+    def _payroll_totals(self, where_clause, params, run_query=execute_query):
+        """Count and money totals over payroll rows matching a WHERE clause"""
+        query = f'''
+            SELECT
+                COUNT(*) AS count,
+                COALESCE(SUM(gross_pay_cents), 0) AS gross_cents,
+                COALESCE(SUM(net_pay_cents), 0) AS net_cents,
+                COALESCE(SUM(tax_deductions_cents), 0) AS taxes_cents
+            FROM payroll
+            {where_clause}
+        '''
+        return cents_to_amounts(run_query(query, params)[0])
+
+    def get_payroll_summary(self, stream=False, page=None):
         """Get payroll summary for current month.
 
         The dashboard and payroll pages are meant to show *recently processed* payrolls.
@@ -146,47 +226,42 @@ class PayrollService:
 
         We also use a LEFT JOIN so payroll records still appear even if an employee record
         was permanently deleted.
+
+        The totals are computed in SQL over the whole month. With stream=True
+        'records' is a row iterator instead of a list; `page` (from
+        PAYROLL_LIST.parse_page) selects fields and, when it has a limit,
+        returns one page plus a 'next' cursor.
+
+        This is a month-wide scan, so it runs on the read-only reporting pool.
         """
+        page = page or Page()
         try:
-            # Current month's date window (server local time)
+            # Current month's date window (server local time); created_at is
+            # 'YYYY-MM-DD HH:MM:SS' text, so a half-open range on the raw
+            # column matches the same rows as DATE(created_at) and uses its index
             current_date = datetime.now()
-            first_day = current_date.replace(day=1)
-            last_day = current_date.replace(
-                day=calendar.monthrange(current_date.year, current_date.month)[1]
-            )
-            
-            query = '''
-                SELECT
-                    p.*,
-                    COALESCE(e.first_name, 'Deleted') AS first_name,
-                    COALESCE(e.last_name, 'Employee') AS last_name,
-                    e.position
-                FROM payroll p
-                LEFT JOIN employees e ON p.employee_id = e.employee_id
-                WHERE DATE(p.created_at) >= ? AND DATE(p.created_at) <= ?
-                ORDER BY p.created_at DESC
-            '''
+            window = month_window(current_date.year, current_date.month)
 
-            payroll_records = execute_query(
-                query,
-                (first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d'))
+            totals = self._payroll_totals('WHERE created_at >= ? AND created_at < ?', window, report_query)
+            records, next_cursor = PAYROLL_LIST.fetch(
+                page, 'p.created_at >= ? AND p.created_at < ?', window,
+                run_query=report_query,
+                stream_query=iter_report_query if stream else None
             )
-            
-            # Calculate totals
-            total_gross = sum(record['gross_pay'] for record in payroll_records)
-            total_net = sum(record['net_pay'] for record in payroll_records)
-            total_taxes = sum(record['tax_deductions'] for record in payroll_records)
-            
-            return {
+
+            result = {
                 'success': True,
                 'summary': {
-                    'total_employees': len(payroll_records),
-                    'total_gross_pay': total_gross,
-                    'total_net_pay': total_net,
-                    'total_tax_deductions': total_taxes
+                    'total_employees': totals['count'],
+                    'total_gross_pay': totals['gross'],
+                    'total_net_pay': totals['net'],
+                    'total_tax_deductions': totals['taxes']
                 },
-                'records': payroll_records
+                'records': records
             }
+            if page.limit is not None:
+                result['next'] = next_cursor
+            return result
             
         except Exception as e:
             return {
@@ -214,7 +289,7 @@ class PayrollService:
             if records:
                 return {
                     'success': True,
-                    'payslip': records[0]
+                    'payslip': cents_to_amounts(records[0])
                 }
             else:
                 return {
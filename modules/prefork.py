@@ -0,0 +1,328 @@
+"""
+Prefork Module
+Runs several server processes on one listening socket under a supervising master
+"""
+
+import json
+import os
+import selectors
+import signal
+import socket
+import threading
+import time
+
+# Where the master publishes aggregated worker health; None outside prefork mode
+HEALTH_PATH = None
+
+DEFAULT_HEALTH_PATH = 'teamroll-workers.json'
+
+
+def create_listen_socket(address, reuse_port=False, backlog=128):
+    """Bind and listen on `address`, optionally with SO_REUSEPORT"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    return sock
+
+
+def read_worker_health(path=None):
+    """Latest health snapshot written by the master, or None when not running prefork"""
+    path = path or HEALTH_PATH
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.pipe = None
+        self.started_at = None
+        self.restarts = 0
+        self.backoff = 0
+        self.respawn_at = 0
+        self.exit_status = None
+        self.heartbeat = {}
+        self.heartbeat_at = None
+        self.buffer = b''
+
+
+class PreforkMaster:
+    """Forks `processes` workers that all accept from the same listening socket.
+
+    ``server_factory(listen_socket)`` builds the HTTP server inside each
+    worker. With ``reuse_port`` every worker binds its own SO_REUSEPORT
+    socket and ``listen_socket`` is None in the factory; otherwise the socket
+    is bound once in the master and inherited across fork. Workers that exit
+    are restarted, with an increasing delay when they keep crashing on
+    startup. Workers report heartbeats over a pipe and the master writes the
+    aggregated snapshot to ``health_path``.
+    """
+
+    def __init__(self, server_factory, address, processes, reuse_port=False,
+                 health_path=DEFAULT_HEALTH_PATH, heartbeat_interval=1.0):
+        if processes < 1:
+            raise ValueError('processes must be at least 1')
+        self.server_factory = server_factory
+        self.address = address
+        self.processes = processes
+        self.reuse_port = reuse_port
+        self.health_path = health_path
+        self.heartbeat_interval = heartbeat_interval
+        self.started_at = time.time()
+        self.listen_socket = None
+        self._workers = [_Worker(index) for index in range(processes)]
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+
+    def serve_forever(self):
+        global HEALTH_PATH
+        HEALTH_PATH = self.health_path
+
+        if self.reuse_port:
+            # Fail fast in the master if the port cannot be bound at all
+            create_listen_socket(self.address, reuse_port=True).close()
+        else:
+            self.listen_socket = create_listen_socket(self.address)
+
+        self._running = True
+        previous_handlers = {
+            signum: signal.signal(signum, self._handle_stop)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+
+        try:
+            for worker in self._workers:
+                self._spawn(worker)
+
+            while self._running:
+                for key, _ in self._selector.select(timeout=self.heartbeat_interval):
+                    self._read_heartbeats(key.data)
+                self._reap()
+                self._respawn_due()
+                self._write_health()
+        finally:
+            self._stop_workers()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            if self.listen_socket is not None:
+                self.listen_socket.close()
+            self._write_health()
+
+    def _handle_stop(self, signum, frame):
+        self._running = False
+
+    def _spawn(self, worker):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._run_worker(write_fd)
+            os._exit(0)
+
+        os.close(write_fd)
+        worker.pid = pid
+        worker.pipe = os.fdopen(read_fd, 'rb', buffering=0)
+        worker.started_at = time.time()
+        worker.heartbeat = {}
+        worker.heartbeat_at = None
+        worker.buffer = b''
+        self._selector.register(worker.pipe, selectors.EVENT_READ, worker)
+
+    def _run_worker(self, health_fd):
+        """Body of a worker process; never returns to the caller's loop"""
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+        self._selector.close()
+        for other in self._workers:
+            if other.pipe is not None:
+                other.pipe.close()
+
+        status = 0
+        httpd = None
+        try:
+            listen_socket = None
+            if self.reuse_port:
+                listen_socket = create_listen_socket(self.address, reuse_port=True)
+            else:
+                listen_socket = self.listen_socket
+            httpd = self.server_factory(listen_socket)
+
+            reporter = threading.Thread(
+                target=_report_health,
+                args=(httpd, health_fd, self.heartbeat_interval),
+                daemon=True
+            )
+            reporter.start()
+            httpd.serve_forever()
+        except SystemExit:
+            pass
+        except Exception as e:
+            print(f"Worker {os.getpid()} crashed: {e}")
+            status = 1
+        finally:
+            if httpd is not None:
+                httpd.server_close()
+        os._exit(status)
+
+    def _read_heartbeats(self, worker):
+        try:
+            data = worker.pipe.read(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self._selector.unregister(worker.pipe)
+            worker.pipe.close()
+            worker.pipe = None
+            return
+
+        worker.buffer += data
+        *lines, worker.buffer = worker.buffer.split(b'\n')
+        for line in lines:
+            try:
+                worker.heartbeat = json.loads(line)
+                worker.heartbeat_at = time.time()
+            except ValueError:
+                continue
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            for worker in self._workers:
+                if worker.pid != pid:
+                    continue
+                worker.pid = None
+                worker.exit_status = os.waitstatus_to_exitcode(status)
+                if worker.pipe is not None:
+                    self._selector.unregister(worker.pipe)
+                    worker.pipe.close()
+                    worker.pipe = None
+                if not self._running:
+                    break
+
+                # Back off when a worker dies right after starting, so a broken
+                # deploy does not turn into a fork loop
+                lifetime = time.time() - worker.started_at
+                if lifetime < 5:
+                    worker.backoff = min(max(worker.backoff * 2, 0.5), 30)
+                else:
+                    worker.backoff = 0
+                worker.respawn_at = time.time() + worker.backoff
+                print(f"Worker {pid} exited with status {worker.exit_status}; "
+                      f"restarting in {worker.backoff:.1f}s")
+
+    def _respawn_due(self):
+        now = time.time()
+        for worker in self._workers:
+            if self._running and worker.pid is None and now >= worker.respawn_at:
+                worker.restarts += 1
+                self._spawn(worker)
+
+    def _stop_workers(self, timeout=10):
+        for worker in self._workers:
+            if worker.pid is not None:
+                try:
+                    os.kill(worker.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        deadline = time.time() + timeout
+        while any(worker.pid is not None for worker in self._workers) and time.time() < deadline:
+            self._reap()
+            time.sleep(0.05)
+
+        for worker in self._workers:
+            if worker.pid is not None:
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                    os.waitpid(worker.pid, 0)
+                except (ProcessLookupError, ChildProcessError):
+                    pass
+                worker.pid = None
+            if worker.pipe is not None:
+                self._selector.unregister(worker.pipe)
+                worker.pipe.close()
+                worker.pipe = None
+
+    def health(self):
+        """Aggregated health of every worker process"""
+        now = time.time()
+        workers = []
+        totals = {'alive': 0, 'connections': 0, 'rejected': 0, 'queued': 0, 'restarts': 0}
+
+        for worker in self._workers:
+            heartbeat = worker.heartbeat
+            alive = worker.pid is not None
+            entry = {
+                'index': worker.index,
+                'pid': worker.pid,
+                'alive': alive,
+                'restarts': worker.restarts,
+                'uptime_seconds': round(now - worker.started_at, 1) if alive else 0,
+                'last_heartbeat_age': round(now - worker.heartbeat_at, 1) if worker.heartbeat_at else None,
+                'last_exit_status': worker.exit_status,
+                'connections': heartbeat.get('connections', 0),
+                'rejected': heartbeat.get('rejected', 0),
+                'queued': heartbeat.get('queued', 0)
+            }
+            workers.append(entry)
+
+            totals['alive'] += 1 if alive else 0
+            totals['restarts'] += worker.restarts
+            for key in ('connections', 'rejected', 'queued'):
+                totals[key] += entry[key]
+
+        return {
+            'master_pid': os.getpid(),
+            'uptime_seconds': round(now - self.started_at, 1),
+            'processes': self.processes,
+            'updated_at': now,
+            'totals': totals,
+            'workers': workers
+        }
+
+    def _write_health(self):
+        if not self.health_path:
+            return
+        temp_path = f'{self.health_path}.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.health(), f)
+            os.replace(temp_path, self.health_path)
+        except OSError as e:
+            print(f"Error writing worker health: {e}")
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def _report_health(httpd, health_fd, interval):
+    """Worker-side heartbeat loop writing one JSON line per interval to the master"""
+    with os.fdopen(health_fd, 'wb', buffering=0) as pipe:
+        while True:
+            heartbeat = {
+                'pid': os.getpid(),
+                'connections': getattr(httpd, 'handled_connections', 0),
+                'rejected': getattr(httpd, 'rejected_requests', 0),
+                'queued': httpd.queued_requests() if hasattr(httpd, 'queued_requests') else 0
+            }
+            try:
+                pipe.write(json.dumps(heartbeat).encode('utf-8') + b'\n')
+            except OSError:
+                return
+            time.sleep(interval)
@@ -0,0 +1,169 @@
+"""
+Query Log Module
+Per-statement timing stats and a rotating slow-query log with EXPLAIN QUERY PLAN output
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_SLOW_QUERY_LOG = 'teamroll-slow-queries.log'
+
+# Distinct normalized statements tracked; the services use a fixed set of
+# queries, so this only guards against dynamically built SQL
+MAX_TRACKED_STATEMENTS = 1000
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+_logger = logging.getLogger('teamroll.slow_queries')
+_logger.propagate = False
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query):
+    """Collapse whitespace and replace literals so equivalent statements group together"""
+    sql = _STRING_LITERAL.sub('?', query)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def param_shape(params):
+    """Types of the bound parameters without their values, e.g. 'str,int'"""
+    if not params:
+        return ''
+    if isinstance(params, dict):
+        return ','.join(f'{name}:{type(value).__name__}' for name, value in params.items())
+    return ','.join(type(value).__name__ for value in params)
+
+
+def explain_query_plan(conn, query, params=None):
+    """EXPLAIN QUERY PLAN details for a statement, one string per plan step"""
+    try:
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + query, params or ()).fetchall()
+    except Exception as e:
+        return [f'(plan unavailable: {e})']
+    return [row[3] for row in rows]
+
+
+def is_full_scan(plan):
+    """Whether a plan reads a whole table rather than searching an index"""
+    return any(step.startswith('SCAN ') and ' USING ' not in step for step in plan)
+
+
+class QueryLog:
+    """Aggregates timings per normalized statement and logs the slow ones.
+
+    Every statement is counted; EXPLAIN QUERY PLAN is only run, and the
+    log only written, when a statement exceeds the slow threshold.
+    """
+
+    def __init__(self, threshold_ms=DEFAULT_SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self.log_path = None
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._handler = None
+
+    def configure(self, threshold_ms=None, log_path=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+        """Set the slow threshold and where slow statements are logged.
+
+        A negative threshold disables slow-query logging; statement stats
+        are still collected.
+        """
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        if log_path and log_path != self.log_path:
+            # delay=True opens the file on first write, after any fork
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            if self._handler is not None:
+                _logger.removeHandler(self._handler)
+                self._handler.close()
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+            self._handler = handler
+            self.log_path = log_path
+
+    def record(self, conn, query, params, seconds, rows):
+        """Account one executed statement; `conn` is used to explain slow ones"""
+        sql = normalize_sql(query)
+        duration_ms = seconds * 1000
+        slow = 0 <= self.threshold_ms <= duration_ms
+
+        plan = None
+        if slow:
+            plan = explain_query_plan(conn, query, params)
+
+        with self._lock:
+            stats = self._statements.get(sql)
+            if stats is None:
+                if len(self._statements) >= MAX_TRACKED_STATEMENTS:
+                    return
+                stats = self._statements[sql] = {
+                    'sql': sql,
+                    'calls': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'rows': 0,
+                    'slow_calls': 0,
+                    'full_scan': None,
+                    'plan': None
+                }
+            stats['calls'] += 1
+            stats['total_ms'] += duration_ms
+            if duration_ms > stats['max_ms']:
+                stats['max_ms'] = duration_ms
+            if rows is not None and rows > 0:
+                stats['rows'] += rows
+            if slow:
+                stats['slow_calls'] += 1
+                stats['plan'] = plan
+                stats['full_scan'] = is_full_scan(plan)
+
+        if slow and self._handler is not None:
+            self._write(sql, params, duration_ms, rows, plan)
+
+    def _write(self, sql, params, duration_ms, rows, plan):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'pid': os.getpid(),
+            'duration_ms': round(duration_ms, 3),
+            'rows': rows,
+            'sql': sql,
+            'params': param_shape(params),
+            'full_scan': is_full_scan(plan),
+            'plan': plan
+        }
+        try:
+            _logger.info(json.dumps(entry))
+        except Exception as e:
+            print(f"Error writing slow query log: {e}")
+
+    def top(self, limit=20, order_by='total_ms'):
+        """Statements with the largest `order_by` value, with average time added"""
+        with self._lock:
+            statements = [dict(stats) for stats in self._statements.values()]
+
+        for stats in statements:
+            stats['avg_ms'] = round(stats['total_ms'] / stats['calls'], 3)
+            stats['total_ms'] = round(stats['total_ms'], 3)
+            stats['max_ms'] = round(stats['max_ms'], 3)
+        statements.sort(key=lambda stats: stats[order_by], reverse=True)
+        return statements[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+
+query_log = QueryLog()
@@ -0,0 +1,164 @@
+"""
+Rate Limit Module
+In-memory token buckets that throttle sign-in routes per client address and per username
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# route -> scope -> (burst, seconds to refill the whole burst)
+DEFAULT_RATE_LIMITS = {
+    'login': {'ip': (20, 60), 'username': (10, 60)},
+    'register': {'ip': (5, 300), 'username': (3, 300)}
+}
+RATE_LIMIT_SCOPES = ('ip', 'username')
+DEFAULT_MAX_BUCKETS = 100000
+
+
+def parse_rate_limit(text):
+    """(route, scope, burst, seconds) from `ROUTE.SCOPE=BURST/SECONDS`; a burst of 0 turns the limit off"""
+    try:
+        target, value = text.split('=', 1)
+        route, scope = target.split('.', 1)
+        if value.strip() == '0':
+            burst, seconds = 0, 0.0
+        else:
+            burst, seconds = value.split('/', 1)
+            burst, seconds = int(burst), float(seconds)
+    except ValueError:
+        raise ValueError(f'expected ROUTE.SCOPE=BURST/SECONDS, got {text!r}') from None
+    if route not in DEFAULT_RATE_LIMITS:
+        raise ValueError(f"unknown route {route!r}; expected one of {', '.join(DEFAULT_RATE_LIMITS)}")
+    if scope not in RATE_LIMIT_SCOPES:
+        raise ValueError(f"unknown scope {scope!r}; expected one of {', '.join(RATE_LIMIT_SCOPES)}")
+    if burst < 0 or (burst and seconds <= 0):
+        raise ValueError(f'burst and seconds must be positive in {text!r}')
+    return route, scope, burst, seconds
+
+
+class RateLimiter:
+    """Token buckets keyed by route, scope and client address or username.
+
+    A bucket holds up to `burst` tokens and refills at `burst / seconds`
+    tokens per second; each request takes one token from every bucket it
+    falls in, and is refused if any of them is empty. A refused request
+    takes nothing, so retrying after the returned wait succeeds.
+
+    Buckets are kept least recently used first. A bucket untouched for
+    its refill time is full again, the same as a new one, so those at the
+    front are dropped as requests come in; `max_buckets` bounds memory
+    when many addresses or usernames are seen within that time. Each
+    process has its own buckets.
+    """
+
+    def __init__(self, limits=None, max_buckets=DEFAULT_MAX_BUCKETS):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._stats = self._empty_stats()
+        self.configure(limits, max_buckets)
+
+    @staticmethod
+    def _empty_stats():
+        return {'allowed': {}, 'throttled': {}, 'evictions': 0}
+
+    def configure(self, limits=None, max_buckets=DEFAULT_MAX_BUCKETS):
+        """`limits` is a list of (route, scope, burst, seconds) overriding the defaults"""
+        merged = {route: dict(scopes) for route, scopes in DEFAULT_RATE_LIMITS.items()}
+        for route, scope, burst, seconds in limits or ():
+            merged[route][scope] = (burst, seconds)
+        with self._lock:
+            self.limits = {
+                route: {scope: limit for scope, limit in scopes.items() if limit[0] > 0}
+                for route, scopes in merged.items()
+            }
+            self.max_buckets = max_buckets
+            self._buckets.clear()
+
+    def check(self, route, **keys):
+        """Take a token for each of `keys` (e.g. ip=..., username=...).
+
+        Returns 0 when the request may proceed, otherwise the seconds until
+        every bucket involved has a token again.
+        """
+        limits = self.limits.get(route)
+        if not limits:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            wait = 0
+            for scope, (burst, seconds) in limits.items():
+                value = keys.get(scope)
+                if value is None:
+                    continue
+                rate = burst / seconds
+                key = (route, scope, value)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = [float(burst), now, seconds]
+                else:
+                    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                    self._buckets.move_to_end(key)
+                if bucket[0] < 1:
+                    wait = max(wait, (1 - bucket[0]) / rate)
+                buckets.append(bucket)
+
+            outcome = 'throttled' if wait else 'allowed'
+            self._stats[outcome][route] = self._stats[outcome].get(route, 0) + 1
+            if not wait:
+                for bucket in buckets:
+                    bucket[0] -= 1
+            self._evict(now)
+            return wait
+
+    def _evict(self, now):
+        # The front bucket was touched longest ago; it goes once it has
+        # had time to refill, or to make room
+        while self._buckets:
+            key, (_, updated_at, seconds) = next(iter(self._buckets.items()))
+            if now - updated_at < seconds and len(self._buckets) <= self.max_buckets:
+                break
+            del self._buckets[key]
+            self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limits': {
+                    route: {scope: {'burst': burst, 'seconds': seconds} for scope, (burst, seconds) in scopes.items()}
+                    for route, scopes in self.limits.items()
+                },
+                'buckets': len(self._buckets),
+                'max_buckets': self.max_buckets,
+                'allowed': dict(self._stats['allowed']),
+                'throttled': dict(self._stats['throttled']),
+                'evictions': self._stats['evictions']
+            }
+
+    def render_metrics(self):
+        """Admission counters in the Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            '# HELP teamroll_rate_limit_requests_total Rate limited requests by route and outcome.',
+            '# TYPE teamroll_rate_limit_requests_total counter'
+        ]
+        for outcome in ('allowed', 'throttled'):
+            for route in sorted(stats['limits']):
+                lines.append(
+                    f"teamroll_rate_limit_requests_total{{route=\"{route}\",outcome=\"{outcome}\"}} "
+                    f"{stats[outcome].get(route, 0)}"
+                )
+        lines += [
+            '# HELP teamroll_rate_limit_evictions_total Buckets dropped after refilling or to stay within the limit.',
+            '# TYPE teamroll_rate_limit_evictions_total counter',
+            f"teamroll_rate_limit_evictions_total {stats['evictions']}",
+            '# HELP teamroll_rate_limit_buckets Token buckets currently kept.',
+            '# TYPE teamroll_rate_limit_buckets gauge',
+            f"teamroll_rate_limit_buckets {stats['buckets']}"
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,214 @@
+"""
+Router Module
+Table-driven routing for the /api endpoints with per-route auth requirements
+"""
+
+import json
+from http import cookies
+
+AUTH_NONE = 'none'
+AUTH_USER = 'user'
+AUTH_ADMIN = 'admin'
+
+AUTH_LEVELS = (AUTH_NONE, AUTH_USER, AUTH_ADMIN)
+
+
+class ApiRequest:
+    """Transport-independent view of one API request.
+
+    The current user is looked up at most once per request and memoized,
+    whether the router or the route handler asks for it first.
+    """
+
+    def __init__(self, app, method, path, query=None, headers=None, body=b'', client_address=None):
+        self.app = app
+        self.method = method
+        self.path = path
+        self.query = query or {}
+        self.headers = headers or {}
+        self.body = body
+        self.client_address = client_address
+        self.route = None
+        self.params = {}
+        self._data = None
+        self._user = None
+        self._user_loaded = False
+
+    @property
+    def session_id(self):
+        """Session ID from the request cookies"""
+        cookie_header = self.headers.get('Cookie')
+        if cookie_header:
+            cookie = cookies.SimpleCookie()
+            cookie.load(cookie_header)
+            if 'session_id' in cookie:
+                return cookie['session_id'].value
+        return None
+
+    @property
+    def user(self):
+        """Authenticated user for this request, or None"""
+        if not self._user_loaded:
+            session_id = self.session_id
+            self._user = self.app.auth_service.verify_session(session_id) if session_id else None
+            self._user_loaded = True
+        return self._user
+
+    @property
+    def data(self):
+        """JSON request body decoded to a dict"""
+        if self._data is None:
+            self._data = json.loads(self.body.decode('utf-8')) if self.body else {}
+        return self._data
+
+    def query_param(self, name, default=None):
+        """First value of a query string parameter"""
+        return self.query.get(name, [default])[0]
+
+
+class ApiResponse:
+    """Status, headers and payload produced by a route handler.
+
+    The payload is encoded as JSON unless `content_type` is given, in which
+    case `data` is a str or bytes body sent as-is.
+    """
+
+    def __init__(self, data=None, status=200, headers=None, content_type=None):
+        self.data = data
+        self.status = status
+        self.headers = headers or []
+        self.content_type = content_type
+
+
+class Route:
+    __slots__ = ('method', 'template', 'handler', 'auth')
+
+    def __init__(self, method, template, handler, auth):
+        self.method = method
+        self.template = template
+        self.handler = handler
+        self.auth = auth
+
+
+class _TrieNode:
+    __slots__ = ('children', 'param_name', 'param_child', 'routes')
+
+    def __init__(self):
+        self.children = {}
+        self.param_name = None
+        self.param_child = None
+        self.routes = {}
+
+
+class Router:
+    """Matches (method, path) to a route.
+
+    Paths without parameters are found with one dict lookup. Templates with
+    ``{name}`` segments live in a trie, so matching costs one step per path
+    segment regardless of how many routes are registered.
+    """
+
+    def __init__(self):
+        self._static = {}
+        self._root = _TrieNode()
+        self.routes = []
+
+    def add(self, method, template, handler, auth=AUTH_NONE):
+        """Register a handler for a method and path template"""
+        if auth not in AUTH_LEVELS:
+            raise ValueError(f'Unknown auth requirement: {auth}')
+
+        route = Route(method, template, handler, auth)
+
+        if '{' not in template:
+            key = (method, template)
+            if key in self._static:
+                raise ValueError(f'Duplicate route: {method} {template}')
+            self._static[key] = route
+        else:
+            node = self._root
+            for segment in template.strip('/').split('/'):
+                if segment.startswith('{') and segment.endswith('}'):
+                    name = segment[1:-1]
+                    if node.param_child is None:
+                        node.param_child = _TrieNode()
+                        node.param_name = name
+                    elif node.param_name != name:
+                        raise ValueError(f'Conflicting parameter name {{{name}}} in {template}')
+                    node = node.param_child
+                else:
+                    node = node.children.setdefault(segment, _TrieNode())
+            if method in node.routes:
+                raise ValueError(f'Duplicate route: {method} {template}')
+            node.routes[method] = route
+
+        self.routes.append(route)
+        return route
+
+    def route(self, method, template, auth=AUTH_NONE):
+        """Decorator form of add()"""
+        def decorator(handler):
+            self.add(method, template, handler, auth)
+            return handler
+        return decorator
+
+    def match(self, method, path):
+        """Return (route, params) for a request, or None when nothing matches"""
+        route = self._static.get((method, path))
+        if route is not None:
+            return route, {}
+
+        params = {}
+        route = self._match_node(self._root, path.strip('/').split('/'), 0, method, params)
+        if route is None:
+            return None
+        return route, params
+
+    def _match_node(self, node, segments, index, method, params):
+        if index == len(segments):
+            return node.routes.get(method)
+
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            route = self._match_node(child, segments, index + 1, method, params)
+            if route is not None:
+                return route
+
+        if node.param_child is not None and segment:
+            route = self._match_node(node.param_child, segments, index + 1, method, params)
+            if route is not None:
+                params[node.param_name] = segment
+                return route
+
+        return None
+
+    def dispatch(self, request):
+        """Route a request, enforce its auth requirement and run the handler.
+
+        Returns an ApiResponse, or None when no route matches.
+        """
+        match = self.match(request.method, request.path)
+        if match is None:
+            return None
+
+        route, params = match
+        request.route = route
+        request.params = params
+
+        try:
+            if route.auth == AUTH_ADMIN:
+                user = request.user
+                if not user or user['role'] != 'admin':
+                    return ApiResponse({'success': False, 'message': 'Admin access required'}, 403)
+            elif route.auth == AUTH_USER:
+                if not request.user:
+                    return ApiResponse({'success': False, 'message': 'Authentication required'}, 401)
+
+            result = route.handler(request)
+        except Exception as e:
+            return ApiResponse({'error': str(e)}, 500)
+
+        if isinstance(result, ApiResponse):
+            return result
+        return ApiResponse(result)
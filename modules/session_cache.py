@@ -0,0 +1,228 @@
+"""
+Session Cache Module
+Bounded LRU cache with expiry for session lookups, including unknown session ids
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from modules.database import execute_query
+
+DEFAULT_SESSION_CACHE_SIZE = 10000
+DEFAULT_SESSION_CACHE_TTL = 30.0
+DEFAULT_NEGATIVE_TTL = 5.0
+DEFAULT_SHARED_CHECK_INTERVAL = 1.0
+
+# Row of shared_counters bumped by every invalidation, in any process
+SHARED_COUNTER = 'session_cache'
+
+
+class SessionCache:
+    """Session id -> user row (or None for an unknown id), least recently used first out.
+
+    Entries live for `ttl` seconds, and ids that matched no session for
+    `negative_ttl`, so a client replaying a stale cookie costs one query
+    per interval instead of one per request. `max_entries` of 0 disables
+    the cache.
+
+    Writes that change what `verify_session` returns call one of the
+    `invalidate*` methods after they commit. A lookup that was already
+    running when an invalidation happened may have read the old row, so
+    `generation()` is taken before the query and `put` drops the result
+    if any invalidation came in between.
+
+    Each process has its own cache. Every invalidation also bumps a
+    counter in the `shared_counters` table, and each process reads it at
+    most every `check_interval` seconds and empties its cache when it has
+    moved, so a logout or account change in one process reaches the
+    others within that interval.
+    """
+
+    def __init__(self, max_entries=DEFAULT_SESSION_CACHE_SIZE, ttl=DEFAULT_SESSION_CACHE_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_TTL, check_interval=DEFAULT_SHARED_CHECK_INTERVAL):
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._stats = self._empty_stats()
+        self.configure(max_entries, ttl, negative_ttl, check_interval)
+
+    @staticmethod
+    def _empty_stats():
+        return {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'shared_clears': 0}
+
+    def configure(self, max_entries=DEFAULT_SESSION_CACHE_SIZE, ttl=DEFAULT_SESSION_CACHE_TTL,
+                  negative_ttl=DEFAULT_NEGATIVE_TTL, check_interval=DEFAULT_SHARED_CHECK_INTERVAL):
+        with self._lock:
+            self.max_entries = max(0, max_entries)
+            self.ttl = ttl
+            self.negative_ttl = negative_ttl
+            self.check_interval = check_interval
+            self._entries.clear()
+            self._generation += 1
+            self._shared_seen = None
+            self._shared_checked_at = None
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def generation(self):
+        """Token to pass to `put`; changes whenever an entry is invalidated"""
+        return self._generation
+
+    def get(self, session_id):
+        """(True, user or None) for a live entry, (False, None) on a miss"""
+        if not self.enabled:
+            return False, None
+        now = time.monotonic()
+        self._sync_shared(now)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[session_id]
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(session_id)
+            self._stats['hits' if entry[1] is not None else 'negative_hits'] += 1
+            return True, entry[1]
+
+    def put(self, session_id, user, generation):
+        """Cache a lookup result unless an invalidation ran since `generation`"""
+        if not self.enabled:
+            return
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[session_id] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _sync_shared(self, now):
+        # One thread reads the counter per interval; the others carry on
+        # with the cache as it is
+        if self._shared_checked_at is not None and now - self._shared_checked_at < self.check_interval:
+            return
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                rows = execute_query('SELECT value FROM shared_counters WHERE name = ?', (SHARED_COUNTER,))
+                value = rows[0]['value'] if rows else None
+            except Exception as e:
+                print(f"Could not read the session cache counter: {e}")
+                value = None
+            # An unreadable counter empties the cache too, so entries never
+            # outlive the interval unchecked
+            if value is None or value != self._shared_seen:
+                with self._lock:
+                    self._generation += 1
+                    if self._entries:
+                        self._stats['shared_clears'] += 1
+                    self._entries.clear()
+            self._shared_seen = value
+            self._shared_checked_at = now
+        finally:
+            self._check_lock.release()
+
+    def _publish(self):
+        # Tells the other processes' caches to drop their entries
+        if not self.enabled:
+            return
+        try:
+            execute_query('UPDATE shared_counters SET value = value + 1 WHERE name = ?', (SHARED_COUNTER,))
+        except Exception as e:
+            print(f"Could not signal a session cache invalidation: {e}")
+
+    def _invalidate_where(self, matches):
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (_, user) in self._entries.items() if user is not None and matches(user)]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale)
+        self._publish()
+
+    def invalidate(self, session_id):
+        """Forget one session, e.g. on logout"""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(session_id, None) is not None:
+                self._stats['invalidations'] += 1
+        self._publish()
+
+    def invalidate_user(self, user_id):
+        """Forget every session of a user account"""
+        self._invalidate_where(lambda user: user['user_id'] == user_id)
+
+    def invalidate_employee(self, employee_id):
+        """Forget every session of the accounts linked to an employee"""
+        self._invalidate_where(lambda user: user['employee_id'] == employee_id)
+
+    def clear(self):
+        """Forget everything, e.g. after the sessions table was replaced"""
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else 0
+        return stats
+
+    def render_metrics(self):
+        """Cache counters in the Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            '# HELP teamroll_session_cache_lookups_total Session lookups by cache result.',
+            '# TYPE teamroll_session_cache_lookups_total counter',
+            f"teamroll_session_cache_lookups_total{{result=\"hit\"}} {stats['hits']}",
+            f"teamroll_session_cache_lookups_total{{result=\"negative_hit\"}} {stats['negative_hits']}",
+            f"teamroll_session_cache_lookups_total{{result=\"miss\"}} {stats['misses']}",
+            '# HELP teamroll_session_cache_evictions_total Entries dropped to stay within the size limit.',
+            '# TYPE teamroll_session_cache_evictions_total counter',
+            f"teamroll_session_cache_evictions_total {stats['evictions']}",
+            '# HELP teamroll_session_cache_invalidations_total Entries dropped by logout, account or employee changes.',
+            '# TYPE teamroll_session_cache_invalidations_total counter',
+            f"teamroll_session_cache_invalidations_total {stats['invalidations']}",
+            '# HELP teamroll_session_cache_shared_clears_total Times the cache was emptied for an invalidation made elsewhere.',
+            '# TYPE teamroll_session_cache_shared_clears_total counter',
+            f"teamroll_session_cache_shared_clears_total {stats['shared_clears']}",
+            '# HELP teamroll_session_cache_entries Sessions currently cached.',
+            '# TYPE teamroll_session_cache_entries gauge',
+            f"teamroll_session_cache_entries {stats['entries']}"
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+session_cache = SessionCache()
+
+
+def read_shared_counter(conn):
+    """The invalidation counter's value in a database, 0 when it has none"""
+    try:
+        row = conn.execute('SELECT value FROM shared_counters WHERE name = ?', (SHARED_COUNTER,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def write_shared_counter(conn, value):
+    """Set the invalidation counter, e.g. past its old value after a restore so every process empties its cache"""
+    conn.execute(
+        'INSERT INTO shared_counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+        (SHARED_COUNTER, value)
+    )
@@ -0,0 +1,369 @@
+"""
+Session Tokens Module
+HMAC-signed session cookies verified without the database, with a shared revocation list and key rotation
+"""
+
+import argparse
+import base64
+import binascii
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+
+from modules.database import execute_query
+
+DEFAULT_KEY_FILE = 'teamroll-session-keys.json'
+DEFAULT_TOKEN_LIFETIME = 24 * 3600
+DEFAULT_REVOCATION_REFRESH = 1.0
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def is_token(session_id):
+    """Whether a session cookie is a signed token rather than a sessions table id.
+
+    Table ids come from token_urlsafe and never contain a dot.
+    """
+    return '.' in session_id
+
+
+class SessionTokens:
+    """Issues and verifies `<key id>.<claims>.<signature>` session tokens.
+
+    The claims are the user id, role, employee id, a random token id
+    (`jti`), and issue and expiry times, signed with HMAC-SHA256. A valid
+    signature and an unexpired `exp` are enough to trust them, so a
+    request is authenticated without a session query.
+
+    Keys live in `key_file`, which every process of a deployment reads.
+    `rotate()` adds a new signing key; older keys keep verifying the
+    tokens they signed until those tokens expire, then they are dropped.
+    Processes look for a rotated file every `refresh_interval` seconds,
+    and at once when they meet an unknown key id.
+
+    Logout and account changes add rows to `token_revocations`: one token
+    by `jti`, or every token a user was issued before a time. Each process
+    keeps the unexpired rows in memory and fetches new ones, by id, at
+    most every `refresh_interval` seconds, so a revocation reaches the
+    other processes within that interval.
+    """
+
+    def __init__(self, key_file=DEFAULT_KEY_FILE, enabled=False, lifetime=DEFAULT_TOKEN_LIFETIME,
+                 refresh_interval=DEFAULT_REVOCATION_REFRESH):
+        self._lock = threading.Lock()
+        self.configure(key_file, enabled, lifetime, refresh_interval)
+
+    def configure(self, key_file=DEFAULT_KEY_FILE, enabled=False, lifetime=DEFAULT_TOKEN_LIFETIME,
+                  refresh_interval=DEFAULT_REVOCATION_REFRESH):
+        """`enabled` makes logins issue tokens and lets requests use them"""
+        with self._lock:
+            self.key_file = key_file
+            self.enabled = enabled
+            self.lifetime = lifetime
+            self.refresh_interval = refresh_interval
+            self._keys = None
+            self._current = None
+            self._key_mtime = None
+            self._keys_checked_at = 0.0
+            self._revoked_ids = {}
+            self._revoked_before = {}
+            self._last_revocation = 0
+            self._refreshed_at = None
+
+    # Keys
+
+    def _read_keys(self):
+        try:
+            with open(self.key_file, encoding='utf-8') as f:
+                data = json.load(f)
+            return data, os.path.getmtime(self.key_file)
+        except FileNotFoundError:
+            return None, None
+
+    def _write_keys(self, data, replace=True):
+        # Written whole and then moved into place, readable by the owner only
+        temp_path = f'{self.key_file}.{os.getpid()}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        if replace:
+            os.replace(temp_path, self.key_file)
+            return
+        # First key: when several processes start at once, one file wins
+        # and every process signs with it
+        try:
+            os.link(temp_path, self.key_file)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+
+    def _load_keys(self, create):
+        data, mtime = self._read_keys()
+        if data is None and not create:
+            data = {'current': None, 'keys': []}
+        elif data is None:
+            data = {'current': None, 'keys': []}
+            self._add_key(data)
+            self._write_keys(data, replace=False)
+            data, mtime = self._read_keys()
+        self._keys = {key['id']: binascii.unhexlify(key['secret']) for key in data['keys']}
+        self._current = data['current']
+        self._key_mtime = mtime
+
+    def _ensure_keys(self, reload=False, create=False):
+        # The file is checked for a rotation by another process at most
+        # every refresh interval, or at once for an unknown key id. Only
+        # issuing a token creates the file; verifying never does, so
+        # requests cannot make a server generate keys
+        now = time.monotonic()
+        if (self._keys is not None and not reload and (self._current or not create)
+                and now - self._keys_checked_at < self.refresh_interval):
+            return self._keys, self._current
+        with self._lock:
+            if self._keys is None or (create and not self._current):
+                self._load_keys(create)
+            else:
+                try:
+                    changed = os.path.getmtime(self.key_file) != self._key_mtime
+                except FileNotFoundError:
+                    changed = False
+                if changed:
+                    self._load_keys(create)
+            self._keys_checked_at = now
+            return self._keys, self._current
+
+    @staticmethod
+    def _add_key(data):
+        now = time.time()
+        for key in data['keys']:
+            if key['id'] == data['current']:
+                key['retired_at'] = now
+        key_id = secrets.token_hex(4)
+        data['keys'].append({'id': key_id, 'secret': secrets.token_hex(32), 'created_at': now, 'retired_at': None})
+        data['current'] = key_id
+        return key_id
+
+    def rotate(self):
+        """Sign new tokens with a fresh key; returns the new key id.
+
+        Keys retired more than one token lifetime ago can no longer have
+        unexpired tokens and are removed.
+        """
+        with self._lock:
+            data, _ = self._read_keys()
+            data = data or {'current': None, 'keys': []}
+            cutoff = time.time() - self.lifetime
+            data['keys'] = [
+                key for key in data['keys']
+                if key['retired_at'] is None or key['retired_at'] > cutoff
+            ]
+            key_id = self._add_key(data)
+            self._write_keys(data)
+            self._load_keys(create=False)
+        return key_id
+
+    def key_ids(self, create=False):
+        """Current and accepted key ids; `create` makes the first key if there is none"""
+        keys, current = self._ensure_keys(create=create)
+        return {'current': current, 'keys': sorted(keys)}
+
+    # Tokens
+
+    def _sign(self, secret, signed_part):
+        return _b64encode(hmac.digest(secret, signed_part.encode('utf-8'), 'sha256'))
+
+    def issue(self, user_id, role, employee_id):
+        """(token, claims) for a user who just logged in"""
+        keys, current = self._ensure_keys(create=True)
+        now = int(time.time())
+        claims = {
+            'jti': secrets.token_urlsafe(12),
+            'uid': user_id,
+            'role': role,
+            'eid': employee_id,
+            'iat': now,
+            'exp': now + self.lifetime
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        signed_part = f'{current}.{payload}'
+        return f'{signed_part}.{self._sign(keys[current], signed_part)}', claims
+
+    def verify(self, token):
+        """Claims of a valid, unexpired, unrevoked token, otherwise None"""
+        if not self.enabled:
+            return None
+        parts = token.split('.')
+        if len(parts) != 3:
+            return None
+        key_id, payload, signature = parts
+
+        keys, _ = self._ensure_keys()
+        if key_id not in keys:
+            # Possibly rotated by another process
+            keys, _ = self._ensure_keys(reload=True)
+            if key_id not in keys:
+                return None
+        if not hmac.compare_digest(signature, self._sign(keys[key_id], f'{key_id}.{payload}')):
+            return None
+
+        try:
+            claims = json.loads(_b64decode(payload))
+        except (binascii.Error, ValueError):
+            return None
+        if claims['exp'] <= time.time() or self.is_revoked(claims):
+            return None
+        return claims
+
+    # Revocation
+
+    def is_revoked(self, claims):
+        self._refresh()
+        if claims['jti'] in self._revoked_ids:
+            return True
+        cutoff = self._revoked_before.get(claims['uid'])
+        return cutoff is not None and claims['iat'] <= cutoff
+
+    def _remember(self, jti, user_id, issued_before, expires_at):
+        if jti is not None:
+            self._revoked_ids[jti] = expires_at
+        elif issued_before > self._revoked_before.get(user_id, 0):
+            self._revoked_before[user_id] = issued_before
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return
+            rows = execute_query(
+                'SELECT id, jti, user_id, issued_before, expires_at FROM token_revocations WHERE id > ? ORDER BY id',
+                (self._last_revocation,)
+            )
+            wall_clock = time.time()
+            for row in rows:
+                if row['expires_at'] > wall_clock:
+                    self._remember(row['jti'], row['user_id'], row['issued_before'], row['expires_at'])
+                self._last_revocation = row['id']
+            # Entries whose tokens have all expired are no longer needed
+            self._revoked_ids = {jti: expires for jti, expires in self._revoked_ids.items() if expires > wall_clock}
+            self._revoked_before = {
+                user_id: cutoff for user_id, cutoff in self._revoked_before.items()
+                if cutoff + self.lifetime > wall_clock
+            }
+            self._refreshed_at = now
+
+    def revoke(self, claims):
+        """Revoke one token, e.g. on logout"""
+        execute_query(
+            'INSERT INTO token_revocations (jti, user_id, expires_at) VALUES (?, ?, ?)',
+            (claims['jti'], claims['uid'], claims['exp'])
+        )
+        with self._lock:
+            self._remember(claims['jti'], claims['uid'], None, claims['exp'])
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to a user so far"""
+        now = int(time.time())
+        expires_at = now + self.lifetime
+        execute_query(
+            'INSERT INTO token_revocations (user_id, issued_before, expires_at) VALUES (?, ?, ?)',
+            (user_id, now, expires_at)
+        )
+        with self._lock:
+            self._remember(None, user_id, now, expires_at)
+
+    def reset_revocations(self):
+        """Forget the revocations held in memory and read the table again in full, e.g. after a restore"""
+        with self._lock:
+            self._revoked_ids = {}
+            self._revoked_before = {}
+            self._last_revocation = 0
+            self._refreshed_at = None
+
+    def cleanup(self):
+        """Delete revocations whose tokens have all expired; returns how many"""
+        return execute_query('DELETE FROM token_revocations WHERE expires_at <= ?', (int(time.time()),))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'revoked_tokens': len(self._revoked_ids),
+                'revoked_users': len(self._revoked_before),
+                'last_revocation_id': self._last_revocation
+            }
+
+
+session_tokens = SessionTokens()
+
+
+def preserve_revocations(conn):
+    """(highest id ever used, unexpired rows) of a database's revocation list.
+
+    Taken from the live database before a restore replaces it, and passed
+    to reapply_revocations afterwards.
+    """
+    try:
+        rows = conn.execute(
+            'SELECT jti, user_id, issued_before, expires_at FROM token_revocations WHERE expires_at > ?',
+            (int(time.time()),)
+        ).fetchall()
+        last_id = conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(id) FROM token_revocations), 0),"
+            " COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'token_revocations'), 0))"
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        # A database from before the revocation table
+        return 0, []
+    return last_id, [tuple(row) for row in rows]
+
+
+def reapply_revocations(conn, preserved):
+    """Put revocations taken by preserve_revocations back after a restore.
+
+    Tokens revoked after the snapshot was taken stay revoked. New
+    revocation ids continue above every id used before the restore, so
+    processes still reading with `id > last seen` do not miss them.
+    """
+    last_id, rows = preserved
+    updated = conn.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'token_revocations'", (last_id,)
+    ).rowcount
+    if not updated and last_id:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('token_revocations', ?)", (last_id,))
+    present = set(conn.execute('SELECT jti, user_id, issued_before FROM token_revocations'))
+    conn.executemany(
+        'INSERT INTO token_revocations (jti, user_id, issued_before, expires_at) VALUES (?, ?, ?, ?)',
+        [row for row in rows if row[:3] not in present]
+    )
+
+
+def main(argv=None):
+    """python -m modules.session_tokens [--key-file FILE] {keys,rotate}"""
+    parser = argparse.ArgumentParser(description='TeamRoll session token keys')
+    parser.add_argument('--key-file', default=DEFAULT_KEY_FILE, help='signing key file (default: %(default)s)')
+    parser.add_argument('command', choices=('keys', 'rotate'))
+    args = parser.parse_args(argv)
+
+    session_tokens.configure(args.key_file)
+    if args.command == 'rotate':
+        print(f'New signing key: {session_tokens.rotate()}')
+    else:
+        print(json.dumps(session_tokens.key_ids(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
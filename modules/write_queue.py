@@ -0,0 +1,211 @@
+"""
+Write Queue Module
+One writer thread applies queued statements and group-commits them
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from modules.db_pool import is_connection_error
+
+_STOP = object()
+
+
+class _Write:
+    __slots__ = ('query', 'params', 'future')
+
+    def __init__(self, query, params):
+        self.query = query
+        self.params = params
+        self.future = Future()
+
+
+class WriteQueue:
+    """Runs INSERT/UPDATE/DELETE statements from any thread on a single writer thread.
+
+    The writer takes everything queued, up to `max_batch` statements, and
+    applies it in one transaction opened by `begin(conn)` and one COMMIT.
+    While a batch commits, new writes queue up and become the next batch,
+    so commits get larger rather than more frequent as load rises, and no
+    two threads of this process ever compete for SQLite's write lock.
+
+    A statement that fails (a constraint, say) is undone on its own by
+    SQLite and only its caller gets the error. Futures are resolved after
+    COMMIT, so no caller sees success for a write that was not committed.
+    `record(conn, query, params, seconds, rows)` is called per statement.
+    """
+
+    def __init__(self, factory, begin, record=None, max_batch=256, max_queue=10000):
+        self.factory = factory
+        self.begin = begin
+        self.record = record
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._pid = None
+        self._conn = None
+        self._stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'statements': 0,
+            'failed': 0,
+            'batches': 0,
+            'largest_batch': 0,
+            'batch_seconds': 0.0,
+            'connections_recycled': 0
+        }
+
+    def submit(self, query, params=None):
+        """Queue a statement; the Future resolves to its rowcount once committed"""
+        self._ensure_started()
+        write = _Write(query, params)
+        try:
+            self._queue.put(write, timeout=30)
+        except queue.Full:
+            raise RuntimeError('Database is busy. Please retry in a moment.')
+        return write.future
+
+    def execute(self, query, params=None):
+        """Queue a statement and wait for it to be committed; returns its rowcount"""
+        return self.submit(query, params).result()
+
+    def _ensure_started(self):
+        # Started on first use, and again in a forked child, where the
+        # parent's writer thread does not exist
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            write = self._queue.get()
+            if write is _STOP:
+                break
+            batch = [write]
+            while len(batch) < self.max_batch:
+                try:
+                    write = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if write is _STOP:
+                    stopping = True
+                    break
+                batch.append(write)
+            self._apply(batch)
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _apply(self, batch):
+        batch = [write for write in batch if write.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        results = []
+        try:
+            if self._conn is None:
+                self._conn = self.factory()
+            conn = self._conn
+            self.begin(conn)
+
+            for write in batch:
+                statement_started = time.perf_counter()
+                try:
+                    cursor = conn.execute(write.query, write.params or ())
+                except sqlite3.Error as exc:
+                    if is_connection_error(exc) or not conn.in_transaction:
+                        # The whole transaction is gone, not just this statement
+                        raise
+                    results.append((write, None, exc))
+                    continue
+                rows = cursor.rowcount
+                if self.record is not None:
+                    self.record(conn, write.query, write.params, time.perf_counter() - statement_started, rows)
+                results.append((write, rows, None))
+
+            conn.commit()
+        except Exception as exc:
+            self._abort(exc)
+            for write in batch:
+                write.future.set_exception(exc)
+            with self._lock:
+                self._stats['statements'] += len(batch)
+                self._stats['failed'] += len(batch)
+            return
+
+        failed = 0
+        for write, rows, exc in results:
+            if exc is None:
+                write.future.set_result(rows)
+            else:
+                failed += 1
+                write.future.set_exception(exc)
+
+        with self._lock:
+            self._stats['statements'] += len(batch)
+            self._stats['failed'] += failed
+            self._stats['batches'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+            self._stats['batch_seconds'] += time.perf_counter() - started
+
+    def _abort(self, exc):
+        conn = self._conn
+        if conn is None:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            pass
+        if is_connection_error(exc):
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+            with self._lock:
+                self._stats['connections_recycled'] += 1
+
+    def stop(self, timeout=10):
+        """Apply what is already queued, then stop the writer thread"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def abandon(self):
+        """Forget the writer in a freshly forked child; returns its connection, if any"""
+        conn = self._conn
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(self.max_queue)
+        self._thread = None
+        self._pid = None
+        self._stats = self._empty_stats()
+        return conn
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['max_batch'] = self.max_batch
+        stats['average_batch'] = round(stats['statements'] / stats['batches'], 2) if stats['batches'] else 0
+        stats['batch_seconds'] = round(stats['batch_seconds'], 6)
+        return stats
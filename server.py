@@ -4,27 +4,177 @@ TeamRoll Server - Main application server
 Handles HTTP requests and routes them to appropriate modules
 """
 
-import json
+import argparse
+import html
+import signal
 import sqlite3
+import time
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 from http import cookies
-import os
-from modules.hr_service import HRService
-from modules.payroll_service import PayrollService
-from modules.accounting_service import AccountingService
-from modules.attendance_service import AttendanceService
-from modules.auth_service import AuthService
+from modules.app_container import get_container
+from modules.assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+from modules.compression import MIN_COMPRESS_SIZE, StreamCompressor, compress, compression_stats, negotiate
+from modules.json_stream import close_streams, contains_stream, encode_json, iter_json, materialize, wants_pretty
+from modules.metrics import METRICS_PATH, request_metrics, reset_db_time, take_db_time
+from modules.api_routes import api_router
+from modules.pages import NO_STORE_HEADERS, is_known_page, is_public_page, resolve_page
+from modules.passwords import (
+    DEFAULT_HASH_WORKERS, DEFAULT_MAX_CONCURRENT_HASHES, DEFAULT_SCRYPT_N, DEFAULT_SCRYPT_P, DEFAULT_SCRYPT_R,
+    password_hasher
+)
+from modules.router import ApiRequest
+from modules.http_server import PooledHTTPServer
+from modules.database import (
+    DEFAULT_POOL_SIZE, DEFAULT_REPORT_POOL_SIZE, DEFAULT_REPORT_TIMEOUT, DEFAULT_WRITE_BATCH_SIZE,
+    close_pools, configure_pool, configure_report_pool, configure_write_queue
+)
+from modules.backup import DEFAULT_BACKUP_DIR, DEFAULT_KEEP_DAILY, DEFAULT_KEEP_LAST, DEFAULT_KEEP_WEEKLY, backups
+from modules.maintenance import maintenance, schedule_backups
+from modules.prefork import DEFAULT_HEALTH_PATH, PreforkMaster
+from modules.query_log import DEFAULT_SLOW_QUERY_LOG, DEFAULT_SLOW_QUERY_MS, query_log
+from modules.rate_limit import DEFAULT_MAX_BUCKETS, parse_rate_limit, rate_limiter
+from modules.session_cache import DEFAULT_SESSION_CACHE_SIZE, DEFAULT_SESSION_CACHE_TTL, session_cache
+from modules.session_tokens import DEFAULT_KEY_FILE, session_tokens
 
 
 class TeamRollHandler(BaseHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        self.hr_service = HRService()
-        self.payroll_service = PayrollService()
-        self.accounting_service = AccountingService()
-        self.attendance_service = AttendanceService()
-        self.auth_service = AuthService()
-        super().__init__(*args, **kwargs)
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # Idle seconds before a kept-alive connection is closed
+    keepalive_timeout = 5
+    # Requests served on one connection before it is closed
+    max_keepalive_requests = 100
+    # Largest unread request body discarded to keep a connection reusable
+    max_drain_bytes = 64 * 1024
+
+    def __init__(self, request, client_address, server):
+        # Services are built once per process and shared by every handler
+        self.app = getattr(server, 'app', None) or get_container()
+        self.hr_service = self.app.hr_service
+        self.payroll_service = self.app.payroll_service
+        self.accounting_service = self.app.accounting_service
+        self.attendance_service = self.app.attendance_service
+        self.auth_service = self.app.auth_service
+        self.requests_on_connection = 0
+        self.route_template = None
+        self._request_parsed = False
+        self._body_consumed = False
+        self._request_started = None
+        self._response_status = None
+        self._current_user = None
+        self._current_user_loaded = False
+        super().__init__(request, client_address, server)
+
+    def setup(self):
+        self.timeout = getattr(self.server, 'keepalive_timeout', self.keepalive_timeout)
+        self.max_keepalive_requests = getattr(self.server, 'max_keepalive_requests', self.max_keepalive_requests)
+        super().setup()
+
+    def handle_one_request(self):
+        self._request_parsed = False
+        self._body_consumed = False
+        self.route_template = None
+        self._request_started = None
+        self._response_status = None
+        self._current_user = None
+        self._current_user_loaded = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self._request_started is not None:
+                self.record_request_metrics()
+
+        # Unread body bytes would be parsed as the next request on this connection
+        if self._request_parsed and not self.close_connection and not self.drain_request_body():
+            self.close_connection = True
+
+    def parse_request(self):
+        # The clock starts once the request line has arrived, so idle
+        # keep-alive time is not counted as latency
+        self._request_started = time.perf_counter()
+        request_metrics.request_started()
+        reset_db_time()
+        self._request_parsed = super().parse_request()
+        return self._request_parsed
+
+    def record_request_metrics(self):
+        """Record latency, status and DB time of the request just served"""
+        duration = time.perf_counter() - self._request_started
+        self._request_started = None
+        request_metrics.request_finished(
+            self.command,
+            self.route_template,
+            self._response_status or 0,
+            duration,
+            take_db_time()
+        )
+
+    def send_response(self, code, message=None):
+        self._response_status = code
+        super().send_response(code, message)
+        self.requests_on_connection += 1
+        if self.requests_on_connection >= self.max_keepalive_requests:
+            self.send_header('Connection', 'close')
+
+    def send_error(self, code, message=None, explain=None):
+        """Send an error page, keeping the connection open when it is safe to"""
+        if not self._request_parsed or not self.request_body_drainable():
+            super().send_error(code, message, explain)
+            return
+
+        try:
+            short_message, long_message = self.responses[code]
+        except KeyError:
+            short_message, long_message = '???', '???'
+        message = message or short_message
+        explain = explain or long_message
+
+        self.log_error('code %d, message %s', code, message)
+        self.send_response(code, message)
+
+        body = b''
+        if code >= 200 and code not in (204, 304):
+            body = (self.error_message_format % {
+                'code': code,
+                'message': html.escape(message, quote=False),
+                'explain': html.escape(explain, quote=False)
+            }).encode('UTF-8', 'replace')
+            self.send_header('Content-Type', self.error_content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+
+    def read_request_body(self):
+        """Read the request body declared by Content-Length"""
+        self._body_consumed = True
+        content_length = self.headers.get('Content-Length')
+        if content_length:
+            return self.rfile.read(int(content_length))
+        return b''
+
+    def request_body_drainable(self):
+        """Whether an unread request body is small enough to discard"""
+        if self._body_consumed:
+            return True
+        if self.headers.get('Transfer-Encoding'):
+            return False
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return False
+        return 0 <= content_length <= self.max_drain_bytes
+
+    def drain_request_body(self):
+        """Discard an unread request body; False when the connection must close"""
+        if not self.request_body_drainable():
+            return False
+        if not self._body_consumed:
+            self.read_request_body()
+        return True
 
     def get_session_id(self):
         """Extract session ID from cookies"""
@@ -37,11 +187,12 @@ class TeamRollHandler(BaseHTTPRequestHandler):
         return None
 
     def get_current_user(self):
-        """Get current authenticated user"""
-        session_id = self.get_session_id()
-        if session_id:
-            return self.auth_service.verify_session(session_id)
-        return None
+        """Get current authenticated user, looked up at most once per request"""
+        if not self._current_user_loaded:
+            session_id = self.get_session_id()
+            self._current_user = self.auth_service.verify_session(session_id) if session_id else None
+            self._current_user_loaded = True
+        return self._current_user
 
     def do_GET(self):
         parsed_path = urlparse(self.path)
@@ -49,8 +200,8 @@ class TeamRollHandler(BaseHTTPRequestHandler):
 
         if path.startswith('/static/'):
             self.serve_static_file(path)
-        elif path.startswith('/api/'):
-            self.handle_api_get(path)
+        elif path.startswith('/api/') or path == METRICS_PATH:
+            self.handle_api('GET', path)
         else:
             self.serve_template(path)
 
@@ -59,7 +210,7 @@ class TeamRollHandler(BaseHTTPRequestHandler):
         path= parsed_path.path
 
         if path.startswith('/api/'):
-            self.handle_api_post(path)
+            self.handle_api('POST', path)
             return
         self.send_error(404)
 
@@ -68,7 +219,7 @@ class TeamRollHandler(BaseHTTPRequestHandler):
         path = parsed_path.path
 
         if path.startswith('/api/'):
-            self.handle_api_put(path)
+            self.handle_api('PUT', path)
             return
         self.send_error(404)
 
@@ -77,317 +228,207 @@ class TeamRollHandler(BaseHTTPRequestHandler):
         path = parsed_path.path
 
         if path.startswith('/api/'):
-            self.handle_api_delete(path)
+            self.handle_api('DELETE', path)
             return
         self.send_error(404)
 
 
     def serve_static_file(self, path):
-        file_path = path[1:]
-
-        if os.path.exists(file_path):
-            if path.endswith('.css'):
-                content_type = 'text/css'
-            elif path.endswith('.js'):
-                content_type = 'application/javascript'
-            else:
-                content_type = 'text/plain'
-
-            self.send_response(200)
-            self.send_header('Content-type', content_type)
+        self.route_template = '/static/{path}'
+        asset, is_hashed_url = self.app.assets.get_static(path)
+        if asset is None:
+            self.send_error(404)
+            return
+
+        cache_control = IMMUTABLE_CACHE_CONTROL if is_hashed_url else REVALIDATE_CACHE_CONTROL
+        self.send_asset(asset, [('Cache-Control', cache_control)])
+
+    def send_asset(self, asset, headers):
+        """Send a cached asset, answering conditional requests with 304"""
+        coding = None
+        if asset.encodings:
+            coding = negotiate(self.headers.get('Accept-Encoding'), asset.encodings)
+            headers = headers + [('Vary', 'Accept-Encoding')]
+
+        if self.app.assets.is_not_modified(asset, self.headers):
+            self.send_response(304)
+            self.send_header('ETag', asset.etag_for(coding))
+            self.send_header('Last-Modified', asset.last_modified)
+            for name, value in headers:
+                self.send_header(name, value)
             self.end_headers()
+            return
+
+        body = asset.encodings[coding] if coding else asset.content
+        size = len(body) if body is not None else asset.size
+
+        self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        self.send_header('Content-Length', str(size))
+        if coding:
+            self.send_header('Content-Encoding', coding)
+        self.send_header('ETag', asset.etag_for(coding))
+        self.send_header('Last-Modified', asset.last_modified)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        compression_stats.record('/' + asset.name, asset.size, size, coding)
 
-            with open(file_path, 'rb') as f:
-                self.wfile.write(f.read())
+        if body is not None:
+            self.wfile.write(body)
         else:
-            self.send_error(404)
+            # Large files go from the page cache to the socket without a userspace copy
+            with open(asset.path, 'rb') as f:
+                self.connection.sendfile(f, 0, asset.size)
 
     def serve_template(self, path):
-        public_pages = ['/', '/index.html', '/login', '/register']
-        is_public = path in public_pages
+        if is_known_page(path):
+            self.route_template = path
+        is_public = is_public_page(path)
+        user = None if is_public else self.get_current_user()
+        status, template_path = resolve_page(path, user)
+
+        if status == 302:
+            self.send_response(302)
+            self.send_header('Location', '/login')
+            for name, value in NO_STORE_HEADERS:
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if status != 200:
+            self.send_error(status)
+            return
+
+        asset = self.app.assets.get(template_path)
+        if asset is None:
+            self.send_error(404)
+            return
 
         if is_public:
-            if path == '/' or path == '/index.html':
-                template_path = 'templates/index.html'
-            elif path == '/login':
-                template_path = 'templates/login.html'
-            elif path == '/register':
-                template_path = 'templates/register.html'
+            headers = [('Cache-Control', REVALIDATE_CACHE_CONTROL)]
         else:
-            user = self.get_current_user()
-            if not user:
-                self.send_response(302)
-                self.send_header('Location', '/login')
-                self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
-                self.send_header('Pragma', 'no-cache')
-                self.send_header('Expires', '0')
-                self.end_headers()
-                return
+            headers = list(NO_STORE_HEADERS)
+        self.send_asset(asset, headers)
+
+    def handle_api(self, method, path):
+        """Dispatch an /api or /metrics request through the route table"""
+        parsed_url = urlparse(self.path)
+
+        body = self.read_request_body()
+
+        request = ApiRequest(
+            self.app,
+            method,
+            path,
+            query=parse_qs(parsed_url.query),
+            headers=self.headers,
+            body=body,
+            client_address=self.client_address
+        )
+        response = api_router.dispatch(request)
+        if response is None:
+            self.send_error(404)
+            return
+        self.route_template = request.route.template
+        self.send_api_response(response)
+
+    def send_api_response(self, response):
+        if response.data is None:
+            self.send_response(response.status)
+            for name, value in response.headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if response.content_type is not None:
+            body = response.data
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.send_body(body, response.status, response.content_type, response.headers)
+            return
+        self.send_json_response(response.data, response.status, response.headers)
 
-            if path == '/dashboard':
-                if user['role'] == 'admin':
-                    template_path = 'templates/admin_dashboard.html'
-                else:
-                    template_path = 'templates/employee_dashboard.html'
-            elif path == '/employees':
-                if user['role'] == 'admin':
-                    template_path = 'templates/employees.html'
-                else:
-                    self.send_error(403)
-                    return
-            elif path == '/payroll':
-                if user['role'] == 'admin':
-                    template_path = 'templates/payroll.html'
-                else:
-                    template_path = 'templates/employee_payroll.html'
-            elif path == '/attendance':
-                template_path = 'templates/attendance.html'
-            elif path == '/admin/registrations':
-                if user['role'] == 'admin':
-                    template_path = 'templates/admin_registrations.html'
-                else:
-                    self.send_error(403)
-                    return
-            else:
-                self.send_error(404)
+    def send_json_response(self, data, status=200, headers=None):
+        pretty = wants_pretty(parse_qs(urlparse(self.path).query))
+        if contains_stream(data):
+            if self.request_version == 'HTTP/1.1' and not pretty:
+                self.send_json_stream(data, status, headers)
                 return
+            data = materialize(data)
 
-        if os.path.exists(template_path):
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+        headers = [('Access-Control-Allow-Origin', '*')] + list(headers or [])
+        self.send_body(encode_json(data, pretty), status, 'application/json', headers)
 
-            if not is_public:
-                self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
-                self.send_header('Pragma', 'no-cache')
-                self.send_header('Expires', '0')
+    def send_body(self, body, status, content_type, headers=None):
+        """Send a complete response body, compressed when it is large enough"""
+        original_size = len(body)
 
-            self.end_headers()
-
-            with open(template_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404)
-
-    def handle_api_get(self, path):
-        try:
-            parsed_url = urlparse(self.path)
-            query_params = parse_qs(parsed_url.query)
-
-            if path == '/api/employees':
-                employees = self.hr_service.get_all_employees()
-                self.send_json_response(employees)
-            elif path.startswith('/api/employees/'):
-                emp_id = path.split('/')[-1]
-                employee = self.hr_service.get_employee(emp_id)
-                self.send_json_response(employee)
-            elif path == '/api/payroll':
-                user = self.get_current_user()
-                if not user:
-                    self.send_json_response({'success': False, 'message': 'Authentication required'}, 401)
-                    return
-
-                # Admins can see the org-wide payroll summary; employees can only see their own records.
-                if user['role'] == 'admin':
-                    payroll_data = self.payroll_service.get_payroll_summary()
-                else:
-                    if not user.get('employee_id'):
-                        self.send_json_response({'success': False, 'message': 'Employee profile not linked'}, 400)
-                        return
-                    payroll_data = self.payroll_service.get_payroll_for_employee(user['employee_id'])
-
-                self.send_json_response(payroll_data)
-            elif path == '/api/attendance':
-                date = query_params.get('date', [None])[0]
-                attendance_data = self.attendance_service.get_all_attendance(date)
-                self.send_json_response(attendance_data)
-            elif path.startswith('/api/attendance/employee/'):
-                emp_id = path.split('/')[-1]
-                start_date = query_params.get('start_date', [None])[0]
-                end_date = query_params.get('end_date', [None])[0]
-                attendance_data = self.attendance_service.get_attendance_by_employee(emp_id, start_date, end_date)
-                self.send_json_response(attendance_data)
-            elif path.startswith('/api/attendance/status/'):
-                emp_id = path.split('/')[-1]
-                status = self.attendance_service.get_today_status(emp_id)
-                self.send_json_response(status)
-            elif path == '/api/auth/logout':
-                session_id = self.get_session_id()
-                self.auth_service.logout(session_id)
-                self.send_response(302)
-                self.send_header('Set-Cookie', 'session_id=; Path=/; HttpOnly; Max-Age=0')
-                self.send_header('Location', '/login?logout=true')
-                self.end_headers()
-                return
-            elif path == '/api/auth/me':
-                user = self.get_current_user()
-                if user:
-                    self.send_json_response({
-                        'success': True,
-                        'user': {
-                            'username': user['username'],
-                            'role': user['role'],
-                            'employee_id': user['employee_id'],
-                            'email': user['email'],
-                            'first_name': user.get('first_name'),
-                            'last_name': user.get('last_name')
-                        }
-                    })
-                else:
-                    self.send_json_response({'success': False, 'message': 'Not authenticated'}, 401)
-            elif path == '/api/admin/pending-registrations':
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-                pending = self.auth_service.get_pending_registrations()
-                self.send_json_response({'success': True, 'registrations': pending})
-            else:
-                self.send_error(404)
-        except Exception as e:
-            self.send_json_response({'error': str(e)}, 500)
+        coding = None
+        if original_size >= MIN_COMPRESS_SIZE:
+            coding = negotiate(self.headers.get('Accept-Encoding'))
+            if coding:
+                body = compress(body, coding)
 
-    def handle_api_post(self, path):
-        try:
-            content_length = self.headers.get('Content-Length')
-            if content_length:
-                post_data = self.rfile.read(int(content_length))
-                data = json.loads(post_data.decode('utf-8'))
-            else:
-                data = {}
-
-            if path == '/api/employees':
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-
-                result = self.hr_service.add_employee(data)
-                self.send_json_response(result)
-            elif path == '/api/payroll/process':
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-                result = self.payroll_service.process_payroll(data)
-                self.send_json_response(result)
-            elif path.startswith('/api/payroll/approve/'):
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-                payroll_id = path.split('/')[-1]
-                result = self.payroll_service.approve_payroll(payroll_id, approved_by_user_id=user.get('id'))
-                self.send_json_response(result)
-            elif path == '/api/attendance/checkin':
-                result = self.attendance_service.check_in(data['employee_id'])
-                self.send_json_response(result)
-            elif path == '/api/attendance/checkout':
-                result = self.attendance_service.check_out(data['employee_id'])
-                self.send_json_response(result)
-            elif path == '/api/attendance/leave':
-                result = self.attendance_service.mark_leave(data)
-                self.send_json_response(result)
-            elif path == '/api/auth/register':
-                result = self.auth_service.register_user(data)
-                self.send_json_response(result)
-            elif path == '/api/auth/login':
-                result = self.auth_service.login(data.get('username'), data.get('password'))
-                if result['success']:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Set-Cookie', f"session_id={result['session_id']}; Path=/; HttpOnly; Max-Age=86400")
-                    self.end_headers()
-                    response = json.dumps(result, indent=2)
-                    self.wfile.write(response.encode('utf-8'))
-                else:
-                    self.send_json_response(result, 401)
-                return
-            elif path == '/api/auth/logout':
-                session_id = self.get_session_id()
-                result = self.auth_service.logout(session_id)
-                if result['success']:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Set-Cookie', 'session_id=; Path=/; HttpOnly; Max-Age=0')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(result, indent=2).encode('utf-8'))
-                else:
-                    self.send_json_response(result, 400)
-                return
-            elif path == '/api/admin/approve-registration':
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-                result = self.auth_service.approve_registration(
-                    data['registration_id'],
-                    user['id'],
-                    data.get('notes', '')
-                )
-                self.send_json_response(result)
-            elif path == '/api/admin/reject-registration':
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-                result = self.auth_service.reject_registration(
-                    data['registration_id'],
-                    user['id'],
-                    data.get('notes', '')
-                )
-                self.send_json_response(result)
-            else:
-                self.send_error(404)
-        except Exception as e:
-            self.send_json_response({'error': str(e)}, 500)
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if coding:
+            self.send_header('Content-Encoding', coding)
+        if original_size >= MIN_COMPRESS_SIZE:
+            self.send_header('Vary', 'Accept-Encoding')
+        for name, value in headers or []:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
 
-    def handle_api_put(self, path):
-        try:
-            content_length = self.headers.get('Content-Length')
-            if content_length:
-                put_data = self.rfile.read(int(content_length))
-                data = json.loads(put_data.decode('utf-8'))
-            else:
-                data = {}
-
-            if path.startswith('/api/employees/'):
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-
-                emp_id = path.split('/')[-1]
-                result = self.hr_service.update_employee(emp_id, data)
-                self.send_json_response(result)
-            else:
-                self.send_error(404)
-        except Exception as e:
-            self.send_json_response({'error': str(e)}, 500)
+        route = getattr(self, 'route_template', None) or urlparse(self.path).path
+        compression_stats.record(route, original_size, len(body), coding)
 
-    def handle_api_delete(self, path):
-        try:
-            if path.startswith('/api/employees/'):
-                user = self.get_current_user()
-                if not user or user['role'] != 'admin':
-                    self.send_json_response({'success': False, 'message': 'Admin access required'}, 403)
-                    return
-
-                emp_id = path.split('/')[-1]
-                result = self.hr_service.delete_employee(emp_id)
-                self.send_json_response(result)
-            else:
-                self.send_error(404)
-        except Exception as e:
-            self.send_json_response({'error': str(e)}, 500)
+    def send_json_stream(self, data, status=200, headers=None):
+        """Send a response holding row iterators with chunked transfer encoding"""
+        coding = negotiate(self.headers.get('Accept-Encoding'))
+        compressor = StreamCompressor(coding) if coding else None
 
-    def send_json_response(self, data, status=200):
         self.send_response(status)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        if coding:
+            self.send_header('Content-Encoding', coding)
+        self.send_header('Vary', 'Accept-Encoding')
         self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in headers or []:
+            self.send_header(name, value)
         self.end_headers()
 
-        response = json.dumps(data, indent=2)
-        self.wfile.write(response.encode('utf-8'))
+        original_size = 0
+        sent_size = 0
+        try:
+            for chunk in iter_json(data):
+                original_size += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                sent_size += self.write_chunk(chunk)
+            if compressor:
+                sent_size += self.write_chunk(compressor.flush())
+            self.wfile.write(b'0\r\n\r\n')
+        except Exception as e:
+            # The status line is already out; dropping the connection without the
+            # terminating chunk tells the client the body is incomplete.
+            self.log_error('Streaming response failed: %s', e)
+            self.close_connection = True
+            close_streams(data)
+            return
+
+        route = getattr(self, 'route_template', None) or urlparse(self.path).path
+        compression_stats.record(route, original_size, sent_size, coding)
+
+    def write_chunk(self, chunk):
+        """Write one chunk of a chunked response and return its payload size"""
+        if not chunk:
+            return 0
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        return len(chunk)
     
     def self_render_template(self, template_path, context):
         self.send_header("Cache-Control", "no-store, no-cache, must-revalidate")
@@ -395,23 +436,226 @@ class TeamRollHandler(BaseHTTPRequestHandler):
 
 
 
-def run_server(port=8080):
-    """Start the TeamRoll server"""
+class ServerResourcesMixin:
+    """Releases per-process resources when the server closes, in every process mode"""
+
+    def server_close(self, *args, **kwargs):
+        super().server_close(*args, **kwargs)
+        password_hasher.shutdown()
+        close_pools()
+
+
+class TeamRollHTTPServer(ServerResourcesMixin, HTTPServer):
+    pass
+
+
+class TeamRollPooledHTTPServer(ServerResourcesMixin, PooledHTTPServer):
+    pass
+
+
+def build_server(server_address, workers=0, queue_size=128, app=None,
+                 keepalive_timeout=TeamRollHandler.keepalive_timeout,
+                 max_keepalive_requests=TeamRollHandler.max_keepalive_requests,
+                 listen_socket=None):
+    """Create the HTTP server, optionally on an already listening socket"""
+    bind_and_activate = listen_socket is None
+    if workers > 0:
+        httpd = TeamRollPooledHTTPServer(server_address, TeamRollHandler, workers=workers,
+                                         queue_size=queue_size, bind_and_activate=bind_and_activate)
+    else:
+        httpd = TeamRollHTTPServer(server_address, TeamRollHandler, bind_and_activate=bind_and_activate)
+
+    if listen_socket is not None:
+        httpd.socket.close()
+        httpd.socket = listen_socket
+        httpd.server_address = listen_socket.getsockname()
+
+    httpd.app = app or get_container()
+    httpd.keepalive_timeout = keepalive_timeout
+    # Without a pool the only thread would sit on an idle kept-alive
+    # connection while other clients wait, so every response closes
+    httpd.max_keepalive_requests = max_keepalive_requests if workers > 0 else 1
+    # Started in the process that serves, i.e. in each worker after a
+    # fork; only one process at a time actually runs the jobs
+    maintenance.start()
+    return httpd
+
+
+def run_server(port=8080, workers=0, queue_size=128, app=None,
+               keepalive_timeout=TeamRollHandler.keepalive_timeout,
+               max_keepalive_requests=TeamRollHandler.max_keepalive_requests,
+               processes=0, reuse_port=False, health_path=DEFAULT_HEALTH_PATH):
+    """Start the TeamRoll server
+
+    With workers=0 requests are handled one at a time on the main thread.
+    Otherwise a pool of `workers` threads serves requests concurrently and at
+    most `queue_size` connections wait for a free worker.
+
+    Connections are kept alive for `keepalive_timeout` idle seconds and at
+    most `max_keepalive_requests` requests. A kept-alive connection holds its
+    worker thread, so keep the timeout short when the pool is small. With
+    workers=0 there is no thread to spare and every connection is closed
+    after one response.
+
+    With processes > 0 a master forks that many worker processes sharing the
+    listening socket (or each binding it with SO_REUSEPORT when `reuse_port`
+    is set), restarts them if they die, and writes their aggregated health to
+    `health_path`. Each process runs its own pool of at least one thread.
+    """
+    if app is None:
+        app = get_container()
+    # Warm up before forking so every worker starts with the loaded assets
+    app.warm_up()
+
     server_address = ('', port)
-    httpd = HTTPServer(server_address, TeamRollHandler)
+    server_options = {
+        'workers': workers,
+        'queue_size': queue_size,
+        'app': app,
+        'keepalive_timeout': keepalive_timeout,
+        'max_keepalive_requests': max_keepalive_requests
+    }
+
+    if processes > 0:
+        server_options['workers'] = max(workers, 1)
+        master = PreforkMaster(
+            lambda listen_socket: build_server(server_address, listen_socket=listen_socket, **server_options),
+            server_address,
+            processes,
+            reuse_port=reuse_port,
+            health_path=health_path
+        )
+
+        print(f"TeamRoll server running on http://localhost:{port}")
+        print(f"Serving with {processes} processes x {server_options['workers']} worker threads "
+              f"(queue size {queue_size})")
+        print("Press Ctrl+C to stop the server")
+        master.serve_forever()
+        print("\nServer stopped.")
+        return
+
+    httpd = build_server(server_address, **server_options)
 
     print(f"TeamRoll server running on http://localhost:{port}")
+    if workers > 0:
+        print(f"Serving with {workers} worker threads (queue size {queue_size})")
     print("Press Ctrl+C to stop the server")
 
+    # SIGTERM stops the server as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nServer stopped.")
+    finally:
         httpd.server_close()
 
 
+def rate_limit_arg(text):
+    try:
+        return parse_rate_limit(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='TeamRoll server')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='number of worker threads; 0 serves requests one at a time (default: 0)')
+    parser.add_argument('--queue-size', type=int, default=128,
+                        help='maximum connections waiting for a worker before 503 is returned (default: 128)')
+    parser.add_argument('--keepalive-timeout', type=float, default=TeamRollHandler.keepalive_timeout,
+                        help='idle seconds before a keep-alive connection is closed (default: %(default)s)')
+    parser.add_argument('--max-keepalive-requests', type=int, default=TeamRollHandler.max_keepalive_requests,
+                        help='requests served on one connection before it is closed (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='worker processes forked by a supervising master; 0 runs a single process (default: 0)')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='let each worker process bind the port with SO_REUSEPORT instead of inheriting one socket')
+    parser.add_argument('--health-file', default=DEFAULT_HEALTH_PATH,
+                        help='where the master writes aggregated worker health (default: %(default)s)')
+    parser.add_argument('--db-pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help='SQLite connections shared by threads without their own (default: %(default)s)')
+    parser.add_argument('--report-pool-size', type=int, default=DEFAULT_REPORT_POOL_SIZE,
+                        help='read-only SQLite connections for reports (default: %(default)s)')
+    parser.add_argument('--report-timeout', type=float, default=DEFAULT_REPORT_TIMEOUT,
+                        help='seconds a report query may run before it is stopped (default: %(default)s)')
+    parser.add_argument('--write-queue', action='store_true',
+                        help='apply single-statement writes on one writer thread that group-commits them')
+    parser.add_argument('--write-batch-size', type=int, default=DEFAULT_WRITE_BATCH_SIZE,
+                        help='most writes committed together by the writer thread (default: %(default)s)')
+    parser.add_argument('--session-tokens', action='store_true',
+                        help='log users in with signed session tokens that are checked without a database lookup')
+    parser.add_argument('--session-key-file', default=DEFAULT_KEY_FILE,
+                        help='signing keys for session tokens, shared by all processes (default: %(default)s)')
+    parser.add_argument('--backup-dir', default=DEFAULT_BACKUP_DIR,
+                        help='where database snapshots are written (default: %(default)s)')
+    parser.add_argument('--backup-keep-last', type=int, default=DEFAULT_KEEP_LAST,
+                        help='newest snapshots always kept (default: %(default)s)')
+    parser.add_argument('--backup-keep-daily', type=int, default=DEFAULT_KEEP_DAILY,
+                        help='days for which the newest snapshot of the day is kept (default: %(default)s)')
+    parser.add_argument('--backup-keep-weekly', type=int, default=DEFAULT_KEEP_WEEKLY,
+                        help='weeks for which the newest snapshot of the week is kept (default: %(default)s)')
+    parser.add_argument('--backup-interval', type=float, default=0,
+                        help='hours between scheduled snapshots (0, the default, takes none)')
+    parser.add_argument('--no-maintenance', action='store_true',
+                        help='do not run the background session cleanup, WAL checkpoint, ANALYZE and vacuum jobs')
+    parser.add_argument('--password-workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help='processes that compute password hashes (0 hashes on the request thread; default: %(default)s)')
+    parser.add_argument('--max-concurrent-hashes', type=int, default=DEFAULT_MAX_CONCURRENT_HASHES,
+                        help='password hashes in progress per process before logins get 503 (default: %(default)s)')
+    parser.add_argument('--scrypt-n', type=int, default=DEFAULT_SCRYPT_N,
+                        help='scrypt CPU/memory cost for new password hashes, a power of two (default: %(default)s)')
+    parser.add_argument('--scrypt-r', type=int, default=DEFAULT_SCRYPT_R,
+                        help='scrypt block size for new password hashes (default: %(default)s)')
+    parser.add_argument('--scrypt-p', type=int, default=DEFAULT_SCRYPT_P,
+                        help='scrypt parallelism for new password hashes (default: %(default)s)')
+    parser.add_argument('--rate-limit', action='append', type=rate_limit_arg, metavar='ROUTE.SCOPE=BURST/SECONDS',
+                        help='override a login or register limit per ip or username, e.g. login.ip=20/60; '
+                             '0 turns it off (repeatable)')
+    parser.add_argument('--rate-limit-buckets', type=int, default=DEFAULT_MAX_BUCKETS,
+                        help='rate limit buckets kept per process (default: %(default)s)')
+    parser.add_argument('--session-cache-size', type=int, default=DEFAULT_SESSION_CACHE_SIZE,
+                        help='sessions remembered per process so requests skip the session lookup (0 disables; default: %(default)s)')
+    parser.add_argument('--session-cache-ttl', type=float, default=DEFAULT_SESSION_CACHE_TTL,
+                        help='seconds a cached session is trusted before it is looked up again (default: %(default)s)')
+    parser.add_argument('--slow-query-ms', type=float, default=DEFAULT_SLOW_QUERY_MS,
+                        help='log statements slower than this with their query plan; negative disables (default: %(default)s)')
+    parser.add_argument('--slow-query-log', default=DEFAULT_SLOW_QUERY_LOG,
+                        help='rotating log file for slow statements (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
     from modules.database import init_database
+    args = parse_args()
+    query_log.configure(args.slow_query_ms, args.slow_query_log)
+    configure_pool(args.db_pool_size)
+    configure_report_pool(args.report_pool_size, args.report_timeout)
+    password_hasher.configure(args.scrypt_n, args.scrypt_r, args.scrypt_p,
+                              args.password_workers, args.max_concurrent_hashes)
+    rate_limiter.configure(args.rate_limit, args.rate_limit_buckets)
+    session_cache.configure(args.session_cache_size, args.session_cache_ttl)
+    session_tokens.configure(args.session_key_file, enabled=args.session_tokens)
+    if args.session_tokens:
+        # Create or load the keys before --processes forks the workers
+        session_tokens.key_ids(create=True)
+    backups.configure(args.backup_dir, args.backup_keep_last, args.backup_keep_daily, args.backup_keep_weekly)
+    maintenance.configure(enabled=not args.no_maintenance)
+    if args.backup_interval > 0:
+        schedule_backups(args.backup_interval * 3600)
+    if args.write_queue:
+        configure_write_queue(max_batch=args.write_batch_size)
     init_database()
 
-    run_server()
+    run_server(
+        args.port,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        keepalive_timeout=args.keepalive_timeout,
+        max_keepalive_requests=args.max_keepalive_requests,
+        processes=args.processes,
+        reuse_port=args.reuse_port,
+        health_path=args.health_file
+    )
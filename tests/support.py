@@ -0,0 +1,99 @@
+"""
+Test Support
+Temporary database and running-server helpers shared by the test modules
+"""
+
+import contextlib
+import http.client
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from modules import database
+from modules.maintenance import maintenance
+from modules.passwords import password_hasher
+from modules.query_log import query_log
+from modules.rate_limit import rate_limiter
+from modules.session_cache import session_cache
+
+
+def quietly(function, *args, **kwargs):
+    """Call `function` without its progress prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def _reset_connections():
+    database.close_thread_connection()
+    database.close_pools()
+
+
+class TempDatabaseTestCase(unittest.TestCase):
+    """Runs a test class against a fresh, migrated teamroll.db in a temporary directory"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.temp_dir = tempfile.mkdtemp(prefix='teamroll-test-')
+        cls.db_path = os.path.join(cls.temp_dir, 'teamroll.db')
+        # Tests that log every statement must not write into the working directory
+        cls.slow_query_log = os.path.join(cls.temp_dir, 'slow-queries.log')
+        query_log.configure(log_path=cls.slow_query_log)
+        cls._saved_db_path = database.DATABASE_PATH
+        _reset_connections()
+        database.DATABASE_PATH = cls.db_path
+        # No background jobs or hashing processes while tests run
+        maintenance.configure(enabled=False)
+        password_hasher.configure(workers=0)
+        session_cache.clear()
+        rate_limiter.configure()
+        quietly(database.init_database)
+
+    @classmethod
+    def tearDownClass(cls):
+        _reset_connections()
+        session_cache.clear()
+        database.DATABASE_PATH = cls._saved_db_path
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+        super().tearDownClass()
+
+
+class RunningServer:
+    """A server from server.build_server on an ephemeral port, served on a thread"""
+
+    def __init__(self, **options):
+        from server import build_server
+        self.httpd = build_server(('127.0.0.1', 0), **options)
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, headers, body bytes) of one request on a new connection"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            payload = json.dumps(body).encode('utf-8') if body is not None else None
+            conn.request(method, path, body=payload, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            conn.close()
+
+    def login(self, username=database.DEFAULT_ADMIN_USERNAME, password=database.DEFAULT_ADMIN_PASSWORD):
+        """Cookie header value for a fresh session"""
+        status, headers, body = self.request('POST', '/api/auth/login', {'username': username, 'password': password})
+        if status != 200:
+            raise AssertionError(f'login failed with {status}: {body!r}')
+        return f"session_id={json.loads(body)['session_id']}"
@@ -0,0 +1,200 @@
+"""
+ASGI Parity Tests
+The legacy server and the FastAPI app answer alike, and the FastAPI lifespan runs the same background jobs
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from modules.app_container import get_container
+from modules.backup import backups
+from modules.maintenance import maintenance
+from tests.support import RunningServer, TempDatabaseTestCase, quietly
+
+try:
+    from fastapi.testclient import TestClient
+except ImportError:
+    TestClient = None
+
+# Headers whose values must match; Date, Server and framing headers differ by design
+COMPARED_HEADERS = (
+    'content-type', 'content-encoding', 'cache-control', 'etag', 'last-modified',
+    'location', 'vary', 'access-control-allow-origin', 'retry-after'
+)
+
+ADMIN_CASES = [
+    ('GET', '/api/auth/me', None, {}),
+    ('GET', '/api/employees', None, {}),
+    ('GET', '/api/employees?limit=1&fields=employee_id,first_name', None, {}),
+    ('GET', '/api/employees', None, {'Accept-Encoding': 'gzip'}),
+    ('GET', '/api/employees/EMP-PARITY', None, {}),
+    ('GET', '/api/payroll', None, {}),
+    ('GET', '/api/attendance', None, {}),
+    ('GET', '/api/admin/pending-registrations', None, {}),
+    ('POST', '/api/payroll/process', {'employee_id': 'missing'}, {}),
+    ('GET', '/dashboard', None, {}),
+]
+
+ANONYMOUS_CASES = [
+    ('GET', '/api/auth/me', None, {}),
+    ('GET', '/api/employees', None, {}),
+    ('GET', '/api/payroll', None, {}),
+    ('GET', '/api/admin/pending-registrations', None, {}),
+    ('GET', '/api/does-not-exist', None, {}),
+    ('POST', '/api/auth/login', {'username': 'admin', 'password': 'wrong'}, {}),
+    ('GET', '/login', None, {}),
+    ('GET', '/dashboard', None, {}),
+    ('GET', '/no-such-page', None, {}),
+    ('GET', '/static/styles.css', None, {}),
+    ('GET', '/static/app.js', None, {'Accept-Encoding': 'gzip'}),
+    ('GET', '/static/missing.css', None, {}),
+]
+
+
+@unittest.skipIf(TestClient is None, 'fastapi is not installed')
+class AsgiParityTest(TempDatabaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        container = get_container()
+        quietly(container.warm_up)
+        quietly(container.hr_service.add_employee, {
+            'first_name': 'Parity', 'last_name': 'Check', 'email': 'parity@example.com',
+            'position': 'Engineer', 'department': 'QA', 'hire_date': '2024-01-15', 'base_salary': 52000
+        })
+        from asgi import app
+        # Without the context manager the lifespan does not run; the
+        # database and assets are already set up above
+        cls.client = TestClient(app, follow_redirects=False)
+
+    def legacy(self, server, method, path, body, headers):
+        status, response_headers, raw = server.request(method, path, body, headers)
+        response_headers = {name.lower(): value for name, value in response_headers.items()}
+        if response_headers.get('content-encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+        return status, response_headers, raw
+
+    def asgi(self, method, path, body, headers):
+        response = self.client.request(method, path, json=body, headers=headers)
+        # httpx has already undone any Content-Encoding
+        return response.status_code, {name.lower(): value for name, value in response.headers.items()}, response.content
+
+    def assertSameResponse(self, legacy, asgi, label):
+        legacy_status, legacy_headers, legacy_body = legacy
+        asgi_status, asgi_headers, asgi_body = asgi
+        self.assertEqual(legacy_status, asgi_status, label)
+        for name in COMPARED_HEADERS:
+            self.assertEqual(legacy_headers.get(name), asgi_headers.get(name), f'{label}: {name}')
+        if 'json' in (legacy_headers.get('content-type') or ''):
+            self.assertEqual(json.loads(legacy_body), json.loads(asgi_body), label)
+        else:
+            self.assertEqual(legacy_body, asgi_body, label)
+
+    def run_cases(self, server, cases, cookie=None):
+        for method, path, body, headers in cases:
+            # Both clients would otherwise send their own default Accept-Encoding
+            headers = {'Accept-Encoding': 'identity', **headers}
+            if cookie:
+                headers['Cookie'] = cookie
+            with self.subTest(method=method, path=path, headers=headers):
+                self.assertSameResponse(
+                    self.legacy(server, method, path, body, headers),
+                    self.asgi(method, path, body, headers),
+                    f'{method} {path}'
+                )
+
+    def test_anonymous_requests(self):
+        with RunningServer(workers=2) as server:
+            self.run_cases(server, ANONYMOUS_CASES)
+
+    def test_admin_requests(self):
+        with RunningServer(workers=2) as server:
+            cookie = server.login()
+            status, _, body = server.request('GET', '/api/employees', headers={'Cookie': cookie})
+            employee_id = json.loads(body)['employees'][0]['employee_id']
+            cases = [
+                (method, path.replace('EMP-PARITY', employee_id), body, headers)
+                for method, path, body, headers in ADMIN_CASES
+            ]
+            self.run_cases(server, cases, cookie)
+
+    def test_conditional_asset_request(self):
+        with RunningServer(workers=2) as server:
+            _, headers, _ = server.request('GET', '/static/styles.css')
+            conditional = {'If-None-Match': headers['ETag'], 'Accept-Encoding': 'identity'}
+            self.assertSameResponse(
+                self.legacy(server, 'GET', '/static/styles.css', None, conditional),
+                self.asgi('GET', '/static/styles.css', None, conditional),
+                'conditional GET /static/styles.css'
+            )
+
+    def test_login_sets_same_cookie(self):
+        with RunningServer(workers=2) as server:
+            credentials = {'username': 'admin', 'password': 'admin123'}
+            headers = {'Accept-Encoding': 'identity'}
+            legacy = self.legacy(server, 'POST', '/api/auth/login', credentials, headers)
+            asgi = self.asgi('POST', '/api/auth/login', credentials, headers)
+        self.assertEqual(legacy[0], asgi[0])
+        legacy_body, asgi_body = json.loads(legacy[2]), json.loads(asgi[2])
+        # Each login opens its own session
+        self.assertNotEqual(legacy_body.pop('session_id'), asgi_body.pop('session_id'))
+        self.assertEqual(legacy_body, asgi_body)
+        legacy_cookie, asgi_cookie = legacy[1]['set-cookie'], asgi[1]['set-cookie']
+        self.assertEqual(legacy_cookie.split(';', 1)[1], asgi_cookie.split(';', 1)[1])
+
+
+@unittest.skipIf(TestClient is None, 'fastapi is not installed')
+class AsgiLifespanTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        # The lifespan would otherwise send slow statements to a log in the working directory
+        patcher = mock.patch('asgi.DEFAULT_SLOW_QUERY_LOG', self.slow_query_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        maintenance.stop()
+        maintenance.configure(enabled=False)
+
+    def maintenance_threads(self):
+        return [thread for thread in threading.enumerate() if thread.name == 'maintenance']
+
+    def test_lifespan_runs_maintenance(self):
+        from asgi import app
+        with TestClient(app) as client:
+            self.assertEqual(client.get('/api/auth/me').status_code, 401)
+            self.assertTrue(maintenance.enabled)
+            self.assertEqual(len(self.maintenance_threads()), 1)
+            deadline = time.monotonic() + 2
+            while not maintenance.is_leader and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(maintenance.is_leader)
+        # Shutdown stops the scheduler and gives up the leader lock
+        self.assertEqual(self.maintenance_threads(), [])
+        self.assertFalse(maintenance.is_leader)
+
+    def test_settings_from_environment(self):
+        from asgi import BACKUP_DIR_ENV, BACKUP_INTERVAL_ENV, MAINTENANCE_ENV, app
+        backup_dir = os.path.join(self.temp_dir, 'backups')
+        saved_dir = backups.directory
+        environment = {MAINTENANCE_ENV: '0', BACKUP_DIR_ENV: backup_dir, BACKUP_INTERVAL_ENV: '24'}
+        try:
+            with mock.patch.dict(os.environ, environment), TestClient(app):
+                self.assertFalse(maintenance.enabled)
+                self.assertEqual(self.maintenance_threads(), [])
+                self.assertEqual(backups.directory, backup_dir)
+                backup_job = {job.name: job for job in maintenance.jobs()}['backup']
+                self.assertEqual(backup_job.interval, 24 * 3600)
+        finally:
+            maintenance.add('backup', None, 0)
+            backups.configure(saved_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
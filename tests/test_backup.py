@@ -0,0 +1,148 @@
+"""
+Backup Tests
+Snapshots into a temporary --backup-dir, the retention schedule, and restoring a snapshot
+"""
+
+import os
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from modules import database
+from modules.app_container import get_container
+from modules.backup import BackupManager, retained, snapshot_time
+from modules.session_cache import SessionCache
+from modules.session_tokens import SessionTokens, session_tokens
+from server import parse_args
+from tests.support import TempDatabaseTestCase, quietly
+
+CHECK_INTERVAL = 0.05
+
+
+class RetentionScheduleTest(unittest.TestCase):
+
+    def test_keeps_last_daily_and_weekly(self):
+        newest = datetime(2024, 3, 29, 18, 0, tzinfo=timezone.utc)
+        # Four snapshots a day for three weeks
+        times = [newest - timedelta(hours=6 * step) for step in range(84)]
+        keep = retained(times, keep_last=2, keep_daily=3, keep_weekly=3)
+        self.assertIn(times[0], keep)
+        self.assertIn(times[1], keep)
+        # The newest snapshot of each of the two days before
+        self.assertIn(times[4], keep)
+        self.assertIn(times[8], keep)
+        # Three ISO weeks are covered, by their newest snapshot
+        self.assertEqual(len({moment.isocalendar()[:2] for moment in keep}), 3)
+        self.assertEqual(len(keep), 6)
+
+
+class BackupManagerTest(TempDatabaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.app = get_container()
+        cls.backup_dir = os.path.join(cls.temp_dir, 'backups')
+        cls.saved_tokens = (session_tokens.key_file, session_tokens.enabled)
+        session_tokens.configure(os.path.join(cls.temp_dir, 'session_keys.json'), enabled=True,
+                                 refresh_interval=CHECK_INTERVAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        key_file, enabled = cls.saved_tokens
+        session_tokens.configure(key_file, enabled=enabled)
+        super().tearDownClass()
+
+    def setUp(self):
+        args = parse_args(['--backup-dir', self.backup_dir, '--backup-keep-last', '2',
+                           '--backup-keep-daily', '0', '--backup-keep-weekly', '0'])
+        self.backups = BackupManager(step_sleep=0)
+        self.backups.configure(args.backup_dir, args.backup_keep_last, args.backup_keep_daily, args.backup_keep_weekly)
+
+    def tearDown(self):
+        for name in os.listdir(self.backup_dir) if os.path.isdir(self.backup_dir) else []:
+            os.remove(os.path.join(self.backup_dir, name))
+
+    def snapshot(self):
+        # Snapshot names are unique to the millisecond
+        time.sleep(0.002)
+        return quietly(self.backups.create_snapshot)
+
+    def add_employee(self, first_name):
+        return quietly(self.app.hr_service.add_employee, {
+            'first_name': first_name, 'last_name': 'Backup', 'email': f'{first_name.lower()}@example.com',
+            'position': 'Engineer', 'hire_date': '2024-01-15', 'base_salary': 50000
+        })['employee_id']
+
+    def employee_exists(self, employee_id):
+        return bool(database.execute_query('SELECT 1 FROM employees WHERE employee_id = ?', (employee_id,)))
+
+    def test_snapshot_and_retention(self):
+        first = self.snapshot()
+        self.assertTrue(os.path.exists(os.path.join(self.backup_dir, first['name'])))
+        self.assertIsNotNone(snapshot_time(first['name']))
+        self.assertEqual(first['pruned'], [])
+
+        self.snapshot()
+        third = self.snapshot()
+        # keep-last 2 with no daily or weekly snapshots drops the oldest
+        self.assertEqual(third['pruned'], [first['name']])
+        names = [snapshot['name'] for snapshot in self.backups.list_snapshots()]
+        self.assertEqual(len(names), 2)
+        self.assertEqual(names[0], third['name'])
+
+        with self.backups.open_snapshot(third['name']) as conn:
+            self.assertEqual(conn.execute('PRAGMA quick_check').fetchone()[0], 'ok')
+
+    def test_restore_reverts_data(self):
+        kept = self.add_employee('Kept')
+        snapshot = self.snapshot()['name']
+        dropped = self.add_employee('Dropped')
+
+        result = quietly(self.backups.restore_snapshot, snapshot)
+        self.assertEqual(result['restored'], snapshot)
+        self.assertTrue(self.employee_exists(kept))
+        self.assertFalse(self.employee_exists(dropped))
+
+        # The state before the restore was snapshotted and can be restored
+        quietly(self.backups.restore_snapshot, result['previous_state'], snapshot_current=False)
+        self.assertTrue(self.employee_exists(dropped))
+
+    def test_restore_keeps_revocations(self):
+        # Another process that has already read the revocation list
+        elsewhere = SessionTokens(session_tokens.key_file, enabled=True, refresh_interval=CHECK_INTERVAL)
+        before_snapshot, before_claims = session_tokens.issue(1, 'admin', None)
+        session_tokens.revoke(before_claims)
+        self.assertIsNone(elsewhere.verify(before_snapshot))
+
+        snapshot = self.snapshot()['name']
+        # Revoked after the snapshot was taken; the restore must not undo it
+        logged_out, claims = session_tokens.issue(1, 'admin', None)
+        session_tokens.revoke(claims)
+
+        quietly(self.backups.restore_snapshot, snapshot, snapshot_current=False)
+        time.sleep(CHECK_INTERVAL * 2)
+        self.assertIsNone(session_tokens.verify(logged_out))
+        self.assertIsNone(elsewhere.verify(logged_out))
+
+        # A revocation after the restore reaches the other process too
+        token, claims = session_tokens.issue(1, 'admin', None)
+        self.assertIsNotNone(elsewhere.verify(token))
+        session_tokens.revoke(claims)
+        time.sleep(CHECK_INTERVAL * 2)
+        self.assertIsNone(elsewhere.verify(token))
+
+    def test_restore_clears_other_session_caches(self):
+        elsewhere = SessionCache(ttl=30, check_interval=CHECK_INTERVAL)
+        snapshot = self.snapshot()['name']
+        elsewhere.get('s1')
+        elsewhere.put('s1', {'user_id': 1, 'employee_id': None}, elsewhere.generation())
+        self.assertTrue(elsewhere.get('s1')[0])
+
+        quietly(self.backups.restore_snapshot, snapshot, snapshot_current=False)
+        time.sleep(CHECK_INTERVAL * 2)
+        self.assertEqual(elsewhere.get('s1'), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
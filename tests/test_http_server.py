@@ -0,0 +1,83 @@
+"""
+Pooled HTTP Server Tests
+Parallel requests against TeamRollHandler on the worker pool, and the 503 answer when the queue is full
+"""
+
+import json
+import socket
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from server import TeamRollHandler
+from tests.support import RunningServer, TempDatabaseTestCase
+
+
+class RecordingHandler(TeamRollHandler):
+    """Notes which worker thread served each API request and holds it briefly"""
+
+    delay = 0.05
+    threads = set()
+    lock = threading.Lock()
+
+    def handle_api(self, method, path):
+        with self.lock:
+            self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        super().handle_api(method, path)
+
+
+class PooledServerTest(TempDatabaseTestCase):
+
+    def test_parallel_requests(self):
+        workers = 4
+        requests = 40
+        with RunningServer(workers=workers, queue_size=64) as server:
+            cookie = server.login()
+            server.httpd.RequestHandlerClass = RecordingHandler
+            RecordingHandler.threads.clear()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(16) as executor:
+                results = list(executor.map(
+                    lambda _: server.request('GET', '/api/employees', headers={'Cookie': cookie}),
+                    range(requests)
+                ))
+            elapsed = time.perf_counter() - started
+
+        for status, _, body in results:
+            self.assertEqual(status, 200)
+            self.assertIsInstance(json.loads(body), (list, dict))
+        self.assertEqual(len(RecordingHandler.threads), workers)
+        # Serially the held requests alone would take requests * delay
+        self.assertLess(elapsed, requests * RecordingHandler.delay / 2)
+        self.assertEqual(server.httpd.rejected_requests, 0)
+
+    def test_full_queue_gets_503(self):
+        with RunningServer(workers=1, queue_size=1, keepalive_timeout=2) as server:
+            # An idle kept-alive connection occupies the only worker
+            busy = socket.create_connection(('127.0.0.1', server.port))
+            busy.sendall(b'GET /api/auth/me HTTP/1.1\r\nHost: test\r\n\r\n')
+            self.assertIn(b'401', busy.recv(4096))
+
+            # The next connection waits in the queue, filling it
+            queued = socket.create_connection(('127.0.0.1', server.port))
+            deadline = time.monotonic() + 2
+            while server.httpd.queued_requests() < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(server.httpd.queued_requests(), 1)
+
+            rejected = socket.create_connection(('127.0.0.1', server.port))
+            rejected.settimeout(2)
+            response = rejected.recv(4096)
+            self.assertTrue(response.startswith(b'HTTP/1.0 503'))
+            self.assertIn(b'Retry-After: 1', response)
+            self.assertEqual(server.httpd.rejected_requests, 1)
+
+            for sock in (busy, queued, rejected):
+                sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
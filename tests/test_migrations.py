@@ -0,0 +1,129 @@
+"""
+Migration Tests
+Schema version bookkeeping, and index use by the hot queries on a migrated database
+"""
+
+import datetime
+import unittest
+
+from modules import database
+from modules.app_container import get_container
+from modules.migrations import LATEST_VERSION, current_version, migrate
+from modules.query_log import is_full_scan, query_log
+from modules.session_tokens import session_tokens
+from tests.support import TempDatabaseTestCase, quietly
+
+
+class MigrationTest(TempDatabaseTestCase):
+
+    def test_database_is_at_latest_version(self):
+        conn = database.get_db_connection()
+        try:
+            self.assertEqual(current_version(conn), LATEST_VERSION)
+            # Nothing is pending, so running again applies nothing
+            self.assertEqual(migrate(conn), [])
+        finally:
+            conn.close()
+
+
+class HotQueryPlanTest(TempDatabaseTestCase):
+    """Runs each hot service call with every statement explained.
+
+    A slow threshold of 0 makes query_log record the EXPLAIN QUERY PLAN of
+    every statement, so the plans checked are those of the SQL the
+    services actually send.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        app = get_container()
+        cls.app = app
+        cls.employee_id = quietly(app.hr_service.add_employee, {
+            'first_name': 'Plan', 'last_name': 'Check', 'email': 'plan@example.com',
+            'position': 'Engineer', 'hire_date': '2024-01-15', 'base_salary': 52000
+        })['employee_id']
+        quietly(app.payroll_service.process_payroll, {
+            'employee_id': cls.employee_id, 'pay_period_start': '2024-02-01',
+            'pay_period_end': '2024-02-29', 'base_salary': 4000
+        })
+        quietly(app.attendance_service.check_in, cls.employee_id)
+
+    def setUp(self):
+        self._saved_threshold = query_log.threshold_ms
+        query_log.threshold_ms = 0
+
+    def tearDown(self):
+        query_log.threshold_ms = self._saved_threshold
+
+    def plans_of(self, call):
+        """{normalized statement: plan} for every statement `call` runs"""
+        query_log.reset()
+        quietly(call)
+        return {stats['sql']: stats['plan'] for stats in query_log.top(100)}
+
+    def assertUsesIndexes(self, call, *indexes):
+        plans = self.plans_of(call)
+        self.assertTrue(plans, 'no statements were run')
+        for sql, plan in plans.items():
+            self.assertFalse(is_full_scan(plan), f'full scan in {sql}: {plan}')
+        steps = ' | '.join(step for plan in plans.values() for step in plan)
+        for index in indexes:
+            self.assertIn(f'INDEX {index} ', steps)
+
+    def test_active_employee_list(self):
+        self.assertUsesIndexes(self.app.hr_service.get_all_employees, 'idx_employees_status_name')
+
+    def test_check_out_and_today_status(self):
+        employee_id = self.employee_id
+        self.assertUsesIndexes(lambda: self.app.attendance_service.get_today_status(employee_id),
+                               'idx_attendance_employee_date')
+        self.assertUsesIndexes(lambda: self.app.attendance_service.check_out(employee_id),
+                               'idx_attendance_employee_date')
+
+    def test_attendance_for_employee_range(self):
+        today = datetime.date.today().isoformat()
+        self.assertUsesIndexes(
+            lambda: self.app.attendance_service.get_attendance_by_employee(self.employee_id, '2024-01-01', today),
+            'idx_attendance_employee_date'
+        )
+
+    def test_daily_attendance_and_absentees(self):
+        today = datetime.date.today().isoformat()
+        self.assertUsesIndexes(lambda: self.app.attendance_service.get_all_attendance(today),
+                               'idx_attendance_date', 'idx_employees_status_name')
+
+    def test_payroll_for_employee(self):
+        self.assertUsesIndexes(lambda: self.app.payroll_service.get_payroll_for_employee(self.employee_id),
+                               'idx_payroll_employee_created')
+
+    def test_payroll_summary_window(self):
+        self.assertUsesIndexes(self.app.payroll_service.get_payroll_summary, 'idx_payroll_created')
+
+    def test_login_lookup(self):
+        self.assertUsesIndexes(lambda: self.app.auth_service.login('admin', 'admin123'),
+                               'sqlite_autoindex_users_1')
+
+    def test_pending_registrations(self):
+        self.assertUsesIndexes(self.app.auth_service.get_pending_registrations,
+                               'idx_pending_registrations_status')
+
+    def test_expired_session_and_revocation_cleanup(self):
+        self.assertUsesIndexes(self.app.auth_service.cleanup_expired_sessions,
+                               'idx_sessions_expires', 'idx_token_revocations_expires')
+        self.assertUsesIndexes(session_tokens.cleanup, 'idx_token_revocations_expires')
+
+    def test_employee_delete_cascade(self):
+        employee_id = quietly(self.app.hr_service.add_employee, {
+            'first_name': 'Gone', 'last_name': 'Soon', 'email': 'gone@example.com',
+            'position': 'Temp', 'hire_date': '2024-03-01', 'base_salary': 1000
+        })['employee_id']
+        self.assertUsesIndexes(
+            lambda: self.app.hr_service.delete_employee(employee_id),
+            'idx_payroll_employee_created', 'idx_attendance_employee_date', 'idx_users_employee',
+            'idx_pending_registrations_employee'
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Pagination Tests
+Paged employee lists return the same rows, with the same fields, as the unpaged lists
+"""
+
+import unittest
+
+from modules.app_container import get_container
+from modules.hr_service import ALL_EMPLOYEES_LIST, EMPLOYEE_LIST
+from tests.support import TempDatabaseTestCase, quietly
+
+
+class EmployeePaginationTest(TempDatabaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.hr = get_container().hr_service
+        employee_ids = quietly(cls.hr.bulk_add_employees, [
+            {
+                'first_name': f'Page{index}', 'last_name': f'Test{index % 3}', 'email': f'page{index}@example.com',
+                'position': 'Engineer', 'hire_date': '2024-01-15', 'base_salary': 50000
+            }
+            for index in range(12)
+        ])['employee_ids']
+        for employee_id in employee_ids[::4]:
+            quietly(cls.hr.deactivate_employee, employee_id)
+
+    def all_pages(self, list_query, include_inactive, limit, fields=None):
+        rows, cursor = [], None
+        while True:
+            page = list_query.parse_page(str(limit), cursor, fields)
+            result = self.hr.get_all_employees(include_inactive=include_inactive, page=page)
+            self.assertTrue(result['success'], result.get('message'))
+            rows.extend(result['employees'])
+            cursor = result['next']
+            if cursor is None:
+                return rows
+
+    def test_pages_match_unpaged_list(self):
+        for include_inactive, list_query in ((False, EMPLOYEE_LIST), (True, ALL_EMPLOYEES_LIST)):
+            with self.subTest(include_inactive=include_inactive):
+                unpaged = self.hr.get_all_employees(include_inactive=include_inactive)['employees']
+                paged = self.all_pages(list_query, include_inactive, limit=5)
+                self.assertEqual([set(row) for row in paged], [set(row) for row in unpaged])
+                self.assertEqual(paged, unpaged)
+                # The sort-only key is never returned
+                self.assertNotIn('inactive', paged[0])
+
+    def test_selected_fields(self):
+        for include_inactive, list_query in ((False, EMPLOYEE_LIST), (True, ALL_EMPLOYEES_LIST)):
+            with self.subTest(include_inactive=include_inactive):
+                fields = 'employee_id,status'
+                unpaged = self.hr.get_all_employees(
+                    include_inactive=include_inactive, page=list_query.parse_page(fields=fields)
+                )['employees']
+                paged = self.all_pages(list_query, include_inactive, limit=5, fields=fields)
+                self.assertEqual(paged, unpaged)
+                self.assertEqual(set(paged[0]), {'employee_id', 'status'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Session Cache Tests
+Expiry, invalidation, and invalidations reaching the caches of other processes
+"""
+
+import time
+import unittest
+
+from modules.app_container import get_container
+from modules.session_cache import SessionCache
+from tests.support import TempDatabaseTestCase, quietly
+
+CHECK_INTERVAL = 0.05
+
+
+class SessionCacheTest(TempDatabaseTestCase):
+
+    def setUp(self):
+        # Two caches on one database stand in for two server processes
+        self.here = SessionCache(ttl=30, check_interval=CHECK_INTERVAL)
+        self.elsewhere = SessionCache(ttl=30, check_interval=CHECK_INTERVAL)
+
+    def cache_user(self, cache, session_id, user):
+        cache.get(session_id)
+        cache.put(session_id, user, cache.generation())
+
+    def test_hit_until_invalidated(self):
+        user = {'user_id': 1, 'employee_id': 'EMP1'}
+        self.cache_user(self.here, 's1', user)
+        self.assertEqual(self.here.get('s1'), (True, user))
+        self.here.invalidate('s1')
+        self.assertEqual(self.here.get('s1'), (False, None))
+
+    def test_put_after_invalidation_is_dropped(self):
+        self.here.get('s1')
+        generation = self.here.generation()
+        self.here.invalidate_user(1)
+        self.here.put('s1', {'user_id': 1, 'employee_id': None}, generation)
+        self.assertEqual(self.here.get('s1'), (False, None))
+
+    def test_invalidation_reaches_other_processes(self):
+        user = {'user_id': 7, 'employee_id': 'EMP7'}
+        self.cache_user(self.elsewhere, 's7', user)
+        self.assertEqual(self.elsewhere.get('s7'), (True, user))
+
+        self.here.invalidate('s7')
+        # Still served until the other cache next reads the counter
+        time.sleep(CHECK_INTERVAL * 2)
+        self.assertEqual(self.elsewhere.get('s7'), (False, None))
+        self.assertEqual(self.elsewhere.stats()['shared_clears'], 1)
+
+    def test_employee_change_reaches_other_processes(self):
+        self.cache_user(self.elsewhere, 's8', {'user_id': 8, 'employee_id': 'EMP8'})
+        self.here.invalidate_employee('EMP8')
+        time.sleep(CHECK_INTERVAL * 2)
+        self.assertEqual(self.elsewhere.get('s8'), (False, None))
+
+    def test_logout_in_one_process_ends_session_in_another(self):
+        auth = get_container().auth_service
+        session_id = quietly(auth.login, 'admin', 'admin123')['session_id']
+        self.cache_user(self.elsewhere, session_id, auth.verify_session(session_id))
+        self.assertTrue(self.elsewhere.get(session_id)[0])
+
+        quietly(auth.logout, session_id)
+        time.sleep(CHECK_INTERVAL * 2)
+        self.assertEqual(self.elsewhere.get(session_id), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Write Queue Tests
+A burst of concurrent check-ins through the single writer, and which statements bypass it
+"""
+
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import database
+from modules.app_container import get_container
+from tests.support import TempDatabaseTestCase, quietly
+
+BURST_SIZE = 500
+
+
+class WriteQueueBurstTest(TempDatabaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        app = get_container()
+        cls.attendance = app.attendance_service
+        result = quietly(app.hr_service.bulk_add_employees, [
+            {
+                'first_name': f'Burst{index}', 'last_name': 'Test', 'email': f'burst{index}@example.com',
+                'position': 'Engineer', 'hire_date': '2024-01-15', 'base_salary': 50000
+            }
+            for index in range(BURST_SIZE)
+        ])
+        cls.employee_ids = result['employee_ids']
+        database.configure_write_queue(True)
+
+    @classmethod
+    def tearDownClass(cls):
+        database.configure_write_queue(False)
+        super().tearDownClass()
+
+    def writer_stats(self):
+        return database.pool_stats()['writer']
+
+    def test_concurrent_check_ins(self):
+        before = self.writer_stats()
+        start = threading.Barrier(BURST_SIZE)
+
+        def check_in(employee_id):
+            start.wait()
+            result = self.attendance.check_in(employee_id)
+            # A read right after the write, as the dashboard does
+            status = self.attendance.get_today_status(employee_id)
+            return result, status
+
+        with ThreadPoolExecutor(BURST_SIZE) as executor:
+            results = list(executor.map(check_in, self.employee_ids))
+
+        messages = [result['message'] for result, _ in results if not result['success']]
+        self.assertFalse([m for m in messages if 'locked' in m.lower() or 'busy' in m.lower()])
+        self.assertEqual(messages, [])
+        for _, status in results:
+            self.assertTrue(status['success'])
+
+        rows = database.execute_query("SELECT COUNT(*) AS count FROM attendance WHERE status = 'present'")
+        self.assertEqual(rows[0]['count'], BURST_SIZE)
+
+        after = self.writer_stats()
+        statements = after['statements'] - before['statements']
+        batches = after['batches'] - before['batches']
+        self.assertEqual(statements, BURST_SIZE)
+        self.assertEqual(after['failed'], before['failed'])
+        # Group commit: far fewer commits than statements
+        self.assertLess(batches, statements)
+
+    def test_reads_are_not_queued(self):
+        before = self.writer_stats()['statements']
+        cte = database.execute_query('WITH ids AS (SELECT employee_id FROM employees) SELECT COUNT(*) AS n FROM ids')
+        replaced = database.execute_query(
+            "WITH x AS (SELECT replace(first_name, 'Burst', 'B') AS n FROM employees) SELECT COUNT(*) AS n FROM x"
+        )
+        self.assertEqual(replaced, [{'n': BURST_SIZE}])
+        pragma = database.execute_query('PRAGMA table_info(employees)')
+        plan = database.execute_query('EXPLAIN QUERY PLAN SELECT * FROM employees WHERE employee_id = ?',
+                                      (self.employee_ids[0],))
+        self.assertEqual(cte[0]['n'], BURST_SIZE)
+        self.assertIn('employee_id', [column['name'] for column in pragma])
+        self.assertTrue(plan)
+        self.assertEqual(self.writer_stats()['statements'], before)
+
+    def test_writing_cte_is_queued(self):
+        before = self.writer_stats()['statements']
+        # sqlite3 reports no rowcount for a WITH statement, so check the row
+        database.execute_query(
+            "WITH target AS (SELECT employee_id FROM employees WHERE employee_id = ?) "
+            "UPDATE employees SET phone = '555' WHERE employee_id IN target",
+            (self.employee_ids[0],)
+        )
+        self.assertEqual(self.writer_stats()['statements'], before + 1)
+        rows = database.execute_query('SELECT phone FROM employees WHERE employee_id = ?', (self.employee_ids[0],))
+        self.assertEqual(rows[0]['phone'], '555')
+
+
+class ReadQueryClassificationTest(unittest.TestCase):
+
+    def test_reads(self):
+        for query in (
+            'SELECT 1', '  select 1', 'VALUES (1)', 'EXPLAIN QUERY PLAN SELECT 1',
+            'WITH x AS (SELECT 1) SELECT * FROM x', "WITH x AS (SELECT 'delete') SELECT updated_at FROM x",
+            'PRAGMA table_info(users)', '-- note\nSELECT 1', '/* note */ SELECT 1',
+            "WITH x AS (SELECT replace(name,'a','b') n FROM users) SELECT * FROM x",
+            'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 3) SELECT i FROM n',
+            'WITH "update"(v) AS (VALUES (1)), b AS MATERIALIZED (SELECT v FROM "update") SELECT * FROM b',
+            "WITH x AS (SELECT 1 /* ) DELETE */) SELECT * FROM x",
+            'WITH x AS (SELECT 1) VALUES (2)'
+        ):
+            with self.subTest(query=query):
+                self.assertTrue(database.is_read_query(query))
+
+    def test_writes(self):
+        for query in (
+            'INSERT INTO t VALUES (1)', 'UPDATE t SET a = 1', 'DELETE FROM t', 'REPLACE INTO t VALUES (1)',
+            'WITH x AS (SELECT 1) DELETE FROM t WHERE id IN x', 'PRAGMA journal_mode = WAL',
+            '/* note */ INSERT INTO t VALUES (1)', 'CREATE TABLE t (a)',
+            'WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x',
+            'WITH x AS (SELECT 1) REPLACE INTO t SELECT * FROM x',
+            "WITH x AS (SELECT replace(name, 'a', 'b') AS n FROM users) UPDATE t SET a = (SELECT n FROM x)",
+            'WITH x(a) AS (SELECT 1) INSERT OR REPLACE INTO t SELECT a FROM x'
+        ):
+            with self.subTest(query=query):
+                self.assertFalse(database.is_read_query(query))
+
+
+if __name__ == '__main__':
+    unittest.main()